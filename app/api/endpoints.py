@@ -1,23 +1,42 @@
 from fastapi import APIRouter, HTTPException, Query, BackgroundTasks
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 from loguru import logger
+import json
 
 from app.state import app_state, get_component
+from app.utils.executors import PoolSaturatedError, run_blocking as _run_blocking
 
 router = APIRouter()
 
+# 阻塞工作的类型（各自独立的有界线程池；LLM调用走RAGEngine的异步连接池）
+WORK_EDINET = "edinet"
+WORK_VECTOR = "vector"
+
+
+async def run_blocking(kind: str, func, *args, **kwargs):
+    """将同步调用放到对应类型的线程池执行，避免阻塞事件循环"""
+    try:
+        return await _run_blocking(kind, func, *args, **kwargs)
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 # 请求/响应模型
 class QueryRequest(BaseModel):
     question: str
     company_filter: Optional[str] = None
+    section_filter: Optional[str] = None  # 章节过滤（如 事業等のリスク）
 
 class QueryResponse(BaseModel):
     answer: str
     sources: List[dict]
     context_preview: str
     processing_time: float
+    cached: bool = False  # 回答是否来自语义回答缓存
+    saved_time: Optional[float] = None  # 命中缓存时节省的生成时间（秒）
+    timings: Dict[str, float] = {}  # 各阶段耗时（retrieval / rerank / generation，秒）
 
 class DocumentProcessRequest(BaseModel):
     doc_ids: List[str]
@@ -29,6 +48,8 @@ class DocumentProcessResponse(BaseModel):
     processed: int
     failed: int
     results: List[dict]
+    job_id: Optional[str] = None  # 入库任务ID，通过 /jobs/{job_id} 查询进度
+    queued: int = 0
 
 class SystemStatus(BaseModel):
     status: str
@@ -47,9 +68,10 @@ async def query_documents(request: QueryRequest):
         import time
         start_time = time.time()
         
-        result = rag_engine.query(
+        result = await rag_engine.aquery(
             question=request.question,
-            company_filter=request.company_filter
+            company_filter=request.company_filter,
+            section_filter=request.section_filter
         )
         
         processing_time = time.time() - start_time
@@ -58,12 +80,61 @@ async def query_documents(request: QueryRequest):
             answer=result["answer"],
             sources=result["sources"],
             context_preview=result["context"],
-            processing_time=processing_time
+            processing_time=processing_time,
+            cached=result.get("cached", False),
+            saved_time=result.get("saved_time"),
+            timings=result.get("timings") or {}
         )
         
+    except HTTPException:
+        raise
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _format_sse(event: str, data: Dict) -> str:
+    """格式化为 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.post("/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """
+    流式查询（Server-Sent Events）
+
+    事件顺序: sources（检索结果）→ token（回答片段，多次）→ done；出错时发送 error
+    """
+    rag_engine = app_state.get("rag_engine")
+    if not rag_engine:
+        raise HTTPException(status_code=503, detail="RAG引擎未初始化")
+
+    events = rag_engine.aquery_stream(
+        question=request.question,
+        company_filter=request.company_filter,
+        section_filter=request.section_filter
+    )
+    # 检索在第一个事件之前完成；线程池饱和时在开始响应前返回503
+    try:
+        first = await events.__anext__()
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except StopAsyncIteration:
+        first = None
+
+    async def event_stream():
+        if first is None:
+            return
+        yield _format_sse(first["event"], first["data"])
+        async for event in events:
+            yield _format_sse(event["event"], event["data"])
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/documents/process", response_model=DocumentProcessResponse)
 async def process_documents(
     request: DocumentProcessRequest,
@@ -86,7 +157,23 @@ async def process_documents(
             )
             doc_ids = [r["doc_id"] for r in results if r.get("success")]
         
-        # 在后台处理文档
+        # 写入持久化任务队列，由入库工作线程处理
+        job_queue = app_state.get("job_queue")
+        if job_queue is not None:
+            job_id = await run_blocking(WORK_VECTOR, job_queue.create_job, doc_ids)
+            ingest_workers = app_state.get("ingest_workers")
+            if ingest_workers:
+                ingest_workers.notify()
+            return DocumentProcessResponse(
+                success=True,
+                processed=0,
+                failed=0,
+                results=[],
+                job_id=job_id,
+                queued=len(set(doc_ids))
+            )
+        
+        # 未启用任务队列时在后台处理文档
         def process_in_background():
             results = document_processor.process_batch(doc_ids)
 
@@ -104,9 +191,30 @@ async def process_documents(
             results=[]
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/jobs")
+async def list_jobs(limit: int = Query(20, ge=1, le=200)):
+    """最近的入库任务"""
+    job_queue = app_state.get("job_queue")
+    if not job_queue:
+        raise HTTPException(status_code=503, detail="入库任务队列未启用")
+    return {"jobs": await run_blocking(WORK_VECTOR, job_queue.list_jobs, limit)}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, include_items: bool = True):
+    """入库任务进度（各状态文档数与逐文档状态）"""
+    job_queue = app_state.get("job_queue")
+    if not job_queue:
+        raise HTTPException(status_code=503, detail="入库任务队列未启用")
+    job = await run_blocking(WORK_VECTOR, job_queue.get_job, job_id, include_items)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务 {job_id} 不存在")
+    return job
+
 @router.get("/documents/{doc_id}/delete")
 async def delete_document(doc_id: str):
     """删除文档"""
@@ -115,13 +223,15 @@ async def delete_document(doc_id: str):
         if not vector_store:
             raise HTTPException(status_code=503, detail="向量存储未初始化")
         
-        success = vector_store.delete_document(doc_id)
+        success = await run_blocking(WORK_VECTOR, vector_store.delete_document, doc_id)
         
         if success:
             return {"success": True, "message": f"文档 {doc_id} 已删除"}
         else:
             raise HTTPException(status_code=500, detail="删除失败")
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -132,8 +242,23 @@ async def get_system_status():
         vector_store = app_state.get("vector_store")
         document_processor = app_state.get("document_processor")
         
-        vector_stats = vector_store.get_collection_stats() if vector_store else {}
+        vector_stats = await run_blocking(WORK_VECTOR, vector_store.get_collection_stats) if vector_store else {}
         processing_stats = document_processor.get_processing_stats() if document_processor else {}
+        work_pools = app_state.get("work_pools")
+        if work_pools:
+            processing_stats["work_pools"] = work_pools.get_stats()
+        rag_engine = app_state.get("rag_engine")
+        if rag_engine:
+            processing_stats.update(rag_engine.get_stats())
+        job_queue = app_state.get("job_queue")
+        if job_queue:
+            processing_stats["ingest_queue"] = await run_blocking(WORK_VECTOR, job_queue.get_stats)
+        edinet_sync = app_state.get("edinet_sync")
+        if edinet_sync:
+            processing_stats["edinet_sync"] = edinet_sync.get_stats()
+        company_directory = app_state.get("company_directory")
+        if company_directory:
+            vector_stats["company_directory"] = await run_blocking(WORK_VECTOR, company_directory.get_stats)
         
         return SystemStatus(
             status="running",
@@ -142,9 +267,60 @@ async def get_system_status():
             timestamp=datetime.now()
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _build_document_view(edinet_client, doc_id: str) -> Dict:
+    """下载XBRL并生成预览（同步，在EDINET线程池中执行）"""
+    from pathlib import Path
+    import re
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = edinet_client.download_document(
+            doc_id=doc_id,
+            save_dir=Path(temp_dir),
+            file_type="1"  # XBRL
+        )
+
+        # 本地API的PDF下载链接
+        pdf_url = f"/api/v1/documents/{doc_id}/pdf"
+
+        if not file_path:
+            return {
+                "doc_id": doc_id,
+                "status": "pdf_only",
+                "pdf_url": pdf_url,
+                "message": "XBRLファイルが見つかりません。PDFで確認してください。"
+            }
+
+        # 读取XBRL内容
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+
+            # 简单解析提取文本内容
+            text_content = re.sub(r'<[^>]+>', ' ', content)
+            text_content = re.sub(r'\s+', ' ', text_content).strip()
+
+            return {
+                "doc_id": doc_id,
+                "status": "success",
+                "content_preview": text_content[:5000],
+                "content_length": len(text_content),
+                "pdf_url": pdf_url
+            }
+        except Exception as e:
+            return {
+                "doc_id": doc_id,
+                "status": "parse_error",
+                "error": str(e),
+                "pdf_url": pdf_url
+            }
+
+
 @router.get("/documents/{doc_id}/view")
 async def view_document(doc_id: str):
     """查看文档详情（从EDINET下载并解析）"""
@@ -154,53 +330,10 @@ async def view_document(doc_id: str):
         if not edinet_client:
             raise HTTPException(status_code=503, detail="EDINET客户端未初始化")
 
-        # 下载文档
-        from pathlib import Path
-        import tempfile
-
-        with tempfile.TemporaryDirectory() as temp_dir:
-            file_path = edinet_client.download_document(
-                doc_id=doc_id,
-                save_dir=Path(temp_dir),
-                file_type="1"  # XBRL
-            )
-
-            # 本地API的PDF下载链接
-            pdf_url = f"/api/v1/documents/{doc_id}/pdf"
-
-            if not file_path:
-                return {
-                    "doc_id": doc_id,
-                    "status": "pdf_only",
-                    "pdf_url": pdf_url,
-                    "message": "XBRLファイルが見つかりません。PDFで確認してください。"
-                }
-
-            # 读取XBRL内容
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-
-                # 简单解析提取文本内容
-                import re
-                text_content = re.sub(r'<[^>]+>', ' ', content)
-                text_content = re.sub(r'\s+', ' ', text_content).strip()
-
-                return {
-                    "doc_id": doc_id,
-                    "status": "success",
-                    "content_preview": text_content[:5000],
-                    "content_length": len(text_content),
-                    "pdf_url": pdf_url
-                }
-            except Exception as e:
-                return {
-                    "doc_id": doc_id,
-                    "status": "parse_error",
-                    "error": str(e),
-                    "pdf_url": pdf_url
-                }
+        return await run_blocking(WORK_EDINET, _build_document_view, edinet_client, doc_id)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -208,7 +341,7 @@ async def view_document(doc_id: str):
 @router.get("/documents/{doc_id}/pdf")
 async def download_pdf(doc_id: str):
     """代理下载PDF文件"""
-    from fastapi.responses import StreamingResponse
+    from fastapi.responses import FileResponse
     import requests as req
 
     try:
@@ -216,21 +349,35 @@ async def download_pdf(doc_id: str):
         if not edinet_client:
             raise HTTPException(status_code=503, detail="EDINET客户端未初始化")
 
+        # 优先从原始文档存储返回，避免重复下载
+        stored = await run_blocking(WORK_EDINET, edinet_client.fetch_raw_document, doc_id, file_type="2")
+        if stored is not None:
+            pdf_path, content_type = stored
+            if content_type == "application/pdf":
+                return FileResponse(
+                    pdf_path,
+                    media_type="application/pdf",
+                    headers={"Content-Disposition": f"attachment; filename={doc_id}.pdf"}
+                )
+
         url = f"{edinet_client.api_url}/v2/documents/{doc_id}"
         # API Key 在 URL 参数中传递
         params = {"type": "2"}
         if edinet_client.api_key:
             params["Subscription-Key"] = edinet_client.api_key
 
-        response = req.get(url, params=params, stream=True, timeout=120)
+        response = await run_blocking(WORK_EDINET, req.get, url, params=params, stream=True, timeout=120)
         response.raise_for_status()
 
+        # 同步迭代器由StreamingResponse在线程池中逐块读取
         return StreamingResponse(
             response.iter_content(chunk_size=8192),
             media_type="application/pdf",
             headers={"Content-Disposition": f"attachment; filename={doc_id}.pdf"}
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -249,20 +396,62 @@ async def search_edinet(
         if not edinet_client:
             raise HTTPException(status_code=503, detail="EDINET客户端未初始化")
 
-        documents = edinet_client.search_documents(
+        search_result = await run_blocking(
+            WORK_EDINET,
+            edinet_client.search_documents_detailed,
             date_from=date_from,
             date_to=date_to,
             doc_type=doc_type,
             company_name=company_name
         )
+        documents = search_result["documents"]
 
         return {
             "count": len(documents),
             "date_from": date_from,
             "date_to": date_to,
             "company_filter": company_name,
+            "failed_dates": search_result["failed_dates"],
             "documents": documents[:limit]
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/facts/aggregate")
+async def aggregate_facts(
+    element: str = Query(..., description="XBRL元素名 (例: NetSales)"),
+    by: str = Query("company", description="分组字段: company / period_end"),
+    agg: str = Query("sum", description="聚合方式: sum / mean / min / max / count"),
+    companies: Optional[str] = Query(None, description="EDINETコード（カンマ区切り）"),
+    period_from: Optional[str] = Query(None, description="期末日の開始 (YYYY-MM-DD)"),
+    period_to: Optional[str] = Query(None, description="期末日の終了 (YYYY-MM-DD)")
+):
+    """按公司或期间聚合财务事实（不经过LLM与向量存储）"""
+    try:
+        fact_store = app_state.get("fact_store")
+        if not fact_store:
+            raise HTTPException(status_code=503, detail="财务事实存储未初始化")
+
+        try:
+            result = await run_blocking(
+                WORK_VECTOR,
+                fact_store.aggregate,
+                element,
+                by=by,
+                agg=agg,
+                companies=companies.split(",") if companies else None,
+                period_from=period_from,
+                period_to=period_to
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        return {"element": element, "by": by, "agg": agg, "count": len(result), "results": result}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -11,22 +11,68 @@ class Settings(BaseSettings):
     # EDINET配置
     edinet_api_key: Optional[str] = None
     edinet_api_url: str = "https://disclosure.edinet-fsa.go.jp/api"
+    edinet_max_workers: int = 8
+    edinet_rate_limit: float = 5.0  # 每秒最大请求数（按主机）
+    edinet_cache_enabled: bool = True
+    edinet_cache_ttl: int = 3600  # 今天、昨天的书类一览缓存有效期（秒）
     
     # ChromaDB配置
     chroma_host: str = "localhost"
     chroma_port: int = 8001
     chroma_auth_token: Optional[str] = None
     chroma_collection_name: str = "edinet_reports"
+
+    # 向量存储后端: chroma（HTTP服务）/ local（进程内索引，持久化到 vector_index_dir）
+    vector_backend: str = "chroma"
+    vector_index_dir: str = "data/vector_index"
+    vector_index_dtype: str = "float16"
+
+    # 混合检索：BM25关键词索引与向量检索按RRF融合
+    keyword_index_enabled: bool = True
+    keyword_index_dir: str = "data/keyword_index"
+    hybrid_rrf_k: int = 60
+    hybrid_candidates: int = 4  # 每路候选数为 top_k 的倍数
     
+    # 重排序（Cross-Encoder，CPU推理）：先取 rerank_candidates 个候选，重排后保留 top_k
+    rerank_enabled: bool = False
+    rerank_model: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+    rerank_candidates: int = 20
+    rerank_batch_size: int = 16
+    rerank_cache_size: int = 10000
+
+    # 公司目录（EDINETコード/证券代码/名称别名 -> EDINETコード）
+    company_directory_enabled: bool = True
+    company_code_list_path: Optional[str] = None  # EDINETコードリスト（EdinetcodeDlInfo.csv），启动时导入
+
     # Ollama配置
     ollama_host: str = "localhost"
     ollama_port: int = 11434
     ollama_model: str = "qwen2.5:3b"
+    ollama_connect_timeout: float = 10.0
+    ollama_read_timeout: float = 120.0
+    ollama_keep_alive: str = "30m"  # 模型在两次查询之间保持加载的时间
+
+    # 语义回答缓存配置
+    answer_cache_enabled: bool = True
+    answer_cache_size: int = 512
+    answer_cache_ttl: int = 3600
+    answer_cache_similarity: float = 0.95  # 查询嵌入余弦相似度阈值
     
     # 嵌入模型配置 - 添加备用模型
     embedding_model: str = "intfloat/multilingual-e5-large-instruct"
     embedding_fallback_model: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
     embedding_device: str = "cpu"
+    embedding_batch_size: int = 32
+    # 嵌入运行时: torch（fp32）/ onnx-int8（动态量化，切换前与fp32模型做精度检查）
+    embedding_runtime: str = "torch"
+    onnx_model_dir: str = "models/onnx"
+    onnx_min_recall: float = 0.9  # 样本集上 recall@k 下限
+    onnx_min_cosine: float = 0.97  # 与fp32嵌入逐条余弦相似度下限
+    embedding_service_enabled: bool = True  # 跨请求合批嵌入
+    embedding_service_max_batch: int = 64
+    embedding_service_max_wait_ms: float = 5.0
+    query_embedding_cache_size: int = 1024
+    embedding_disk_cache_enabled: bool = True  # 文档嵌入磁盘缓存（data_dir/embedding_cache）
 
     # 模型下载重试配置
     model_download_max_retries: int = 3
@@ -36,12 +82,41 @@ class Settings(BaseSettings):
     chunk_size: int = 500
     chunk_overlap: int = 50
     max_chunks_per_document: int = 100
+
+    # 批量入库流水线配置
+    ingest_download_workers: int = 4
+    ingest_parse_workers: int = os.cpu_count() or 1
+    ingest_member_workers: int = 4  # 单个文档内解析ZIP成员的线程数（与解压重叠的I/O并行；CPU并行靠 ingest_parse_workers）
+    ingest_embed_batch_size: int = 256  # 跨文档合批嵌入的块数
+    ingest_max_in_flight: int = 32  # 流水线中同时在途的文档数上限
+    # 持久化入库任务队列（data_dir/ingest_jobs.sqlite3），重启后继续处理未完成的文档
+    ingest_queue_enabled: bool = True
+    ingest_queue_workers: int = 2
+    ingest_queue_batch_size: int = 8  # 每个工作线程一次认领的文档数
+    ingest_queue_max_attempts: int = 3
+    # EDINET持续同步（高水位保存在 data_dir/edinet_sync_state.json），需要API Key
+    edinet_sync_enabled: bool = False
+    edinet_sync_interval: float = 600.0  # 轮询间隔（秒），每次只请求当天的书类一览
+    edinet_sync_doc_types: str = "120"  # 逗号分隔的文档类型代码
+    edinet_sync_initial_days: int = 1  # 首次运行时回溯的天数
+    edinet_sync_max_catchup_days: int = 30  # 长时间停止后最多补拉的天数
+
+    # API并发配置（LLM为到Ollama的最大连接数，其余为各类阻塞工作的最大并发线程数）
+    llm_concurrency: int = 4
+    edinet_concurrency: int = 8
+    vector_concurrency: int = 8
+    blocking_queue_limit: int = 100  # 每类工作超出并发数后允许排队的请求数，超出返回503
+    health_check_timeout: float = 2.0
     
     # 路径配置
     data_dir: str = "data"
     raw_data_dir: str = "data/raw"
     processed_data_dir: str = "data/processed"
     models_dir: str = "models"
+
+    # 原始文档存储配置
+    raw_store_enabled: bool = True
+    raw_store_max_mb: int = 20480
     
     class Config:
         env_file = ".env"
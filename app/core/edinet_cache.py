@@ -0,0 +1,86 @@
+"""
+EDINET书类一览缓存模块
+将每日提出書類一覧持久化到本地SQLite，已结束的过去日期永久复用，近两天按TTL刷新
+"""
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+JST = timezone(timedelta(hours=9))
+
+
+class DailyListCache:
+    """按日期缓存EDINET每日书类一览（zlib压缩的JSON存于SQLite）"""
+
+    def __init__(self, db_path: str, ttl_seconds: int = 3600, closed_after_days: int = 2):
+        """
+        Args:
+            db_path: SQLite文件路径
+            ttl_seconds: 未结束日期（今天、昨天）的缓存有效期
+            closed_after_days: 距今多少天以上的日期视为已结束、不再变化
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.closed_after_days = closed_after_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS daily_lists ("
+            " date TEXT PRIMARY KEY,"
+            " fetched_at REAL NOT NULL,"
+            " payload BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        logger.info(f"初始化EDINET书类一览缓存: {self.db_path}")
+
+    def _is_permanent(self, search_date: str, fetched_at: float) -> bool:
+        """日期已结束且是在结束之后获取的，则该缓存永久有效"""
+        day = datetime.strptime(search_date, "%Y-%m-%d").date()
+        closed_on = day + timedelta(days=self.closed_after_days)
+        # EDINET的日期按日本时间划分，与服务器时区无关
+        return datetime.now(JST).date() >= closed_on and datetime.fromtimestamp(fetched_at, JST).date() >= closed_on
+
+    def get(self, search_date: str) -> Optional[List[Dict]]:
+        """获取某天的缓存，不存在或已过期时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fetched_at, payload FROM daily_lists WHERE date = ?", (search_date,)
+            ).fetchone()
+
+        if row is not None:
+            fetched_at, payload = row
+            if self._is_permanent(search_date, fetched_at) or time.time() - fetched_at < self.ttl_seconds:
+                self.hits += 1
+                return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+        self.misses += 1
+        return None
+
+    def put(self, search_date: str, results: List[Dict]):
+        """写入某天的书类一览"""
+        payload = zlib.compress(json.dumps(results, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO daily_lists (date, fetched_at, payload) VALUES (?, ?, ?)",
+                (search_date, time.time(), payload),
+            )
+            self._conn.commit()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM daily_lists").fetchone()
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,41 +1,135 @@
 import requests
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import BinaryIO, Iterator, List, Dict, Optional, Tuple
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+import shutil
+import tempfile
+import re
+import threading
 import zipfile
-import io
 import time
 from loguru import logger
 
+# 下载时每次读取的块大小，以及临时文件在内存中的最大尺寸（超出后落盘）
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# ZIP成员角色
+MEMBER_INSTANCE = "instance"      # XBRL实例文档（.xbrl）
+MEMBER_IXBRL = "ixbrl"            # 内联XBRL页面（PublicDoc/*.htm）
+MEMBER_SCHEMA = "schema"          # 提出者扩展分类（.xsd）
+MEMBER_LINKBASE = "linkbase"      # 标签/表示/计算/定义链接库
+MEMBER_MANIFEST = "manifest"      # manifest_PublicDoc.xml 等
+MEMBER_AUDIT = "audit"            # 审计报告（AuditDoc）
+MEMBER_ATTACHMENT = "attachment"  # 附件与图片等
+MEMBER_OTHER = "other"
+
+# 入库时需要的成员角色
+INGEST_ROLES = (MEMBER_INSTANCE, MEMBER_IXBRL)
+
+_LINKBASE_RE = re.compile(r'_(lab|lab-en|gla|pre|cal|def|ref)\.xml$')
+_ROLE_ORDER = {MEMBER_INSTANCE: 0, MEMBER_IXBRL: 1}
+
+
+def classify_member(name: str) -> str:
+    """按ZIP内路径判断成员角色"""
+    parts = name.replace("\\", "/").lower().split("/")
+    filename = parts[-1]
+    if not filename:
+        return MEMBER_OTHER
+    if "auditdoc" in parts:
+        return MEMBER_AUDIT
+    if "attachdoc" in parts:
+        return MEMBER_ATTACHMENT
+    if filename.endswith(".xbrl"):
+        return MEMBER_INSTANCE
+    if filename.endswith(".xsd"):
+        return MEMBER_SCHEMA
+    if filename.endswith(".xml"):
+        if filename.startswith("manifest"):
+            return MEMBER_MANIFEST
+        return MEMBER_LINKBASE if _LINKBASE_RE.search(filename) else MEMBER_OTHER
+    if filename.endswith((".htm", ".html", ".xhtml")):
+        return MEMBER_IXBRL
+    return MEMBER_ATTACHMENT
+
+
+def scan_members(zip_ref: zipfile.ZipFile) -> List[Dict]:
+    """
+    扫描一次ZIP目录并给成员分类
+
+    Returns:
+        [{"name", "role", "size", "info"}]，实例在前，内联XBRL页面按文件名（即页面顺序）排列
+    """
+    members = [
+        {"name": info.filename, "role": classify_member(info.filename), "size": info.file_size, "info": info}
+        for info in zip_ref.infolist()
+        if not info.is_dir()
+    ]
+    members.sort(key=lambda m: (_ROLE_ORDER.get(m["role"], len(_ROLE_ORDER)), m["name"]))
+    return members
+
+
+class _RateLimiter:
+    """简单的按主机限速器：保证相邻两次请求之间至少间隔 1/rate 秒"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
 class EdinetClient:
     """EDINET API客户端"""
     
-    def __init__(self, api_key: str = None, api_url: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        api_url: str = None,
+        max_workers: int = 8,
+        rate_limit: float = 5.0,
+        daily_list_cache=None,
+        raw_store=None,
+        company_directory=None
+    ):
         self.api_key = api_key
         self.api_url = api_url or "https://disclosure.edinet-fsa.go.jp/api"
-        
-    def search_documents(
-        self,
-        date_from: Optional[str] = None,
-        date_to: Optional[str] = None,
-        doc_type: str = "120",
-        company_name: Optional[str] = None
-    ) -> List[Dict]:
-        """搜索EDINET文档
+        self.max_workers = max(1, max_workers)
+        self.rate_limit = rate_limit
+        self.daily_list_cache = daily_list_cache
+        self.raw_store = raw_store
+        # 可选的公司目录：获取到的书类一览同时登记提出者与docID
+        self.company_directory = company_directory
+        self._rate_limiters: Dict[str, _RateLimiter] = {}
+        self._rate_limiters_lock = threading.Lock()
 
-        Args:
-            date_from: 开始日期 (YYYY-MM-DD)，可选
-            date_to: 结束日期 (YYYY-MM-DD)，可选，默认今天
-            doc_type: 文档类型代码 (120=有价证券报告书)
-            company_name: 公司名筛选（部分匹配）
-
-        Returns:
-            文档列表
-        """
-        all_documents = []
+    def _get(self, url: str, params: Dict, timeout: float, **kwargs) -> requests.Response:
+        """发送GET请求（按主机限速）"""
+        host = urlparse(url).netloc
+        with self._rate_limiters_lock:
+            limiter = self._rate_limiters.get(host)
+            if limiter is None:
+                limiter = self._rate_limiters[host] = _RateLimiter(self.rate_limit)
+        limiter.wait()
+        return requests.get(url, params=params, timeout=timeout, **kwargs)
 
-        # 设置日期范围
+    @staticmethod
+    def _build_date_range(date_from: Optional[str], date_to: Optional[str], max_days: int = 60) -> List[str]:
+        """生成待搜索的日期列表（限制最大天数，避免搜索过慢）"""
         if date_to:
             end_date = datetime.strptime(date_to, "%Y-%m-%d")
         else:
@@ -47,8 +141,6 @@ class EdinetClient:
             # 默认搜索最近7天
             start_date = end_date - timedelta(days=7)
 
-        # 生成日期列表（限制最大60天，避免搜索过慢）
-        max_days = 60
         dates_to_search = []
         current = start_date
         while current <= end_date:
@@ -59,58 +151,174 @@ class EdinetClient:
                 break
 
         logger.info(f"搜索日期范围: {start_date.strftime('%Y-%m-%d')} ~ {end_date.strftime('%Y-%m-%d')} (实际搜索{len(dates_to_search)}天)")
+        return dates_to_search
 
-        for search_date in dates_to_search:
-            url = f"{self.api_url}/v2/documents.json"
-            params = {
-                "date": search_date,
-                "type": 2  # 提出書類一覧及びメタデータを取得
-            }
+    def _fetch_daily_list(self, search_date: str) -> List[Dict]:
+        """获取某一天的提出書類一覧（原始results）"""
+        url = f"{self.api_url}/v2/documents.json"
+        params = {
+            "date": search_date,
+            "type": 2  # 提出書類一覧及びメタデータを取得
+        }
 
-            if self.api_key:
-                params["Subscription-Key"] = self.api_key
+        if self.api_key:
+            params["Subscription-Key"] = self.api_key
+
+        response = self._get(url, params=params, timeout=30)
+        response.raise_for_status()
+        return response.json().get("results", []) or []
 
+    def fetch_daily_lists(
+        self,
+        dates: List[str],
+        concurrent: bool = True,
+        refresh: bool = False
+    ) -> Tuple[Dict[str, List[Dict]], Dict[str, str]]:
+        """
+        获取多天的提出書類一覧
+
+        Args:
+            dates: 日期列表 (YYYY-MM-DD)
+            concurrent: 是否并发获取（并发数为 max_workers，受按主机限速约束）
+            refresh: 忽略本地缓存重新获取（结果仍写入缓存）
+
+        Returns:
+            (日期 -> 原始results, 日期 -> 失败原因)
+        """
+        daily_results: Dict[str, List[Dict]] = {}
+        failures: Dict[str, str] = {}
+
+        # 优先使用本地缓存，只请求未命中的日期
+        dates_to_fetch = []
+        for search_date in dates:
+            cached = self.daily_list_cache.get(search_date) if self.daily_list_cache and not refresh else None
+            if cached is not None:
+                daily_results[search_date] = cached
+            else:
+                dates_to_fetch.append(search_date)
+
+        def fetch(search_date: str):
             try:
-                response = requests.get(url, params=params, timeout=30)
-                response.raise_for_status()
-                data = response.json()
-
-                for item in data.get("results", []):
-                    # 筛选文档类型
-                    if doc_type and item.get("docTypeCode") != doc_type:
-                        continue
-
-                    # 筛选公司名（部分匹配）
-                    filer_name = item.get("filerName", "")
-                    if company_name and company_name not in filer_name:
-                        continue
-
-                    all_documents.append({
-                        "doc_id": item.get("docID"),
-                        "edinet_code": item.get("edinetCode"),
-                        "company_name": filer_name,
-                        "doc_description": item.get("docDescription"),
-                        "submit_date": item.get("submitDateTime"),
-                        "period_start": item.get("periodStart"),
-                        "period_end": item.get("periodEnd"),
-                        "xbrl_flag": item.get("xbrlFlag") == "1",
-                        "sec_code": item.get("secCode"),
-                    })
+                return search_date, self._fetch_daily_list(search_date), None
+            except Exception as e:
+                return search_date, None, str(e)
+
+        if concurrent and len(dates_to_fetch) > 1 and self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(dates_to_fetch))) as executor:
+                outcomes = list(executor.map(fetch, dates_to_fetch))
+        else:
+            outcomes = [fetch(d) for d in dates_to_fetch]
+
+        for search_date, results, error in outcomes:
+            if error is not None:
+                logger.warning(f"搜索日期 {search_date} 失败: {error}")
+                failures[search_date] = error
+            else:
+                daily_results[search_date] = results
+                if self.daily_list_cache:
+                    self.daily_list_cache.put(search_date, results)
 
+        if self.company_directory is not None:
+            try:
+                self.company_directory.add_filings(item for results in daily_results.values() for item in results)
             except Exception as e:
-                logger.warning(f"搜索日期 {search_date} 失败: {e}")
-                continue
+                logger.warning(f"公司目录更新失败: {e}")
+
+        return daily_results, failures
+
+    @staticmethod
+    def _format_document(item: Dict) -> Dict:
+        return {
+            "doc_id": item.get("docID"),
+            "edinet_code": item.get("edinetCode"),
+            "company_name": item.get("filerName", ""),
+            "doc_description": item.get("docDescription"),
+            "submit_date": item.get("submitDateTime"),
+            "period_start": item.get("periodStart"),
+            "period_end": item.get("periodEnd"),
+            "xbrl_flag": item.get("xbrlFlag") == "1",
+            "sec_code": item.get("secCode"),
+            "doc_type_code": item.get("docTypeCode"),
+            "seq_number": item.get("seqNumber"),
+        }
+
+    def search_documents_detailed(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        doc_type: str = "120",
+        company_name: Optional[str] = None,
+        concurrent: bool = True,
+        refresh: bool = False
+    ) -> Dict:
+        """搜索EDINET文档，并单独返回获取失败的日期
+
+        Returns:
+            {"documents": 按日期排序的文档列表, "failed_dates": {日期: 失败原因}}
+        """
+        dates_to_search = self._build_date_range(date_from, date_to)
+        daily_results, failures = self.fetch_daily_lists(dates_to_search, concurrent=concurrent, refresh=refresh)
+
+        all_documents = []
+        for search_date in dates_to_search:
+            for item in daily_results.get(search_date, []):
+                # 筛选文档类型
+                if doc_type and item.get("docTypeCode") != doc_type:
+                    continue
+
+                # 筛选公司名（部分匹配）
+                filer_name = item.get("filerName", "")
+                if company_name and company_name not in filer_name:
+                    continue
+
+                all_documents.append(self._format_document(item))
 
-        logger.info(f"找到 {len(all_documents)} 份报告书")
-        return all_documents
+        logger.info(f"找到 {len(all_documents)} 份报告书（失败日期 {len(failures)} 天）")
+        return {"documents": all_documents, "failed_dates": failures}
+
+    def search_documents(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        doc_type: str = "120",
+        company_name: Optional[str] = None,
+        concurrent: bool = True,
+        refresh: bool = False
+    ) -> List[Dict]:
+        """搜索EDINET文档
+
+        Args:
+            date_from: 开始日期 (YYYY-MM-DD)，可选
+            date_to: 结束日期 (YYYY-MM-DD)，可选，默认今天
+            doc_type: 文档类型代码 (120=有价证券报告书)
+            company_name: 公司名筛选（部分匹配）
+            concurrent: 是否并发获取每日一览
+            refresh: 忽略本地缓存重新获取每日一览
+
+        Returns:
+            文档列表
+        """
+        return self.search_documents_detailed(
+            date_from=date_from,
+            date_to=date_to,
+            doc_type=doc_type,
+            company_name=company_name,
+            concurrent=concurrent,
+            refresh=refresh
+        )["documents"]
     
-    def download_document(
+    def stream_document(
         self,
         doc_id: str,
-        save_dir: Optional[Path] = None,
+        fileobj: BinaryIO,
         file_type: str = "1"  # 1: XBRL, 2: PDF, 3: 附件, 5: CSV
-    ) -> Optional[Path]:
-        """下载文档文件"""
+    ) -> Optional[str]:
+        """
+        以固定大小分块将文档流式写入文件对象，不在内存中保留完整响应
+
+        Returns:
+            响应的Content-Type，失败时返回None
+        """
         url = f"{self.api_url}/v2/documents/{doc_id}"
         params = {"type": file_type}
 
@@ -120,44 +328,131 @@ class EdinetClient:
 
         logger.info(f"下载文档: {doc_id}, type={file_type}")
 
-        try:
-            response = requests.get(url, params=params, timeout=120)
+        with self._get(url, params=params, timeout=120, stream=True) as response:
             response.raise_for_status()
-            
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if chunk:
+                    fileobj.write(chunk)
+            return response.headers.get("Content-Type")
+
+    def fetch_raw_document(self, doc_id: str, file_type: str = "1") -> Optional[Tuple[Path, str]]:
+        """
+        获取原始文档文件（优先使用原始文档存储，未命中时下载并保存）
+
+        Returns:
+            (文件路径, Content-Type)，未配置原始存储或下载失败时返回None
+        """
+        if self.raw_store is None:
+            return None
+        return self.raw_store.get_or_fetch(
+            doc_id,
+            file_type,
+            lambda fileobj: self.stream_document(doc_id, fileobj, file_type=file_type)
+        )
+
+    @contextmanager
+    def _open_archive(self, doc_id: str, file_type: str = "1") -> Iterator[Optional[zipfile.ZipFile]]:
+        """下载并打开ZIP（先流式写入原始存储或临时文件），非ZIP时产出None"""
+        if self.raw_store is not None:
+            stored = self.fetch_raw_document(doc_id, file_type=file_type)
+            if stored is None or stored[1] != "application/zip":
+                logger.warning(f"文档 {doc_id} 不是ZIP格式")
+                yield None
+                return
+            with zipfile.ZipFile(stored[0], 'r') as zip_ref:
+                yield zip_ref
+            return
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+            content_type = self.stream_document(doc_id, spool, file_type=file_type)
+
             # 处理ZIP文件
-            if response.headers.get("Content-Type") == "application/zip":
-                zip_content = io.BytesIO(response.content)
-                
-                with zipfile.ZipFile(zip_content, 'r') as zip_ref:
-                    # 查找XBRL文件
-                    xbrl_files = [f for f in zip_ref.namelist() 
-                                if f.endswith('.xbrl') or f.endswith('.xml')]
-                    
-                    if not xbrl_files:
-                        logger.warning(f"文档 {doc_id} 中没有找到XBRL文件")
-                        return None
-                    
-                    # 解压第一个XBRL文件
-                    xbrl_file = xbrl_files[0]
-                    xbrl_content = zip_ref.read(xbrl_file)
-                    
-                    if save_dir:
-                        save_path = save_dir / f"{doc_id}.xbrl"
-                        save_path.write_bytes(xbrl_content)
-                        logger.info(f"已保存: {save_path}")
-                        return save_path
-                    else:
-                        # 返回临时文件路径
-                        temp_path = Path(f"/tmp/{doc_id}.xbrl")
-                        temp_path.write_bytes(xbrl_content)
-                        return temp_path
-            else:
+            if content_type != "application/zip":
                 logger.warning(f"文档 {doc_id} 不是ZIP格式")
-                return None
-                
+                yield None
+                return
+
+            spool.seek(0)
+            with zipfile.ZipFile(spool, 'r') as zip_ref:
+                yield zip_ref
+
+    def download_document(
+        self,
+        doc_id: str,
+        save_dir: Optional[Path] = None,
+        file_type: str = "1"  # 1: XBRL, 2: PDF, 3: 附件, 5: CSV
+    ) -> Optional[Path]:
+        """下载文档文件，解压其中的实例文档（没有实例时解压第一个内联XBRL页面）"""
+        try:
+            with self._open_archive(doc_id, file_type) as zip_ref:
+                if zip_ref is None:
+                    return None
+                return self._extract_xbrl(zip_ref, doc_id, save_dir)
+
         except Exception as e:
             logger.error(f"下载文档 {doc_id} 失败: {e}")
             return None
+
+    def iter_document_members(
+        self,
+        doc_id: str,
+        save_dir: Optional[Path] = None,
+        file_type: str = "1",
+        roles: Tuple[str, ...] = INGEST_ROLES
+    ) -> Iterator[Dict]:
+        """
+        下载文档并按角色逐个解压所需成员（ZIP只打开、扫描一次）
+
+        每个成员写入磁盘后立即产出，调用方可在后续成员解压期间开始解析。
+
+        Args:
+            doc_id: 文档ID
+            save_dir: 解压目录（默认系统临时目录）
+            file_type: 文档类型
+            roles: 需要解压的成员角色
+
+        Yields:
+            {"name": ZIP内路径, "role": 角色, "path": 解压后的路径}；下载失败或非ZIP时不产出
+        """
+        target_dir = Path(save_dir or tempfile.gettempdir()) / doc_id
+        try:
+            with self._open_archive(doc_id, file_type) as zip_ref:
+                if zip_ref is None:
+                    return
+                members = [m for m in scan_members(zip_ref) if m["role"] in roles]
+                if not members:
+                    logger.warning(f"文档 {doc_id} 中没有找到所需成员 {roles}")
+                    return
+
+                target_dir.mkdir(parents=True, exist_ok=True)
+                for index, member in enumerate(members):
+                    # 不同目录下可能有同名文件，加序号避免覆盖
+                    path = target_dir / f"{index:03d}_{Path(member['name']).name}"
+                    with zip_ref.open(member["info"]) as src, open(path, "wb") as dst:
+                        shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+                    yield {"name": member["name"], "role": member["role"], "path": path}
+
+        except Exception as e:
+            logger.error(f"下载文档 {doc_id} 失败: {e}")
+
+    def _extract_xbrl(self, zip_ref: zipfile.ZipFile, doc_id: str, save_dir: Optional[Path]) -> Optional[Path]:
+        """从已打开的ZIP中解压实例文档（没有实例时解压第一个内联XBRL页面）"""
+        members = scan_members(zip_ref)
+        chosen = next((m for m in members if m["role"] == MEMBER_INSTANCE), None)
+        if chosen is None:
+            chosen = next((m for m in members if m["role"] == MEMBER_IXBRL), None)
+        if chosen is None:
+            logger.warning(f"文档 {doc_id} 中没有找到XBRL文件")
+            return None
+
+        suffix = ".xbrl" if chosen["role"] == MEMBER_INSTANCE else Path(chosen["name"]).suffix
+        # 未指定目录时返回临时文件路径
+        save_path = Path(save_dir or tempfile.gettempdir()) / f"{doc_id}{suffix}"
+
+        with zip_ref.open(chosen["info"]) as src, open(save_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+        logger.info(f"已保存: {save_path}")
+        return save_path
     
     def get_company_info(self, edinet_code: str) -> Optional[Dict]:
         """获取公司信息"""
@@ -168,7 +463,7 @@ class EdinetClient:
             params["Subscription-Key"] = self.api_key
             
         try:
-            response = requests.get(url, params=params, timeout=30)
+            response = self._get(url, params=params, timeout=30)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -2,15 +2,40 @@
 RAG引擎模块
 用于实现检索增强生成（Retrieval-Augmented Generation）功能
 """
-from typing import List, Dict, Optional
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 from loguru import logger
-import requests
+import httpx
+
+from app.core.section_extractor import TEXT_BLOCK_SECTIONS
+from app.utils.executors import PoolSaturatedError, run_blocking
+from app.utils.latency import LatencyRecorder
+
+GENERATION_ERROR_ANSWER = "回答の生成中にエラーが発生しました。"
+TRUNCATED_ANSWER_MESSAGE = "回答の生成が途中で中断されました。回答は不完全です。"
+NO_CONTEXT_ANSWER = "申し訳ございませんが、関連する情報が見つかりませんでした。まず報告書を処理（STEP 2）してから質問してください。"
 
 
 class RAGEngine:
     """RAG引擎"""
 
-    def __init__(self, vector_store, ollama_host: str, ollama_port: int, ollama_model: str):
+    def __init__(
+        self,
+        vector_store,
+        ollama_host: str,
+        ollama_port: int,
+        ollama_model: str,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 120.0,
+        keep_alive: Union[str, int] = "30m",
+        max_connections: int = 4,
+        answer_cache=None,
+        company_directory=None,
+        reranker=None,
+        rerank_candidates: int = 20,
+    ):
         """
         初始化RAG引擎
 
@@ -19,22 +44,72 @@ class RAGEngine:
             ollama_host: Ollama服务主机
             ollama_port: Ollama服务端口
             ollama_model: Ollama模型名称
+            connect_timeout: 连接Ollama的超时（秒）
+            read_timeout: 等待Ollama响应数据的超时（秒，流式时为两个数据块之间的间隔）
+            keep_alive: 传给Ollama的 keep_alive，使模型在两次查询之间保持加载
+            max_connections: 到Ollama的最大连接数（即并发生成数，超出的请求排队等待连接）
+            answer_cache: 语义回答缓存（可选），应与 vector_store.answer_cache 为同一实例以便失效
+            company_directory: 公司目录（可选），用于将公司过滤条件解析为EDINETコード
+            reranker: 重排序器（可选）；启用时先检索 rerank_candidates 个候选，重排后保留 top_k 个
+            rerank_candidates: 重排序的候选数
         """
         self.vector_store = vector_store
         self.ollama_host = ollama_host
         self.ollama_port = ollama_port
         self.ollama_model = ollama_model
         self.ollama_url = f"http://{ollama_host}:{ollama_port}"
+        self.keep_alive = keep_alive
+        self.answer_cache = answer_cache
+        self.company_directory = company_directory
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        # 各阶段（检索/重排序/生成）耗时，用于按p95调整候选数
+        self.latency = LatencyRecorder()
+
+        # 长连接池：复用TCP连接，避免每次查询重新建连
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = httpx.Client(base_url=self.ollama_url, timeout=self.timeout, limits=self.limits)
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop = None
         logger.info(f"初始化RAG引擎 - 连接到 {ollama_host}:{ollama_port}")
 
-    def retrieve(self, query: str, top_k: int = 5, company_filter: Optional[str] = None) -> List[Dict]:
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """异步客户端的连接绑定创建时的事件循环，循环变化时重新创建"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(base_url=self.ollama_url, timeout=self.timeout, limits=self.limits)
+            self._async_loop = loop
+        return self._async_client
+
+    def close(self):
+        """关闭同步连接池"""
+        self._client.close()
+
+    async def aclose(self):
+        """关闭连接池（在创建异步客户端的事件循环中调用）"""
+        self.close()
+        if self._async_client is not None and self._async_loop is asyncio.get_running_loop():
+            await self._async_client.aclose()
+        self._async_client = None
+
+    def retrieve(
+        self,
+        query: str,
+        top_k: int = 5,
+        company_filter: Optional[str] = None,
+        section_filter: Optional[str] = None,
+        timings: Optional[Dict] = None
+    ) -> List[Dict]:
         """
         检索相关文档
 
         Args:
             query: 查询文本
             top_k: 返回的最相关文档数量
-            company_filter: 公司名称过滤器
+            company_filter: 公司过滤器（公司名、EDINETコード或证券代码）
+            section_filter: 章节过滤器（如 事業等のリスク，可为章节名的一部分）
+            timings: 传入时写入各阶段耗时（秒）
 
         Returns:
             相关文档列表
@@ -43,28 +118,43 @@ class RAGEngine:
             logger.info(f"检索相关文档: {query}")
 
             # 构建过滤条件
-            filter_conditions = None
+            conditions = []
             if company_filter:
-                filter_conditions = {"company_name": {"$contains": company_filter}}
+                conditions.append(self._company_conditions(company_filter))
+            if section_filter:
+                conditions.append(self._section_conditions(section_filter))
+            filter_conditions = None
+            if conditions:
+                filter_conditions = conditions[0] if len(conditions) == 1 else {"$and": conditions}
 
-            # 使用向量存储搜索
+            # 使用向量存储搜索（启用重排序时多取候选）
+            n_candidates = max(self.rerank_candidates, top_k) if self.reranker is not None else top_k
+            stage_start = time.perf_counter()
             results = self.vector_store.search(
                 query=query,
-                n_results=top_k,
+                n_results=n_candidates,
                 filter_conditions=filter_conditions
             )
+            self._record_stage("retrieval", stage_start, timings)
 
             # 格式化结果
             formatted_results = []
             for r in results:
                 formatted_results.append({
                     "text": r.get("text", ""),
+                    "chunk_id": r.get("id"),
                     "company": r.get("metadata", {}).get("company_name", "不明"),
                     "doc_id": r.get("metadata", {}).get("doc_id", ""),
                     "section": r.get("metadata", {}).get("section", ""),
+                    "heading": r.get("metadata", {}).get("heading", ""),
                     "score": r.get("score", 0),
                 })
 
+            if self.reranker is not None:
+                stage_start = time.perf_counter()
+                formatted_results = self.reranker.rerank(query, formatted_results, top_k)
+                self._record_stage("rerank", stage_start, timings)
+
             logger.info(f"检索到 {len(formatted_results)} 个相关文档块")
             return formatted_results
 
@@ -72,79 +162,219 @@ class RAGEngine:
             logger.error(f"检索失败: {e}")
             return []
 
-    def generate(self, query: str, context: List[Dict]) -> str:
+    def _record_stage(self, stage: str, stage_start: float, timings: Optional[Dict] = None):
+        elapsed = time.perf_counter() - stage_start
+        self.latency.record(stage, elapsed)
+        if timings is not None:
+            timings[stage] = round(elapsed, 4)
+
+    def get_stats(self) -> Dict:
+        stats = {"stage_latency": self.latency.get_stats()}
+        if self.reranker is not None:
+            stats["reranker"] = self.reranker.get_stats()
+        return stats
+
+    def _company_conditions(self, company_filter: str) -> Dict:
+        """
+        将公司过滤条件解析为等值谓词
+
+        在公司目录中解析为EDINETコード后按 edinet_code 过滤；未标注 edinet_code 的旧块
+        按目录中的正式公司名完全一致匹配。目录不可用或无法解析时按公司名完全一致过滤。
+        """
+        codes = self.company_directory.resolve(company_filter) if self.company_directory is not None else []
+        if not codes:
+            return {"company_name": company_filter}
+        names = sorted({self.company_directory.get_name(code) or "" for code in codes} - {""})
+        logger.info(f"公司过滤 '{company_filter}' 解析为 {len(codes)} 家公司")
+        return {"$or": [{"edinet_code": {"$in": codes}}, {"company_name": {"$in": names or [company_filter]}}]}
+
+    @staticmethod
+    def _section_conditions(section_filter: str) -> Dict:
+        """章节过滤：与已知章节名部分一致时按这些章节过滤，否则按章节名完全一致过滤"""
+        sections = sorted({title for title in TEXT_BLOCK_SECTIONS.values() if section_filter in title})
+        if not sections or section_filter in sections:
+            return {"section": section_filter}
+        return {"section": {"$in": sections}} if len(sections) > 1 else {"section": sections[0]}
+
+    def _build_prompt(self, query: str, context: List[Dict]) -> str:
+        """构建发送给LLM的提示"""
+        # 构建上下文文本
+        context_text = "\n\n".join([
+            f"【{c.get('company', '不明')}{' / ' + c['section'] if c.get('section') else ''}】\n{c.get('text', '')}"
+            for c in context[:5]  # 最多使用5个上下文
+        ])
+
+        # 构建提示
+        return f"""あなたは有価証券報告書の分析専門家です。以下の参照情報を基に、質問に日本語で回答してください。
+
+【参照情報】
+{context_text}
+
+【質問】
+{query}
+
+【回答】
+上記の参照情報に基づいて、簡潔かつ正確に回答してください。数値がある場合は具体的に示してください。"""
+
+    def _ollama_payload(self, prompt: str, stream: bool) -> Dict:
+        return {
+            "model": self.ollama_model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": 0.3,
+                "num_predict": 1000,
+            }
+        }
+
+    def generate(self, query: str, context: List[Dict], status: Optional[Dict] = None) -> str:
         """
         生成回答
 
         Args:
             query: 查询文本
             context: 上下文文档
+            status: 传入时写入 complete（回答为LLM完整输出时为True，只有这种回答可以缓存）
 
         Returns:
             生成的回答
         """
+        self._set_status(status, complete=False)
         try:
             logger.info(f"生成回答: {query}")
 
             # 如果没有上下文，返回提示信息
             if not context:
-                return "申し訳ございませんが、関連する情報が見つかりませんでした。まず報告書を処理（STEP 2）してから質問してください。"
+                return NO_CONTEXT_ANSWER
 
-            # 构建上下文文本
-            context_text = "\n\n".join([
-                f"【{c.get('company', '不明')}】\n{c.get('text', '')}"
-                for c in context[:5]  # 最多使用5个上下文
-            ])
+            prompt = self._build_prompt(query, context)
 
-            # 构建提示
-            prompt = f"""あなたは有価証券報告書の分析専門家です。以下の参照情報を基に、質問に日本語で回答してください。
+            # 调用Ollama API
+            try:
+                response = self._client.post("/api/generate", json=self._ollama_payload(prompt, stream=False))
+                answer, done = self._parse_answer(response)
+                if answer:
+                    self._set_status(status, complete=done)
+                    return answer
+            except Exception as e:
+                self._log_ollama_error(e)
 
-【参照情報】
-{context_text}
+            # 如果Ollama不可用，返回基于上下文的简单回答
+            return self._generate_simple_answer(query, context)
 
-【質問】
-{query}
+        except Exception as e:
+            logger.error(f"生成失败: {e}")
+            return GENERATION_ERROR_ANSWER
 
-【回答】
-上記の参照情報に基づいて、簡潔かつ正確に回答してください。数値がある場合は具体的に示してください。"""
+    async def agenerate(self, query: str, context: List[Dict], status: Optional[Dict] = None) -> str:
+        """生成回答（异步版本，使用异步连接池，不占用线程），status 同 generate"""
+        self._set_status(status, complete=False)
+        try:
+            logger.info(f"生成回答: {query}")
 
-            # 调用Ollama API
+            if not context:
+                return NO_CONTEXT_ANSWER
+
+            prompt = self._build_prompt(query, context)
             try:
-                response = requests.post(
-                    f"{self.ollama_url}/api/generate",
-                    json={
-                        "model": self.ollama_model,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.3,
-                            "num_predict": 1000,
-                        }
-                    },
-                    timeout=120
+                response = await self._get_async_client().post(
+                    "/api/generate", json=self._ollama_payload(prompt, stream=False)
                 )
-
-                if response.status_code == 200:
-                    result = response.json()
-                    answer = result.get("response", "").strip()
-                    if answer:
-                        return answer
-
-                logger.warning(f"Ollama API返回异常: {response.status_code}")
-
-            except requests.exceptions.ConnectionError:
-                logger.warning("Ollama服务未连接，使用简单回答模式")
-            except requests.exceptions.Timeout:
-                logger.warning("Ollama请求超时")
+                answer, done = self._parse_answer(response)
+                if answer:
+                    self._set_status(status, complete=done)
+                    return answer
             except Exception as e:
-                logger.warning(f"Ollama调用失败: {e}")
+                self._log_ollama_error(e)
 
-            # 如果Ollama不可用，返回基于上下文的简单回答
             return self._generate_simple_answer(query, context)
 
         except Exception as e:
             logger.error(f"生成失败: {e}")
-            return "回答の生成中にエラーが発生しました。"
+            return GENERATION_ERROR_ANSWER
+
+    async def agenerate_stream(
+        self, query: str, context: List[Dict], status: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """
+        流式生成回答（使用异步连接池），按Ollama产出的顺序逐段返回文本
+
+        Ollama不可用或在产出任何内容前失败时，退回简单回答（一次性返回）
+
+        Args:
+            query: 查询文本
+            context: 上下文文档
+            status: 传入时写入 complete（收到Ollama的done且未出错时为True）与
+                truncated（已产出部分内容后上游中断时为True）
+
+        Yields:
+            回答文本片段
+        """
+        logger.info(f"流式生成回答: {query}")
+        self._set_status(status, complete=False, truncated=False)
+
+        if not context:
+            yield NO_CONTEXT_ANSWER
+            return
+
+        prompt = self._build_prompt(query, context)
+        produced = False
+        finished = False
+        try:
+            client = self._get_async_client()
+            async with client.stream("POST", "/api/generate", json=self._ollama_payload(prompt, stream=True)) as response:
+                if response.status_code == 200:
+                    async for line in response.aiter_lines():
+                        token, done = self._parse_stream_line(line)
+                        if token:
+                            produced = True
+                            yield token
+                        if done:
+                            finished = True
+                            break
+                else:
+                    logger.warning(f"Ollama API返回异常: {response.status_code}")
+        except Exception as e:
+            self._log_ollama_error(e)
+
+        if not produced:
+            yield self._generate_simple_answer(query, context)
+        else:
+            if not finished:
+                logger.warning("Ollama流式响应在完成前中断")
+            self._set_status(status, complete=finished, truncated=not finished)
+
+    @staticmethod
+    def _parse_answer(response: httpx.Response) -> Tuple[str, bool]:
+        """返回 (回答, 是否完整)"""
+        if response.status_code == 200:
+            data = response.json()
+            return data.get("response", "").strip(), bool(data.get("done"))
+        logger.warning(f"Ollama API返回异常: {response.status_code}")
+        return "", False
+
+    @staticmethod
+    def _set_status(status: Optional[Dict], **values):
+        if status is not None:
+            status.update(values)
+
+    @staticmethod
+    def _parse_stream_line(line: str):
+        """解析流式响应的一行 {"response": "...", "done": false}，返回 (token, done)"""
+        if not line:
+            return "", False
+        chunk = json.loads(line)
+        return chunk.get("response", ""), bool(chunk.get("done"))
+
+    @staticmethod
+    def _log_ollama_error(error: Exception):
+        if isinstance(error, httpx.ConnectError):
+            logger.warning("Ollama服务未连接，使用简单回答模式")
+        elif isinstance(error, httpx.TimeoutException):
+            logger.warning("Ollama请求超时")
+        else:
+            logger.warning(f"Ollama调用失败: {error}")
 
     def _generate_simple_answer(self, query: str, context: List[Dict]) -> str:
         """当Ollama不可用时，生成简单的基于上下文的回答"""
@@ -175,7 +405,58 @@ class RAGEngine:
 
         return answer
 
-    def query(self, question: str, top_k: int = 5, company_filter: Optional[str] = None) -> Dict:
+    def _retrieve_with_cache(
+        self, question: str, top_k: int, company_filter: Optional[str], section_filter: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[Dict], Optional[Tuple], Dict]:
+        """
+        检索并查找回答缓存
+
+        Returns:
+            (检索结果, 命中的缓存结果, 写入缓存用的 (key, 查询嵌入, epoch), 各阶段耗时)；
+            未启用缓存时第二、三项为None
+        """
+        timings: Dict = {}
+        if self.answer_cache is None:
+            return self.retrieve(question, top_k, company_filter, section_filter, timings=timings), None, None, timings
+
+        epoch = self.answer_cache.current_epoch()
+        slot = None
+        try:
+            documents = self.retrieve(question, top_k, company_filter, section_filter, timings=timings)
+            if not documents:
+                return documents, None, None, timings
+
+            embedding = self.vector_store.get_query_embedding(question)
+            key = self.answer_cache.make_key(self.vector_store.embedding_model_name, company_filter, documents)
+            cached = self.answer_cache.get(key, embedding)
+            if cached is not None:
+                cached["timings"] = timings
+                return documents, cached, None, timings
+            slot = (key, embedding, epoch)
+            return documents, None, slot, timings
+        finally:
+            if slot is None:
+                self.answer_cache.release(epoch)
+
+    def _store_answer(self, slot: Optional[Tuple], result: Dict, generation_time: float, complete: bool):
+        """缓存完整的LLM回答（简单回答、截断的回答与错误不缓存）"""
+        if slot is None or not complete:
+            return
+        key, embedding, epoch = slot
+        documents = result["sources"]
+        self.answer_cache.put(
+            key, embedding, [d.get("doc_id") for d in documents], result, generation_time, since_epoch=epoch
+        )
+
+    def _release_slot(self, slot: Optional[Tuple]):
+        """结束检索时登记的缓存写入（无论是否写入都须调用）"""
+        if slot is not None:
+            self.answer_cache.release(slot[2])
+
+    def query(
+        self, question: str, top_k: int = 5, company_filter: Optional[str] = None,
+        section_filter: Optional[str] = None
+    ) -> Dict:
         """
         执行完整的RAG查询
 
@@ -183,31 +464,151 @@ class RAGEngine:
             question: 问题
             top_k: 返回的最相关文档数量
             company_filter: 公司名称过滤器
+            section_filter: 章节过滤器
 
         Returns:
-            查询结果
+            查询结果（cached 表示回答来自缓存）
         """
         try:
             # 检索相关文档
-            documents = self.retrieve(question, top_k, company_filter)
+            documents, cached, slot, timings = self._retrieve_with_cache(question, top_k, company_filter, section_filter)
+            if cached is not None:
+                return cached
 
-            # 生成回答
-            answer = self.generate(question, documents)
+            try:
+                # 生成回答
+                start_time = time.time()
+                stage_start = time.perf_counter()
+                status: Dict = {}
+                answer = self.generate(question, documents, status=status)
+                self._record_stage("generation", stage_start, timings)
+                result = self._build_result(question, answer, documents, timings)
+                self._store_answer(slot, result, time.time() - start_time, status["complete"])
+                return result
+            finally:
+                self._release_slot(slot)
+        except Exception as e:
+            logger.error(f"查询失败: {e}")
+            return self._build_result(question, f"エラーが発生しました: {str(e)}", [])
 
-            # 构建上下文预览
-            context = "\n".join([d.get("text", "")[:200] for d in documents[:3]])
+    async def aquery(
+        self, question: str, top_k: int = 5, company_filter: Optional[str] = None,
+        section_filter: Optional[str] = None
+    ) -> Dict:
+        """执行完整的RAG查询（异步版本）"""
+        try:
+            documents, cached, slot, timings = await run_blocking(
+                "vector", self._retrieve_with_cache, question, top_k, company_filter, section_filter
+            )
+            if cached is not None:
+                return cached
 
-            return {
-                "question": question,
-                "answer": answer,
-                "sources": documents,
-                "context": context
-            }
+            try:
+                start_time = time.time()
+                stage_start = time.perf_counter()
+                status: Dict = {}
+                answer = await self.agenerate(question, documents, status=status)
+                self._record_stage("generation", stage_start, timings)
+                result = self._build_result(question, answer, documents, timings)
+                self._store_answer(slot, result, time.time() - start_time, status["complete"])
+                return result
+            finally:
+                self._release_slot(slot)
+        except PoolSaturatedError:
+            # 由接口返回503
+            raise
         except Exception as e:
             logger.error(f"查询失败: {e}")
-            return {
-                "question": question,
-                "answer": f"エラーが発生しました: {str(e)}",
-                "sources": [],
-                "context": ""
+            return self._build_result(question, f"エラーが発生しました: {str(e)}", [])
+
+    @staticmethod
+    def _context_preview(documents: List[Dict]) -> str:
+        return "\n".join([d.get("text", "")[:200] for d in documents[:3]])
+
+    def _build_result(self, question: str, answer: str, documents: List[Dict], timings: Optional[Dict] = None) -> Dict:
+        return {
+            "question": question,
+            "answer": answer,
+            "sources": documents,
+            "context": self._context_preview(documents),
+            "cached": False,
+            "timings": timings or {}
+        }
+
+    def _sources_event(self, documents: List[Dict]) -> Dict:
+        return {"event": "sources", "data": {"sources": documents, "context": self._context_preview(documents)}}
+
+    @staticmethod
+    def _truncated_event() -> Dict:
+        """已发送部分回答后上游中断：以 error 事件结束，客户端据此提示回答不完整"""
+        return {"event": "error", "data": {"message": TRUNCATED_ANSWER_MESSAGE, "truncated": True}}
+
+    @staticmethod
+    def _done_event(start_time: float, first_token_time: Optional[float], cached: bool, timings: Dict) -> Dict:
+        return {
+            "event": "done",
+            "data": {
+                "time_to_first_token": first_token_time,
+                "processing_time": time.time() - start_time,
+                "cached": cached,
+                "timings": timings,
             }
+        }
+
+    async def aquery_stream(
+        self, question: str, top_k: int = 5, company_filter: Optional[str] = None,
+        section_filter: Optional[str] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        流式RAG查询：先返回检索到的来源，再逐段返回生成的回答
+
+        Args:
+            question: 问题
+            top_k: 返回的最相关文档数量
+            company_filter: 公司名称过滤器
+            section_filter: 章节过滤器
+
+        Yields:
+            事件字典 {"event": "sources" | "token" | "done" | "error", "data": {...}}
+            命中回答缓存时整段回答作为一个 token 事件返回；
+            生成中途中断时以 error 事件（truncated 为True）代替 done 结束
+        """
+        start_time = time.time()
+        try:
+            documents, cached, slot, timings = await run_blocking(
+                "vector", self._retrieve_with_cache, question, top_k, company_filter, section_filter
+            )
+            yield self._sources_event(documents)
+
+            if cached is not None:
+                yield {"event": "token", "data": {"text": cached["answer"]}}
+                yield self._done_event(start_time, time.time() - start_time, cached=True, timings=timings)
+                return
+
+            try:
+                generation_start = time.time()
+                stage_start = time.perf_counter()
+                first_token_time = None
+                tokens = []
+                status: Dict = {}
+                async for token in self.agenerate_stream(question, documents, status=status):
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    tokens.append(token)
+                    yield {"event": "token", "data": {"text": token}}
+
+                self._record_stage("generation", stage_start, timings)
+                result = self._build_result(question, "".join(tokens), documents, timings)
+                self._store_answer(slot, result, time.time() - generation_start, status["complete"])
+            finally:
+                self._release_slot(slot)
+            if status.get("truncated"):
+                yield self._truncated_event()
+                return
+            yield self._done_event(start_time, first_token_time, cached=False, timings=timings)
+        except PoolSaturatedError:
+            # 检索前即饱和（尚未发送事件），由接口返回503
+            raise
+        except Exception as e:
+            logger.error(f"流式查询失败: {e}")
+            yield {"event": "error", "data": {"message": f"エラーが発生しました: {str(e)}"}}
@@ -0,0 +1,193 @@
+"""
+章节感知的文本提取模块
+遍历内联XBRL（PublicDoc/*.htm）的HTML以及实例文档中textBlock的HTML，
+按 (章节, 标题路径, 正文) 输出记录，正文段落之间以空行分隔。
+
+章节取自包裹正文的 ix:nonNumeric textBlock 元素名（如 BusinessRisksTextBlock → 事業等のリスク）；
+textBlock之外的正文以所在页面的第一个标题作为章节。
+"""
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from lxml import etree, html
+from loguru import logger
+
+from app.core.xbrl_parser import _split_tag
+
+# 有价证券报告书主要textBlock元素对应的章节名
+TEXT_BLOCK_SECTIONS = {
+    "CompanyHistoryTextBlock": "沿革",
+    "DescriptionOfBusinessTextBlock": "事業の内容",
+    "OverviewOfAffiliatedEntitiesTextBlock": "関係会社の状況",
+    "InformationAboutEmployeesTextBlock": "従業員の状況",
+    "BusinessPolicyBusinessEnvironmentIssuesToAddressEtcTextBlock": "経営方針、経営環境及び対処すべき課題等",
+    "DisclosureOfSustainabilityRelatedFinancialInformationTextBlock": "サステナビリティに関する考え方及び取組",
+    "BusinessRisksTextBlock": "事業等のリスク",
+    "ManagementAnalysisOfFinancialPositionOperatingResultsAndCashFlowsTextBlock":
+        "経営者による財政状態、経営成績及びキャッシュ・フローの状況の分析",
+    "CriticalContractsForOperationTextBlock": "経営上の重要な契約等",
+    "ResearchAndDevelopmentActivitiesTextBlock": "研究開発活動",
+    "OverviewOfCapitalExpendituresEtcTextBlock": "設備投資等の概要",
+    "MajorFacilitiesTextBlock": "主要な設備の状況",
+    "PlannedAdditionsRetirementsEtcOfFacilitiesTextBlock": "設備の新設、除却等の計画",
+    "DividendPolicyTextBlock": "配当政策",
+    "ExplanationAboutCorporateGovernanceTextBlock": "コーポレート・ガバナンスの概要",
+    "OverviewOfCorporateGovernanceTextBlock": "コーポレート・ガバナンスの概要",
+    "InformationAboutOfficersTextBlock": "役員の状況",
+    "AuditTextBlock": "監査の状況",
+    "RemunerationForDirectorsAndOtherOfficersTextBlock": "役員の報酬等",
+    "ShareholdingsTextBlock": "株式の保有状況",
+}
+
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+BLOCK_TAGS = {"p", "li", "tr", "caption", "dt", "dd", "pre", "blockquote"}
+CONTAINER_TAGS = {"html", "body", "div", "section", "article", "table", "thead", "tbody", "tfoot", "ul", "ol", "dl"}
+# ix:header 中为隐藏的事实，不属于正文
+SKIP_TAGS = {"head", "script", "style", "title", "header", "hidden"}
+
+# 与 extract_xbrl_content 相同：只保留日文、ASCII与全角字符
+_NON_TEXT_RE = re.compile(r'[^\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF\u0020-\u007E\u3000-\u303F\uFF00-\uFFEF。、]+')
+
+
+def section_title(element_name: str) -> str:
+    """textBlock元素名（可带前缀）→ 章节名；未登记的去掉 TextBlock 后缀"""
+    local = _split_tag(element_name or "")[1]
+    if local in TEXT_BLOCK_SECTIONS:
+        return TEXT_BLOCK_SECTIONS[local]
+    return local[:-len("TextBlock")] if local.endswith("TextBlock") and local != "TextBlock" else local
+
+
+def _tag(elem) -> str:
+    if not isinstance(elem.tag, str):
+        return ""
+    return _split_tag(elem.tag)[1].lower()
+
+
+def _is_text_block(elem) -> bool:
+    return _tag(elem) == "nonnumeric" and (elem.get("name") or "").endswith("TextBlock")
+
+
+def _is_block(elem) -> bool:
+    tag = _tag(elem)
+    return tag in BLOCK_TAGS or tag in HEADING_TAGS or tag in CONTAINER_TAGS or _is_text_block(elem)
+
+
+def _clean(text: Optional[str]) -> str:
+    text = re.sub(r'\s+', ' ', text or "")
+    return _NON_TEXT_RE.sub(' ', text).strip()
+
+
+def _text(elem) -> str:
+    if _tag(elem) == "tr":
+        # 表格行：单元格之间以空格分隔
+        return " ".join(_text(cell) for cell in elem if _tag(cell) in ("td", "th"))
+    return " ".join(t for t in _itertext(elem) if t.strip())
+
+
+def _itertext(elem) -> Iterator[str]:
+    """同 itertext，但跳过注释与 SKIP_TAGS 子树（如 ix:header 中的隐藏事实）"""
+    if elem.text:
+        yield elem.text
+    for child in elem:
+        tag = _tag(child)
+        if tag and tag not in SKIP_TAGS:
+            yield from _itertext(child)
+        if child.tail:
+            yield child.tail
+
+
+class _SectionWalker:
+    """深度优先遍历HTML，维护当前章节与标题栈，相邻且路径相同的段落合并为一条记录"""
+
+    def __init__(self, section: str = ""):
+        self.section = section
+        self.headings: List[Tuple[int, str]] = []
+        self.records: List[Tuple[str, Tuple[str, ...], List[str]]] = []
+
+    def emit(self, text: Optional[str]):
+        text = _clean(text)
+        if not text:
+            return
+        path = tuple(heading for _, heading in self.headings)
+        section = self.section or (path[0] if path else "")
+        if self.records and self.records[-1][0] == section and self.records[-1][1] == path:
+            self.records[-1][2].append(text)
+        else:
+            self.records.append((section, path, [text]))
+
+    def heading(self, level: int, text: str):
+        text = _clean(text)
+        if text:
+            self.headings = [h for h in self.headings if h[0] < level] + [(level, text)]
+
+    def walk(self, elem):
+        tag = _tag(elem)
+        if not tag or tag in SKIP_TAGS:
+            return
+        if _is_text_block(elem):
+            saved = self.section, self.headings
+            self.section, self.headings = section_title(elem.get("name")), []
+            self._walk_mixed(elem)
+            self.section, self.headings = saved
+        elif tag in HEADING_TAGS:
+            self.heading(HEADING_TAGS[tag], _text(elem))
+        elif tag in BLOCK_TAGS or not any(_is_block(d) for d in elem.iterdescendants()):
+            self.emit(_text(elem))
+        else:
+            self._walk_mixed(elem)
+
+    def _walk_mixed(self, elem):
+        self.emit(elem.text)
+        for child in elem:
+            self.walk(child)
+            self.emit(child.tail)
+
+    def result(self) -> List[Dict]:
+        return [
+            {"section": section, "heading_path": list(path), "text": "\n\n".join(paragraphs)}
+            for section, path, paragraphs in self.records
+        ]
+
+
+def _parse_html_file(path: Path):
+    # 内联XBRL为XHTML，先按XML解析以保留 ix: 命名空间；失败时按HTML解析
+    try:
+        tree = etree.parse(str(path), etree.XMLParser(recover=True, huge_tree=True))
+        if tree.getroot() is not None:
+            return tree.getroot()
+    except etree.XMLSyntaxError:
+        pass
+    return html.parse(str(path)).getroot()
+
+
+def _walk(root, section: str = "") -> List[Dict]:
+    walker = _SectionWalker(section)
+    if root is not None:
+        walker.walk(root)
+    return walker.result()
+
+
+def extract_html_sections(path: Union[str, Path]) -> List[Dict]:
+    """
+    提取内联XBRL/HTML文件的章节记录
+
+    Returns:
+        [{"section", "heading_path", "text"}]
+    """
+    try:
+        return _walk(_parse_html_file(Path(path)))
+    except Exception as e:
+        logger.warning(f"HTML解析失败 {path}: {e}")
+        return []
+
+
+def extract_fragment_sections(fragment: str, section: str = "") -> List[Dict]:
+    """提取HTML片段（实例文档中textBlock的值）的章节记录，section 为片段所属章节"""
+    if not fragment or not fragment.strip():
+        return []
+    try:
+        return _walk(html.fragment_fromstring(fragment, create_parent="div"), section)
+    except Exception as e:
+        logger.warning(f"HTML片段解析失败: {e}")
+        return []
@@ -1,64 +1,290 @@
 """
 XBRL解析器模块
 用于解析和提取XBRL格式的财务数据
+
+使用 lxml.iterparse 增量解析实例文档，处理完每个顶层元素后立即释放，
+大文件（100MB级）解析时内存占用保持平稳。
 """
-from typing import Dict, List, Optional
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Union
+from lxml import etree
 from loguru import logger
 
+XBRLI_NS = "http://www.xbrl.org/2003/instance"
+LINK_NS = "http://www.xbrl.org/2003/linkbase"
+XBRLDI_NS = "http://xbrl.org/2006/xbrldi"
+XSI_NIL = "{http://www.w3.org/2001/XMLSchema-instance}nil"
+
+# 不视为事实（fact）的命名空间
+NON_FACT_NAMESPACES = (XBRLI_NS, LINK_NS, XBRLDI_NS)
+
+# 主要财务指标对应的元素（按优先顺序，含日本基准/IFRS/经营指标摘要）
+FINANCIAL_ELEMENTS = {
+    "revenue": (
+        "NetSales", "OperatingRevenue1", "Revenue", "RevenueIFRS",
+        "NetSalesSummaryOfBusinessResults", "RevenueIFRSSummaryOfBusinessResults",
+    ),
+    "profit": (
+        "ProfitLossAttributableToOwnersOfParent", "ProfitLoss", "ProfitLossAttributableToOwnersOfParentIFRS",
+        "ProfitLossAttributableToOwnersOfParentSummaryOfBusinessResults", "NetIncomeLossSummaryOfBusinessResults",
+    ),
+    "assets": (
+        "Assets", "AssetsIFRS", "TotalAssetsSummaryOfBusinessResults", "TotalAssetsIFRSSummaryOfBusinessResults",
+    ),
+}
+
+FINANCIAL_ELEMENT_NAMES = frozenset(element for candidates in FINANCIAL_ELEMENTS.values() for element in candidates)
+
+
+def _split_tag(tag: str):
+    """拆分 '{ns}local' 或 'prefix:local' 形式的标签，返回 (命名空间/前缀, 本地名)"""
+    if tag.startswith("{"):
+        ns, local = tag[1:].split("}", 1)
+        return ns, local
+    if ":" in tag:
+        prefix, local = tag.split(":", 1)
+        return prefix, local
+    return "", tag
+
+
+def _strip_prefix(qname: str) -> str:
+    """'iso4217:JPY' -> 'JPY'"""
+    qname = (qname or "").strip()
+    return qname.split(":", 1)[1] if ":" in qname else qname
+
+
 class XBRLParser:
     """XBRL文档解析器"""
-    
-    def __init__(self):
-        """初始化XBRL解析器"""
+
+    def __init__(self, fact_store=None):
+        """
+        初始化XBRL解析器
+
+        Args:
+            fact_store: 财务事实列式存储（可选），extract_financial_data 会将事实写入其中
+        """
+        self.fact_store = fact_store
         logger.info("初始化XBRL解析器")
-    
-    def parse_document(self, file_path: str) -> Dict:
+
+    @staticmethod
+    def _is_current_fact(fact: Dict) -> bool:
+        """当期、无维度的事实"""
+        return (fact.get("context_ref") or "").startswith("Current") and not fact.get("dimensions")
+
+    @staticmethod
+    def _parse_context(elem) -> Dict:
+        """解析 xbrli:context 元素"""
+        context = {"id": elem.get("id"), "entity": None, "period": {}, "dimensions": {}}
+        for child in elem.iter():
+            if not isinstance(child.tag, str):
+                continue
+            ns, local = _split_tag(child.tag)
+            text = (child.text or "").strip()
+            if local == "identifier":
+                context["entity"] = text
+            elif local == "instant":
+                context["period"] = {"type": "instant", "instant": text}
+            elif local == "startDate":
+                context["period"].setdefault("type", "duration")
+                context["period"]["start"] = text
+            elif local == "endDate":
+                context["period"].setdefault("type", "duration")
+                context["period"]["end"] = text
+            elif local == "forever":
+                context["period"] = {"type": "forever"}
+            elif local == "explicitMember":
+                context["dimensions"][_strip_prefix(child.get("dimension"))] = _strip_prefix(text)
+            elif local == "typedMember":
+                value = "".join(child.itertext()).strip()
+                context["dimensions"][_strip_prefix(child.get("dimension"))] = value
+        return context
+
+    @staticmethod
+    def _parse_unit(elem) -> str:
+        """解析 xbrli:unit 元素，返回如 'JPY' 或 'JPY/shares' 的表示"""
+        numerators, denominators = [], []
+        for child in elem.iter():
+            if not isinstance(child.tag, str):
+                continue
+            _, local = _split_tag(child.tag)
+            if local != "measure":
+                continue
+            parent_local = _split_tag(child.getparent().tag)[1]
+            target = denominators if parent_local == "unitDenominator" else numerators
+            target.append(_strip_prefix(child.text))
+        unit = "*".join(numerators)
+        if denominators:
+            unit += "/" + "*".join(denominators)
+        return unit
+
+    def iter_facts(self, source: Union[str, Path, BinaryIO]) -> Iterator[Dict]:
+        """
+        流式解析XBRL实例文档，逐个产出事实
+
+        Args:
+            source: 文件路径或二进制文件对象
+
+        Yields:
+            事实字典: element, namespace, context_ref, period, entity, dimensions,
+            unit_ref, unit, decimals, value, is_nil
         """
-        解析XBRL文档
+        contexts: Dict[str, Dict] = {}
+        units: Dict[str, str] = {}
+        pending: List[Dict] = []  # 上下文/单位尚未出现的事实
+
+        def resolve(fact: Dict) -> Dict:
+            context = contexts.get(fact["context_ref"], {})
+            fact["period"] = context.get("period", {})
+            fact["entity"] = context.get("entity")
+            fact["dimensions"] = context.get("dimensions", {})
+            fact["unit"] = units.get(fact["unit_ref"]) if fact["unit_ref"] else None
+            return fact
+
+        if isinstance(source, Path):
+            source = str(source)
+
+        for _, elem in etree.iterparse(source, events=("end",), recover=True, huge_tree=True):
+            if not isinstance(elem.tag, str):
+                continue
+            ns, local = _split_tag(elem.tag)
+            parent = elem.getparent()
+
+            if ns == XBRLI_NS and local == "context":
+                context = self._parse_context(elem)
+                contexts[context["id"]] = context
+            elif ns == XBRLI_NS and local == "unit":
+                units[elem.get("id")] = self._parse_unit(elem)
+            elif elem.get("contextRef") is not None and ns not in NON_FACT_NAMESPACES:
+                is_nil = elem.get(XSI_NIL) in ("true", "1")
+                fact = {
+                    "element": local,
+                    "namespace": ns,
+                    "context_ref": elem.get("contextRef"),
+                    "unit_ref": elem.get("unitRef"),
+                    "decimals": elem.get("decimals"),
+                    "value": None if is_nil else (elem.text or "").strip(),
+                    "is_nil": is_nil,
+                }
+                if fact["context_ref"] in contexts and (not fact["unit_ref"] or fact["unit_ref"] in units):
+                    yield resolve(fact)
+                else:
+                    pending.append(fact)
+
+            # 顶层元素处理完毕后释放其本身及之前的兄弟节点
+            if parent is not None and parent.getparent() is None:
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+        for fact in pending:
+            yield resolve(fact)
+
+    def parse_document(self, file_path: str, doc_id: Optional[str] = None) -> Dict:
+        """
+        解析XBRL文档（单次流式遍历，内存中只保留主要财务指标的事实）
+
+        配置了 fact_store 且给出 doc_id 时，全部数值事实边解析边写入列式存储。
 
         Args:
             file_path: XBRL文件路径
+            doc_id: 文档ID（可选）
 
         Returns:
-            解析结果字典
+            解析结果字典（facts 只含 FINANCIAL_ELEMENTS 中的元素）
         """
         try:
             logger.info(f"解析XBRL文档: {file_path}")
-            # 这是一个占位符实现
+            company_info: Dict[str, str] = {}
+            data: Dict[str, str] = {}
+            facts: List[Dict] = []
+            period: Dict = {}
+
+            def scan() -> Iterator[Dict]:
+                nonlocal period
+                for fact in self.iter_facts(file_path):
+                    element = fact["element"]
+                    if element in FINANCIAL_ELEMENT_NAMES:
+                        facts.append(fact)
+                    if "jpdei" in fact["namespace"] or element.endswith("DEI"):
+                        company_info.setdefault(element, fact["value"])
+                    # 当期、无维度的事实作为主要数据
+                    if self._is_current_fact(fact):
+                        data.setdefault(element, fact["value"])
+                        if not period and fact["period"]:
+                            period = fact["period"]
+                    yield fact
+
+            if self.fact_store is not None and doc_id:
+                self.fact_store.add_facts(doc_id, scan())
+            else:
+                for _ in scan():
+                    pass
+
+            company = (
+                company_info.get("FilerNameInJapaneseDEI")
+                or company_info.get("EntityNameJa")
+                or "未知公司"
+            )
             return {
-                "company": "未知公司",
-                "period": "未知期间",
-                "data": {},
-                "company_info": {}
+                "company": company,
+                "period": period or "未知期间",
+                "data": data,
+                "company_info": company_info,
+                "facts": facts,
             }
         except Exception as e:
             logger.error(f"XBRL解析失败: {e}")
             raise
 
-    def parse_xbrl_file(self, file_path) -> Dict:
+    def parse_xbrl_file(self, file_path, doc_id: Optional[str] = None) -> Dict:
         """
         解析XBRL文件（parse_document的别名）
 
         Args:
             file_path: XBRL文件路径
+            doc_id: 文档ID（可选）
 
         Returns:
             解析结果字典
         """
-        return self.parse_document(str(file_path))
-    
+        return self.parse_document(str(file_path), doc_id=doc_id)
+
     def extract_financial_data(self, xbrl_data: Dict) -> Dict:
         """
         从XBRL数据中提取财务信息
-        
+
+        配置了 fact_store 且 xbrl_data 含 doc_id 时，同时将全部数值事实写入列式存储，
+        供跨公司的向量化查询使用。parse_document 的结果只含部分事实（其 doc_id 参数已完成写入），
+        因此结果中不带 doc_id。
+
         Args:
-            xbrl_data: 解析后的XBRL数据
-        
+            xbrl_data: 解析后的XBRL数据（parse_document 的结果，或含 doc_id、facts 的字典）
+
         Returns:
             提取的财务数据
         """
-        return {
-            "revenue": None,
-            "profit": None,
-            "assets": None
-        }
+        facts = xbrl_data.get("facts", [])
+        doc_id = xbrl_data.get("doc_id")
+        if self.fact_store is not None and doc_id:
+            try:
+                self.fact_store.add_facts(doc_id, facts)
+            except Exception as e:
+                logger.error(f"写入财务事实失败 {doc_id}: {e}")
+
+        data = xbrl_data.get("data")
+        if data is None:
+            data = {}
+            for fact in facts:
+                if self._is_current_fact(fact):
+                    data.setdefault(fact["element"], fact["value"])
+
+        result = {}
+        for key, candidates in FINANCIAL_ELEMENTS.items():
+            result[key] = None
+            for element in candidates:
+                try:
+                    result[key] = float(data[element])
+                    break
+                except (KeyError, TypeError, ValueError):
+                    continue
+        return result
@@ -3,17 +3,30 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from loguru import logger
 import uvicorn
+import asyncio
 import os
 
 from app.state import app_state, set_component
 from app.api.endpoints import router as api_router
 from app.core.config import settings
 from app.core.edinet_client import EdinetClient
+from app.core.edinet_cache import DailyListCache
 from app.core.xbrl_parser import XBRLParser
 from app.utils.chunking import JapaneseTextChunker
 from app.services.vector_store import VectorStoreManager
 from app.services.document_processor import DocumentProcessor
+from app.services.raw_store import RawDocumentStore
+from app.services.fact_store import FactStore
+from app.services.embedding_service import EmbeddingService
+from app.services.embedding_cache import EmbeddingDiskCache
+from app.services.answer_cache import AnswerCache
+from app.services.bm25_index import BM25Index
+from app.services.company_directory import CompanyDirectory
+from app.services.reranker import CrossEncoderReranker
+from app.services.job_queue import IngestJobQueue, IngestWorkers
+from app.services.edinet_sync import EdinetSyncDaemon
 from app.core.rag_engine import RAGEngine
+from app.utils.executors import BlockingWorkPools, run_blocking
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -23,14 +36,37 @@ async def lifespan(app: FastAPI):
     
     # 初始化组件
     try:
-        # 1. 初始化EDINET客户端
+        # 1. 初始化EDINET客户端（书类一览缓存于 data_dir，原始文档存于 raw_data_dir）
+        daily_list_cache = None
+        if settings.edinet_cache_enabled:
+            daily_list_cache = DailyListCache(
+                db_path=os.path.join(settings.data_dir, "edinet_daily_lists.sqlite3"),
+                ttl_seconds=settings.edinet_cache_ttl
+            )
+        raw_store = None
+        if settings.raw_store_enabled:
+            raw_store = RawDocumentStore(
+                root_dir=settings.raw_data_dir,
+                max_bytes=settings.raw_store_max_mb * 1024 * 1024
+            )
+        company_directory = None
+        if settings.company_directory_enabled:
+            company_directory = CompanyDirectory(os.path.join(settings.data_dir, "company_directory.sqlite3"))
+            if settings.company_code_list_path and os.path.exists(settings.company_code_list_path):
+                company_directory.import_code_list(settings.company_code_list_path)
         edinet_client = EdinetClient(
             api_key=settings.edinet_api_key,
-            api_url=settings.edinet_api_url
+            api_url=settings.edinet_api_url,
+            max_workers=settings.edinet_max_workers,
+            rate_limit=settings.edinet_rate_limit,
+            daily_list_cache=daily_list_cache,
+            raw_store=raw_store,
+            company_directory=company_directory
         )
         
-        # 2. 初始化XBRL解析器
-        xbrl_parser = XBRLParser()
+        # 2. 初始化XBRL解析器（数值事实写入 processed_data_dir 下的列式存储）
+        fact_store = FactStore(os.path.join(settings.processed_data_dir, "facts"))
+        xbrl_parser = XBRLParser(fact_store=fact_store)
         
         # 3. 初始化文本分块器
         text_chunker = JapaneseTextChunker(
@@ -44,8 +80,36 @@ async def lifespan(app: FastAPI):
             port=settings.chroma_port,
             collection_name=settings.chroma_collection_name,
             embedding_model=settings.embedding_model,
-            device=settings.embedding_device
+            device=settings.embedding_device,
+            batch_size=settings.embedding_batch_size,
+            query_cache_size=settings.query_embedding_cache_size,
+            embedding_cache=EmbeddingDiskCache(
+                os.path.join(settings.data_dir, "embedding_cache")
+            ) if settings.embedding_disk_cache_enabled else None,
+            backend=settings.vector_backend,
+            index_dir=settings.vector_index_dir,
+            index_dtype=settings.vector_index_dtype,
+            embedding_runtime=settings.embedding_runtime,
+            onnx_model_dir=settings.onnx_model_dir,
+            onnx_min_recall=settings.onnx_min_recall,
+            onnx_min_cosine=settings.onnx_min_cosine
         )
+        if settings.embedding_service_enabled:
+            vector_store.embedding_service = EmbeddingService(
+                encode_fn=vector_store.create_embeddings,
+                max_batch_size=settings.embedding_service_max_batch,
+                max_wait_ms=settings.embedding_service_max_wait_ms
+            )
+        keyword_sync = None
+        if settings.keyword_index_enabled:
+            vector_store.keyword_index = BM25Index(
+                tokenizer=text_chunker.tokenize,
+                root_dir=settings.keyword_index_dir
+            )
+            vector_store.rrf_k = settings.hybrid_rrf_k
+            vector_store.hybrid_candidates = settings.hybrid_candidates
+            # 索引缺失或与集合不一致时在后台重建，不阻塞启动；入库在重建完成后开始
+            keyword_sync = asyncio.get_running_loop().run_in_executor(None, vector_store.sync_keyword_index)
         
         # 5. 初始化文档处理器
         document_processor = DocumentProcessor(
@@ -55,26 +119,119 @@ async def lifespan(app: FastAPI):
             vector_store=vector_store,
             config={
                 "raw_data_dir": settings.raw_data_dir,
-                "processed_data_dir": settings.processed_data_dir
-            }
+                "processed_data_dir": settings.processed_data_dir,
+                "download_workers": settings.ingest_download_workers,
+                "parse_workers": settings.ingest_parse_workers,
+                "member_workers": settings.ingest_member_workers,
+                "embed_batch_size": settings.ingest_embed_batch_size,
+                "max_in_flight": settings.ingest_max_in_flight
+            },
+            company_directory=company_directory
         )
         
-        # 6. 初始化RAG引擎
+        # 6. 初始化RAG引擎（回答缓存由向量存储在文档变更时失效）
+        answer_cache = None
+        if settings.answer_cache_enabled:
+            answer_cache = AnswerCache(
+                max_size=settings.answer_cache_size,
+                ttl_seconds=settings.answer_cache_ttl,
+                similarity_threshold=settings.answer_cache_similarity
+            )
+            vector_store.answer_cache = answer_cache
+        reranker = None
+        if settings.rerank_enabled:
+            reranker = CrossEncoderReranker(
+                model_name=settings.rerank_model,
+                device=settings.embedding_device,
+                batch_size=settings.rerank_batch_size,
+                cache_size=settings.rerank_cache_size
+            )
         rag_engine = RAGEngine(
             vector_store=vector_store,
             ollama_host=settings.ollama_host,
             ollama_port=settings.ollama_port,
-            ollama_model=settings.ollama_model
+            ollama_model=settings.ollama_model,
+            connect_timeout=settings.ollama_connect_timeout,
+            read_timeout=settings.ollama_read_timeout,
+            keep_alive=settings.ollama_keep_alive,
+            max_connections=settings.llm_concurrency,
+            answer_cache=answer_cache,
+            company_directory=company_directory,
+            reranker=reranker,
+            rerank_candidates=settings.rerank_candidates
+        )
+        
+        # 7. 初始化阻塞任务执行池（接口中的同步调用按类型在其中执行）
+        work_pools = BlockingWorkPools(
+            limits={
+                "edinet": settings.edinet_concurrency,
+                "vector": settings.vector_concurrency
+            },
+            max_queue=settings.blocking_queue_limit
         )
         
+        # 8. 持久化入库任务队列与工作线程（恢复上次中断的文档）
+        job_queue = None
+        ingest_workers = None
+        if settings.ingest_queue_enabled:
+            job_queue = IngestJobQueue(
+                db_path=os.path.join(settings.data_dir, "ingest_jobs.sqlite3"),
+                max_attempts=settings.ingest_queue_max_attempts
+            )
+            ingest_workers = IngestWorkers(
+                job_queue=job_queue,
+                document_processor=document_processor,
+                workers=settings.ingest_queue_workers,
+                batch_size=settings.ingest_queue_batch_size,
+                ready=vector_store.model_ready
+            )
+        
+        # 9. EDINET持续同步（新提交的文档送入入库任务队列）
+        edinet_sync = None
+        if settings.edinet_sync_enabled:
+            edinet_sync = EdinetSyncDaemon(
+                edinet_client=edinet_client,
+                state_path=os.path.join(settings.data_dir, "edinet_sync_state.json"),
+                doc_types=settings.edinet_sync_doc_types.split(","),
+                interval=settings.edinet_sync_interval,
+                initial_days=settings.edinet_sync_initial_days,
+                max_catchup_days=settings.edinet_sync_max_catchup_days,
+                job_queue=job_queue,
+                ingest_workers=ingest_workers,
+                document_processor=document_processor,
+                ready=vector_store.model_ready
+            )
+
+        async def start_ingest():
+            # BM25索引重建与入库同时进行会互相覆盖，重建完成后再启动入库
+            if keyword_sync is not None:
+                try:
+                    await keyword_sync
+                except Exception as e:
+                    logger.error(f"BM25索引同步失败: {e}")
+            if ingest_workers:
+                ingest_workers.start()
+            if edinet_sync:
+                edinet_sync.start()
+
+        ingest_start = asyncio.create_task(start_ingest())
+        
         # 保存到应用状态
         app_state.update({
             "edinet_client": edinet_client,
+            "raw_store": raw_store,
+            "company_directory": company_directory,
             "xbrl_parser": xbrl_parser,
+            "fact_store": fact_store,
             "text_chunker": text_chunker,
             "vector_store": vector_store,
             "document_processor": document_processor,
             "rag_engine": rag_engine,
+            "work_pools": work_pools,
+            "job_queue": job_queue,
+            "ingest_workers": ingest_workers,
+            "edinet_sync": edinet_sync,
+            "ingest_start": ingest_start,
             "settings": settings
         })
         
@@ -88,9 +245,29 @@ async def lifespan(app: FastAPI):
     
     # 关闭时
     logger.info("关闭EDINET RAG系统...")
+    ingest_start = app_state.get("ingest_start")
+    if ingest_start and not ingest_start.done():
+        ingest_start.cancel()
+    edinet_sync = app_state.get("edinet_sync")
+    if edinet_sync:
+        edinet_sync.stop(timeout=30)
+    ingest_workers = app_state.get("ingest_workers")
+    if ingest_workers:
+        ingest_workers.stop(timeout=30)
     document_processor = app_state.get("document_processor")
     if document_processor:
-        document_processor.executor.shutdown(wait=True)
+        document_processor.shutdown()
+    vector_store = app_state.get("vector_store")
+    if vector_store and vector_store.embedding_service:
+        vector_store.embedding_service.shutdown()
+    if vector_store and vector_store.keyword_index:
+        vector_store.keyword_index.save()
+    rag_engine = app_state.get("rag_engine")
+    if rag_engine:
+        await rag_engine.aclose()
+    work_pools = app_state.get("work_pools")
+    if work_pools:
+        work_pools.shutdown()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -126,16 +303,23 @@ async def root():
 async def health_check():
     """健康检查"""
     try:
-        # 检查向量存储连接
+        # 检查向量存储连接（在线程池中执行并限时，避免健康检查被阻塞）
         vector_store = app_state.get("vector_store")
         if vector_store:
-            stats = vector_store.get_collection_stats()
-            vector_status = "healthy"
+            try:
+                await asyncio.wait_for(
+                    run_blocking("vector", vector_store.get_collection_stats),
+                    timeout=settings.health_check_timeout
+                )
+                vector_status = "healthy"
+            except Exception as e:
+                logger.warning(f"向量存储健康检查失败: {e!r}")
+                vector_status = "degraded"
         else:
             vector_status = "unavailable"
         
         return {
-            "status": "healthy",
+            "status": "healthy" if vector_status != "degraded" else "degraded",
             "components": {
                 "vector_store": vector_status,
                 "rag_engine": "healthy" if app_state.get("rag_engine") else "unavailable"
@@ -0,0 +1,183 @@
+"""
+语义回答缓存模块
+按 (嵌入模型, 公司过滤条件, 检索到的块ID集合) 分组缓存回答，组内以查询嵌入的余弦相似度匹配改写后的问题；
+贡献块所属文档被重新入库或删除时使相关条目失效
+"""
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.utils.lru_cache import LRUCache
+
+# 同一分组内最多保留的问题数
+MAX_ENTRIES_PER_KEY = 8
+
+CacheKey = Tuple[str, str, FrozenSet[str]]
+
+
+class _Entry:
+    __slots__ = ("embedding", "result", "generation_time")
+
+    def __init__(self, embedding: np.ndarray, result: Dict, generation_time: float):
+        self.embedding = embedding
+        self.result = result
+        self.generation_time = generation_time
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    return vector / (np.linalg.norm(vector) + 1e-12)
+
+
+class AnswerCache:
+    """基于查询嵌入相似度的回答缓存"""
+
+    def __init__(self, max_size: int = 512, ttl_seconds: Optional[float] = 3600, similarity_threshold: float = 0.95):
+        """
+        Args:
+            max_size: 分组数上限（LRU淘汰）
+            ttl_seconds: 条目有效期
+            similarity_threshold: 视为同一问题的最低余弦相似度
+        """
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._groups = LRUCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        # doc_id -> 引用该文档的分组键（用于失效）
+        self._doc_keys: Dict[str, Set[CacheKey]] = {}
+        # 失效序号：生成期间文档被失效时，不缓存基于旧内容的回答
+        self._epoch = 0
+        self._doc_epochs: Dict[str, int] = {}
+        # 进行中的请求：检索前的 epoch -> 请求数（早于其中最小值的失效记录可以清理）
+        self._in_flight: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        logger.info(f"初始化回答缓存 (max_size={max_size}, ttl={ttl_seconds}, threshold={similarity_threshold})")
+
+    @staticmethod
+    def make_key(model_name: str, company_filter: Optional[str], documents: List[Dict]) -> CacheKey:
+        return (
+            model_name or "",
+            company_filter or "",
+            frozenset(d.get("chunk_id") or "" for d in documents),
+        )
+
+    def get(self, key: CacheKey, embedding: np.ndarray) -> Optional[Dict]:
+        """查找相似问题的缓存回答，命中时返回结果副本（含 cached、saved_time）"""
+        entries = self._groups.get(key) or []
+        query = _unit(embedding)
+        best, best_score = None, -1.0
+        for entry in entries:
+            score = float(np.dot(entry.embedding, query))
+            if score > best_score:
+                best, best_score = entry, score
+
+        with self._lock:
+            if best is None or best_score < self.similarity_threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += best.generation_time
+        result = dict(best.result)
+        result["cached"] = True
+        result["saved_time"] = best.generation_time
+        result["similarity"] = round(best_score, 4)
+        return result
+
+    def current_epoch(self) -> int:
+        """检索前记录，写入时传给 put；请求结束时（无论是否写入）须调用 release"""
+        with self._lock:
+            self._in_flight[self._epoch] = self._in_flight.get(self._epoch, 0) + 1
+            return self._epoch
+
+    def release(self, epoch: int):
+        """结束 current_epoch() 登记的请求，并清理已无请求需要比较的失效记录"""
+        with self._lock:
+            remaining = self._in_flight.get(epoch, 0) - 1
+            if remaining > 0:
+                self._in_flight[epoch] = remaining
+            else:
+                self._in_flight.pop(epoch, None)
+            self._prune_epochs()
+
+    def _prune_epochs(self):
+        """失效记录只与检索早于它的进行中请求有关（调用方持有锁）"""
+        if not self._in_flight:
+            self._doc_epochs.clear()
+            return
+        oldest = min(self._in_flight)
+        for doc_id in [d for d, epoch in self._doc_epochs.items() if epoch <= oldest]:
+            del self._doc_epochs[doc_id]
+
+    def put(
+        self,
+        key: CacheKey,
+        embedding: np.ndarray,
+        doc_ids: Iterable[str],
+        result: Dict,
+        generation_time: float,
+        since_epoch: Optional[int] = None,
+    ):
+        """
+        缓存回答
+
+        Args:
+            doc_ids: 贡献块所属的文档
+            since_epoch: 检索前的 current_epoch()；此后有相关文档被失效时放弃写入
+        """
+        doc_ids = {doc_id for doc_id in doc_ids if doc_id}
+        entry = _Entry(_unit(embedding), dict(result), generation_time)
+        with self._lock:
+            if since_epoch is not None and any(self._doc_epochs.get(d, -1) > since_epoch for d in doc_ids):
+                return
+            entries = self._groups.get(key) or []
+            entries = (entries + [entry])[-MAX_ENTRIES_PER_KEY:]
+            self._groups.put(key, entries)
+            for doc_id in doc_ids:
+                self._doc_keys.setdefault(doc_id, set()).add(key)
+            if len(self._doc_keys) > 4 * max(self._groups.max_size, 1):
+                self._prune_index()
+
+    def _prune_index(self):
+        """清理已被LRU淘汰或过期的分组在索引中的引用（调用方持有锁）"""
+        live = {key for key, _ in self._groups.items()}
+        for doc_id in list(self._doc_keys):
+            keys = self._doc_keys[doc_id] & live
+            if keys:
+                self._doc_keys[doc_id] = keys
+            else:
+                del self._doc_keys[doc_id]
+
+    def invalidate_documents(self, doc_ids: Iterable[str]) -> int:
+        """使引用了这些文档的缓存条目失效，返回失效的分组数"""
+        removed = 0
+        with self._lock:
+            self._epoch += 1
+            for doc_id in set(doc_ids):
+                if self._in_flight:
+                    self._doc_epochs[doc_id] = self._epoch
+                for key in self._doc_keys.pop(doc_id, ()):
+                    if self._groups.pop(key) is not None:
+                        removed += 1
+        if removed:
+            logger.info(f"回答缓存失效 {removed} 组")
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+            self._doc_keys.clear()
+
+    def get_stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._groups),
+            "max_size": self._groups.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "similarity_threshold": self.similarity_threshold,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
@@ -0,0 +1,445 @@
+"""
+BM25关键词索引模块
+对文档块文本建立倒排索引（每个词的倒排表为可增长的NumPy数组），与向量检索结果按RRF融合，
+用于精确匹配会计科目、分部名称、数字等稠密检索容易遗漏的内容。
+
+增量更新：新增块直接追加到倒排表末尾；删除只做标记，标记比例过高时过滤倒排表（无需重新分词）。
+
+持久化（root_dir 下）:
+    meta.json               当前代数、词表、块ID、元数据（最后替换，作为快照的提交点）
+    postings[.<代数>].npz    快照的倒排表
+    wal.<代数>.jsonl        快照之后的变更日志（新增块的词频、删除的块ID）；加载时重放
+
+定期保存只追加变更日志；日志相对快照过大时才写入新一代快照。
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.services.local_index import match_where
+
+# 删除的块超过该比例时压缩倒排表
+COMPACT_RATIO = 0.3
+# 倒排表初始容量
+INITIAL_CAPACITY = 4
+# 变更日志涉及的块数超过快照块数的该比例（且不少于 CHECKPOINT_MIN_ROWS）时写入新快照
+CHECKPOINT_RATIO = 0.5
+CHECKPOINT_MIN_ROWS = 5000
+
+
+class BM25Index:
+    """可增量更新的BM25倒排索引"""
+
+    def __init__(
+        self,
+        tokenizer: Callable[[str], List[str]],
+        root_dir: Optional[str] = None,
+        k1: float = 1.2,
+        b: float = 0.75,
+        save_interval: float = 30.0,
+    ):
+        """
+        Args:
+            tokenizer: 分词函数（JapaneseTextChunker.tokenize）
+            root_dir: 持久化目录（为空则仅在内存中）
+            k1, b: BM25参数
+            save_interval: 有更新时两次自动保存之间的最短间隔（秒）
+        """
+        self.tokenizer = tokenizer
+        self.root_dir = Path(root_dir) if root_dir else None
+        self.k1 = k1
+        self.b = b
+        self.save_interval = save_interval
+
+        self._lock = threading.RLock()
+        self._term_ids: Dict[str, int] = {}
+        self._post_docs: List[np.ndarray] = []  # 每个词: 块序号 (int32)
+        self._post_tfs: List[np.ndarray] = []   # 每个词: 词频 (uint16)
+        self._post_len: List[int] = []
+        self._chunk_ids: List[str] = []
+        self._doc_len = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._metadatas: List[Dict] = []
+        self._num_of: Dict[str, int] = {}            # 块ID -> 块序号
+        self._doc_chunks: Dict[str, Set[int]] = {}   # doc_id -> 块序号
+        self._total_len = 0
+        self._dirty = False
+        self._last_save = time.monotonic()
+        # 持久化状态：快照代数、未写出的日志行、快照后日志涉及的块数
+        self._save_lock = threading.Lock()
+        self._generation = 0
+        self._wal_buffer: List[str] = []
+        self._wal_rows = 0
+        self._snapshot_rows = 0
+        self._needs_checkpoint = False
+
+        if self.root_dir is not None:
+            self.root_dir.mkdir(parents=True, exist_ok=True)
+            self._load()
+        logger.info(f"初始化BM25索引: {self.count()} 个块")
+
+    # ---------- 写入 ----------
+
+    def _append_posting(self, term: str, num: int, tf: int):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = self._term_ids[term] = len(self._post_docs)
+            self._post_docs.append(np.empty(INITIAL_CAPACITY, dtype=np.int32))
+            self._post_tfs.append(np.empty(INITIAL_CAPACITY, dtype=np.uint16))
+            self._post_len.append(0)
+        n = self._post_len[term_id]
+        if n == len(self._post_docs[term_id]):
+            # 容量翻倍
+            self._post_docs[term_id] = np.resize(self._post_docs[term_id], 2 * n)
+            self._post_tfs[term_id] = np.resize(self._post_tfs[term_id], 2 * n)
+        self._post_docs[term_id][n] = num
+        self._post_tfs[term_id][n] = min(tf, np.iinfo(np.uint16).max)
+        self._post_len[term_id] = n + 1
+
+    def add(self, ids: Sequence[str], texts: Sequence[str], metadatas: Optional[Sequence[Dict]] = None):
+        """添加块；已存在的块ID视为更新（旧内容被替换）"""
+        metadatas = metadatas or [{}] * len(ids)
+        # 同一批内重复的ID只保留最后一次
+        last = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        if len(last) < len(ids):
+            order = sorted(last.values())
+            ids, texts, metadatas = [ids[i] for i in order], [texts[i] for i in order], [metadatas[i] for i in order]
+        tokenized = [Counter(self.tokenizer(text)) for text in texts]
+        self._add_tokenized(list(ids), tokenized, list(metadatas))
+        self._maybe_save()
+
+    def _add_tokenized(self, ids: List[str], tokenized: List[Dict[str, int]], metadatas: List[Dict], log: bool = True):
+        with self._lock:
+            if log:
+                self._log({"op": "add", "ids": ids, "tokens": tokenized, "metadatas": metadatas}, len(ids))
+            self._remove_nums([self._num_of[i] for i in ids if i in self._num_of])
+            start = len(self._chunk_ids)
+            lengths = np.zeros(len(ids), dtype=np.int32)
+            for offset, (chunk_id, counts, metadata) in enumerate(zip(ids, tokenized, metadatas)):
+                num = start + offset
+                for term, tf in counts.items():
+                    self._append_posting(term, num, tf)
+                lengths[offset] = sum(counts.values())
+                metadata = dict(metadata or {})
+                self._chunk_ids.append(chunk_id)
+                self._metadatas.append(metadata)
+                self._num_of[chunk_id] = num
+                self._doc_chunks.setdefault(metadata.get("doc_id") or "", set()).add(num)
+            self._doc_len = np.concatenate([self._doc_len, lengths])
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._total_len += int(lengths.sum())
+            self._dirty = True
+
+    def _remove_nums(self, nums: List[int]):
+        for num in nums:
+            if not self._alive[num]:
+                continue
+            self._alive[num] = False
+            self._total_len -= int(self._doc_len[num])
+            self._num_of.pop(self._chunk_ids[num], None)
+            doc_id = self._metadatas[num].get("doc_id") or ""
+            chunks = self._doc_chunks.get(doc_id)
+            if chunks is not None:
+                chunks.discard(num)
+                if not chunks:
+                    del self._doc_chunks[doc_id]
+        if nums:
+            self._dirty = True
+
+    def delete(self, ids: Sequence[str]):
+        with self._lock:
+            self._delete_nums([self._num_of[i] for i in ids if i in self._num_of])
+        self._maybe_save()
+
+    def delete_document(self, doc_id: str):
+        """删除某文档的全部块"""
+        with self._lock:
+            self._delete_nums(sorted(self._doc_chunks.get(doc_id, ())))
+        self._maybe_save()
+
+    def _delete_nums(self, nums: List[int]):
+        if nums:
+            self._log({"op": "delete", "ids": [self._chunk_ids[num] for num in nums]}, len(nums))
+        self._remove_nums(nums)
+        self._maybe_compact()
+
+    def clear(self):
+        with self._lock:
+            # 清空后的状态由下一次保存写入新快照
+            self._wal_buffer, self._wal_rows = [], 0
+            self._needs_checkpoint = True
+            self._term_ids, self._post_docs, self._post_tfs, self._post_len = {}, [], [], []
+            self._chunk_ids, self._metadatas = [], []
+            self._doc_len = np.zeros(0, dtype=np.int32)
+            self._alive = np.zeros(0, dtype=bool)
+            self._num_of, self._doc_chunks = {}, {}
+            self._total_len = 0
+            self._dirty = True
+
+    def _maybe_compact(self):
+        total = len(self._chunk_ids)
+        if total and 1 - self._alive.sum() / total > COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        """去除已删除块的倒排项并重新编号"""
+        with self._lock:
+            keep = np.nonzero(self._alive)[0]
+            remap = np.full(len(self._chunk_ids), -1, dtype=np.int32)
+            remap[keep] = np.arange(len(keep), dtype=np.int32)
+
+            term_ids: Dict[str, int] = {}
+            post_docs, post_tfs, post_len = [], [], []
+            for term, term_id in self._term_ids.items():
+                n = self._post_len[term_id]
+                docs = remap[self._post_docs[term_id][:n]]
+                mask = docs >= 0
+                if not mask.any():
+                    continue
+                term_ids[term] = len(post_docs)
+                post_docs.append(docs[mask])
+                post_tfs.append(self._post_tfs[term_id][:n][mask])
+                post_len.append(int(mask.sum()))
+
+            self._term_ids, self._post_docs, self._post_tfs, self._post_len = term_ids, post_docs, post_tfs, post_len
+            self._chunk_ids = [self._chunk_ids[i] for i in keep]
+            self._metadatas = [self._metadatas[i] for i in keep]
+            self._doc_len = self._doc_len[keep]
+            self._alive = np.ones(len(keep), dtype=bool)
+            self._num_of = {chunk_id: num for num, chunk_id in enumerate(self._chunk_ids)}
+            self._doc_chunks = {}
+            for num, metadata in enumerate(self._metadatas):
+                self._doc_chunks.setdefault(metadata.get("doc_id") or "", set()).add(num)
+            self._dirty = True
+
+    # ---------- 检索 ----------
+
+    def search(self, query: str, n_results: int = 10, where: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """
+        BM25检索
+
+        Returns:
+            [(块ID, BM25得分)]，按得分降序
+        """
+        terms = set(self.tokenizer(query))
+        with self._lock:
+            n_docs = int(self._alive.sum())
+            if not terms or not n_docs:
+                return []
+            avg_len = max(self._total_len / n_docs, 1e-9)
+            norm = self.k1 * (1 - self.b + self.b * self._doc_len / avg_len)
+            scores = np.zeros(len(self._chunk_ids), dtype=np.float32)
+
+            for term in terms:
+                term_id = self._term_ids.get(term)
+                if term_id is None:
+                    continue
+                n = self._post_len[term_id]
+                docs = self._post_docs[term_id][:n]
+                tfs = self._post_tfs[term_id][:n].astype(np.float32)
+                live = self._alive[docs]
+                docs, tfs = docs[live], tfs[live]
+                df = len(docs)
+                if not df:
+                    continue
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                # 每个块在同一词的倒排表中只出现一次，可直接按下标累加
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+            candidates = np.nonzero(scores > 0)[0]
+            if where:
+                candidates = np.array(
+                    [num for num in candidates.tolist() if match_where(self._metadatas[num], where)], dtype=np.int64
+                )
+            if not len(candidates):
+                return []
+            k = min(n_results, len(candidates))
+            top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            return [(self._chunk_ids[num], float(scores[num])) for num in top.tolist()]
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._alive.sum())
+
+    # ---------- 持久化 ----------
+
+    def _log(self, entry: Dict, rows: int):
+        """记录一条变更（调用方持有锁；保存时写出）"""
+        if self.root_dir is None:
+            return
+        self._wal_buffer.append(json.dumps(entry, ensure_ascii=False))
+        self._wal_rows += rows
+
+    def _paths(self, generation: int) -> Tuple[Path, Path]:
+        """代数对应的快照倒排表与变更日志（第0代的倒排表沿用旧版本的文件名）"""
+        postings = "postings.npz" if generation == 0 else f"postings.{generation}.npz"
+        return self.root_dir / postings, self.root_dir / f"wal.{generation}.jsonl"
+
+    def _maybe_save(self):
+        if self.root_dir is not None and self._dirty and time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """
+        持久化到 root_dir：追加写出变更日志；日志相对快照过大（或索引被清空过）时写入新快照
+        """
+        if self.root_dir is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                checkpoint = self._needs_checkpoint or self._wal_rows > max(
+                    CHECKPOINT_MIN_ROWS, CHECKPOINT_RATIO * self._snapshot_rows
+                )
+                if checkpoint:
+                    self._checkpoint()
+                    return
+                lines, self._wal_buffer = self._wal_buffer, []
+                _, wal_path = self._paths(self._generation)
+                self._dirty = False
+                self._last_save = time.monotonic()
+            # 日志在锁外写出，不阻塞检索与写入；新的变更留在缓冲区等待下一次保存
+            if lines:
+                with open(wal_path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def _checkpoint(self):
+        """写入新一代快照（先压缩）；替换 meta.json 后切换，旧一代的倒排表与日志随后删除（调用方持有锁）"""
+        if self._alive.size and not self._alive.all():
+            self.compact()
+        offsets = np.zeros(len(self._post_len) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(self._post_len)
+        terms = sorted(self._term_ids, key=self._term_ids.get)
+        arrays = {
+            "offsets": offsets,
+            "docs": np.concatenate([d[:n] for d, n in zip(self._post_docs, self._post_len)]) if terms else np.empty(0, np.int32),
+            "tfs": np.concatenate([t[:n] for t, n in zip(self._post_tfs, self._post_len)]) if terms else np.empty(0, np.uint16),
+            "doc_len": self._doc_len,
+        }
+        generation = self._generation + 1
+        meta = {"generation": generation, "terms": terms, "chunk_ids": self._chunk_ids, "metadatas": self._metadatas}
+
+        postings_path, _ = self._paths(generation)
+        tmp_meta = self.root_dir / "meta.json.tmp"
+        with open(postings_path, "wb") as f:
+            np.savez(f, **arrays)
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        tmp_meta.replace(self.root_dir / "meta.json")
+
+        self._generation = generation
+        self._remove_stale_files()
+        self._wal_buffer, self._wal_rows = [], 0
+        self._snapshot_rows = len(self._chunk_ids)
+        self._needs_checkpoint = False
+        self._dirty = False
+        self._last_save = time.monotonic()
+        logger.info(f"BM25索引快照写入完成: {self._snapshot_rows} 个块（第 {generation} 代）")
+
+    def _remove_stale_files(self):
+        """删除当前代以外的倒排表与变更日志"""
+        current = set(self._paths(self._generation))
+        for path in list(self.root_dir.glob("postings*.npz")) + list(self.root_dir.glob("wal.*.jsonl")):
+            if path not in current:
+                path.unlink(missing_ok=True)
+
+    def _load(self):
+        meta_path = self.root_dir / "meta.json"
+        if meta_path.exists():
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                generation = meta.get("generation", 0)
+                with np.load(self._paths(generation)[0]) as data:
+                    offsets, docs, tfs, doc_len = data["offsets"], data["docs"], data["tfs"], data["doc_len"]
+                if len(doc_len) != len(meta["chunk_ids"]) or len(offsets) != len(meta["terms"]) + 1:
+                    raise ValueError("索引文件不一致")
+            except Exception as e:
+                # 由 sync_keyword_index 重建，重建后写入新快照
+                logger.warning(f"BM25索引加载失败，将重新构建: {e}")
+                self._needs_checkpoint = True
+                return
+            self._generation = generation
+            self._term_ids = {term: i for i, term in enumerate(meta["terms"])}
+            self._post_docs = [docs[offsets[i]:offsets[i + 1]].copy() for i in range(len(meta["terms"]))]
+            self._post_tfs = [tfs[offsets[i]:offsets[i + 1]].copy() for i in range(len(meta["terms"]))]
+            self._post_len = np.diff(offsets).tolist()
+            self._chunk_ids = meta["chunk_ids"]
+            self._metadatas = meta["metadatas"]
+            self._doc_len = doc_len.astype(np.int32)
+            self._alive = np.ones(len(self._chunk_ids), dtype=bool)
+            self._total_len = int(self._doc_len.sum())
+            self._num_of = {chunk_id: num for num, chunk_id in enumerate(self._chunk_ids)}
+            for num, metadata in enumerate(self._metadatas):
+                self._doc_chunks.setdefault(metadata.get("doc_id") or "", set()).add(num)
+            self._snapshot_rows = len(self._chunk_ids)
+
+        self._remove_stale_files()
+        self._replay_wal()
+
+    def _replay_wal(self):
+        """重放快照之后的变更日志（末尾不完整的一行视为写入中断并截断）"""
+        _, wal_path = self._paths(self._generation)
+        if not wal_path.exists():
+            return
+        valid_bytes = 0
+        entries = 0
+        with open(wal_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if entry["op"] == "add":
+                    self._add_tokenized(entry["ids"], entry["tokens"], entry["metadatas"], log=False)
+                    self._wal_rows += len(entry["ids"])
+                elif entry["op"] == "delete":
+                    self._remove_nums([self._num_of[i] for i in entry["ids"] if i in self._num_of])
+                    self._wal_rows += len(entry["ids"])
+                valid_bytes += len(line)
+                entries += 1
+        if valid_bytes < wal_path.stat().st_size:
+            with open(wal_path, "r+b") as f:
+                f.truncate(valid_bytes)
+        self._dirty = False
+        logger.info(f"BM25索引重放变更日志 {entries} 条")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "chunks": int(self._alive.sum()),
+                "rows": len(self._chunk_ids),
+                "terms": len(self._term_ids),
+                "postings": int(sum(self._post_len)),
+                "avg_chunk_tokens": round(self._total_len / max(int(self._alive.sum()), 1), 1),
+            }
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合：score(d) = Σ 1 / (k + rank)，rank 从1开始
+
+    Args:
+        rankings: 多个按相关度排序的ID列表
+        k: 平滑常数
+
+    Returns:
+        [(ID, 融合得分)]，按得分降序
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
@@ -0,0 +1,238 @@
+"""
+公司目录模块
+由EDINET元数据（每日书类一览、EDINETコードリスト）构建，将 EDINETコード、证券代码、
+规范化后的日文名/英文名/读音及别名映射到 EDINETコード。
+
+检索时 company_filter 先在目录中解析为 EDINETコード，向量库按 edinet_code 等值过滤，
+不再对块元数据做子串匹配。
+"""
+import csv
+import re
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger
+
+# 名称规范化时去除的法人格表记
+_CORPORATE_FORMS = [
+    "株式会社", "有限会社", "合同会社", "合資会社", "合名会社", "(株)", "(有)",
+    "kabushikikaisha", "kabushiki kaisha", "co.,ltd.", "co., ltd.", "co.ltd.", "co.,ltd", "co., ltd",
+    "corporation", "corp.", "inc.", "ltd.", "limited",
+]
+_EDINET_CODE_RE = re.compile(r"^[EG]\d{5}$")
+_SEC_CODE_RE = re.compile(r"^[0-9][0-9A-Z]{3}0?$")
+# 部分一致解析时返回的公司数上限
+MAX_PARTIAL_MATCHES = 20
+
+
+def normalize_name(name: str) -> str:
+    """NFKC、小写、去掉法人格与空白/标点"""
+    text = unicodedata.normalize("NFKC", name or "").lower()
+    for form in _CORPORATE_FORMS:
+        text = text.replace(form, "")
+    return re.sub(r"[\s・,.\-_()'\"&]+", "", text)
+
+
+def _normalize_sec_code(sec_code: Optional[str]) -> str:
+    """EDINET的证券代码为5位（末尾校验位0），统一为4位"""
+    code = unicodedata.normalize("NFKC", sec_code or "").strip().upper()
+    return code[:4] if len(code) == 5 and code.endswith("0") else code
+
+
+class CompanyDirectory:
+    """公司目录（SQLite持久化，别名表常驻内存）"""
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS companies ("
+            " edinet_code TEXT PRIMARY KEY,"
+            " name TEXT NOT NULL,"
+            " name_en TEXT,"
+            " name_kana TEXT,"
+            " sec_code TEXT);"
+            "CREATE TABLE IF NOT EXISTS aliases ("
+            " alias TEXT NOT NULL,"
+            " edinet_code TEXT NOT NULL,"
+            " PRIMARY KEY (alias, edinet_code));"
+            "CREATE TABLE IF NOT EXISTS filings ("
+            " doc_id TEXT PRIMARY KEY,"
+            " edinet_code TEXT NOT NULL);"
+        )
+        self._conn.commit()
+        # 规范化别名 -> EDINETコード集合；证券代码 -> EDINETコード
+        self._aliases: Dict[str, set] = {}
+        self._sec_codes: Dict[str, str] = {}
+        self._names: Dict[str, str] = {}
+        for edinet_code, name, sec_code in self._conn.execute("SELECT edinet_code, name, sec_code FROM companies"):
+            self._names[edinet_code] = name
+            if sec_code:
+                self._sec_codes[sec_code] = edinet_code
+        for alias, edinet_code in self._conn.execute("SELECT alias, edinet_code FROM aliases"):
+            self._aliases.setdefault(alias, set()).add(edinet_code)
+        logger.info(f"初始化公司目录: {len(self._names)} 家公司")
+
+    # ---------- 写入 ----------
+
+    def upsert_company(
+        self,
+        edinet_code: str,
+        name: str,
+        sec_code: Optional[str] = None,
+        name_en: Optional[str] = None,
+        name_kana: Optional[str] = None,
+        aliases: Iterable[str] = (),
+    ):
+        """登记公司；已有记录时仅用非空字段覆盖"""
+        self.upsert_companies([{
+            "edinet_code": edinet_code, "name": name, "sec_code": sec_code,
+            "name_en": name_en, "name_kana": name_kana, "aliases": list(aliases),
+        }])
+
+    def upsert_companies(self, companies: Iterable[Dict]):
+        rows, alias_rows = [], []
+        for company in companies:
+            edinet_code = (company.get("edinet_code") or "").strip()
+            name = (company.get("name") or "").strip()
+            if not edinet_code or not name:
+                continue
+            sec_code = _normalize_sec_code(company.get("sec_code")) or None
+            rows.append((edinet_code, name, company.get("name_en") or None, company.get("name_kana") or None, sec_code))
+            names = [name, company.get("name_en"), company.get("name_kana"), *company.get("aliases", ())]
+            for alias in {normalize_name(n) for n in names if n}:
+                if alias:
+                    alias_rows.append((alias, edinet_code))
+        if not rows:
+            return
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO companies (edinet_code, name, name_en, name_kana, sec_code) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(edinet_code) DO UPDATE SET"
+                " name = excluded.name,"
+                " name_en = COALESCE(excluded.name_en, name_en),"
+                " name_kana = COALESCE(excluded.name_kana, name_kana),"
+                " sec_code = COALESCE(excluded.sec_code, sec_code)",
+                rows,
+            )
+            self._conn.executemany("INSERT OR IGNORE INTO aliases (alias, edinet_code) VALUES (?, ?)", alias_rows)
+            self._conn.commit()
+            for edinet_code, name, _, _, sec_code in rows:
+                self._names[edinet_code] = name
+                if sec_code:
+                    self._sec_codes[sec_code] = edinet_code
+            for alias, edinet_code in alias_rows:
+                self._aliases.setdefault(alias, set()).add(edinet_code)
+
+    def add_filings(self, items: Iterable[Dict]):
+        """从每日书类一览（原始results）登记提出者与 docID -> EDINETコード"""
+        companies, filings = {}, []
+        for item in items:
+            edinet_code = item.get("edinetCode")
+            if not edinet_code:
+                continue
+            if item.get("filerName"):
+                companies[edinet_code] = {
+                    "edinet_code": edinet_code, "name": item["filerName"], "sec_code": item.get("secCode"),
+                }
+            if item.get("docID"):
+                filings.append((item["docID"], edinet_code))
+        self.upsert_companies(companies.values())
+        if filings:
+            with self._lock:
+                self._conn.executemany("INSERT OR REPLACE INTO filings (doc_id, edinet_code) VALUES (?, ?)", filings)
+                self._conn.commit()
+
+    def import_code_list(self, csv_path: str) -> int:
+        """
+        导入金融厅公开的EDINETコードリスト（EdinetcodeDlInfo.csv，cp932，首行为下载信息）
+
+        Returns:
+            导入的公司数
+        """
+        with open(csv_path, "r", encoding="cp932", errors="replace", newline="") as f:
+            lines = f.read().splitlines()
+        # 跳过表头前的说明行
+        start = next((i for i, line in enumerate(lines) if "ＥＤＩＮＥＴコード" in line or "EDINETコード" in line), 0)
+        companies = []
+        for row in csv.DictReader(lines[start:]):
+            row = {unicodedata.normalize("NFKC", k or ""): v for k, v in row.items()}
+            companies.append({
+                "edinet_code": row.get("EDINETコード"),
+                "name": row.get("提出者名"),
+                "name_en": row.get("提出者名(英字)"),
+                "name_kana": row.get("提出者名(ヨミ)"),
+                "sec_code": row.get("証券コード"),
+            })
+        self.upsert_companies(companies)
+        logger.info(f"导入EDINETコードリスト: {len(companies)} 家公司")
+        return len(companies)
+
+    # ---------- 查询 ----------
+
+    def resolve(self, query: str, limit: int = MAX_PARTIAL_MATCHES) -> List[str]:
+        """
+        将公司过滤条件解析为EDINETコード列表
+
+        依次尝试：EDINETコード → 证券代码 → 规范化名称/别名完全一致 → 前方一致 → 部分一致
+        """
+        text = unicodedata.normalize("NFKC", query or "").strip()
+        if not text:
+            return []
+        upper = text.upper()
+        if _EDINET_CODE_RE.match(upper):
+            return [upper] if upper in self._names else []
+        if _SEC_CODE_RE.match(upper):
+            edinet_code = self._sec_codes.get(_normalize_sec_code(upper))
+            if edinet_code:
+                return [edinet_code]
+
+        alias = normalize_name(text)
+        if not alias:
+            return []
+        exact = self._aliases.get(alias)
+        if exact:
+            return sorted(exact)[:limit]
+
+        prefix, partial = set(), set()
+        with self._lock:
+            for name, codes in self._aliases.items():
+                if name.startswith(alias):
+                    prefix |= codes
+                elif alias in name:
+                    partial |= codes
+        return (sorted(prefix) + sorted(partial - prefix))[:limit]
+
+    def get_name(self, edinet_code: str) -> Optional[str]:
+        return self._names.get(edinet_code)
+
+    def get_company(self, edinet_code: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT edinet_code, name, name_en, name_kana, sec_code FROM companies WHERE edinet_code = ?",
+                (edinet_code,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("edinet_code", "name", "name_en", "name_kana", "sec_code"), row))
+
+    def lookup_filing(self, doc_id: str) -> Optional[str]:
+        """docID -> 提出者的EDINETコード"""
+        with self._lock:
+            row = self._conn.execute("SELECT edinet_code FROM filings WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            (filings,) = self._conn.execute("SELECT COUNT(*) FROM filings").fetchone()
+        return {"companies": len(self._names), "aliases": len(self._aliases), "filings": filings}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -2,19 +2,354 @@
 文档处理器模块
 用于处理EDINET文档并将其转换为可索引的格式
 """
-from typing import List, Dict, Optional
+from typing import Callable, Iterable, List, Dict, Optional, Tuple, Union
 from loguru import logger
-from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
+import hashlib
+import itertools
+import multiprocessing
+import threading
 import tempfile
+import queue
 import re
 import os
+import shutil
+
+from app.core.edinet_client import MEMBER_IXBRL
+from app.core.section_extractor import extract_fragment_sections, extract_html_sections, section_title
+from app.services.fact_store import FactBatchWriter
+
+
+def extract_xbrl_content(xbrl_parser, file_path) -> Tuple[List[Dict], List[Dict]]:
+    """
+    从XBRL实例或内联XBRL（.htm）中提取章节记录与数值事实（流式解析事实，单次遍历）
+
+    Returns:
+        ([{"section", "heading_path", "text"}], 数值事实列表)；正文过短时章节记录为空
+    """
+    try:
+        numeric_facts: List[Dict] = []
+        sections = _extract_file(xbrl_parser, file_path, numeric_facts.append)
+        return (sections if _sections_length(sections) > 100 else []), numeric_facts
+
+    except Exception as e:
+        logger.error(f"XBRL文本提取失败: {e}")
+        return [], []
+
+
+class FactCollector:
+    """
+    汇总文档的数值事实：只保留事实数与实体标识的计数，给出 fact_dir 时按批暂存供写入事实存储
+
+    同一文档的多个成员在线程中并行解析，add 可并发调用
+    """
+
+    def __init__(self, fact_dir: Optional[str] = None):
+        self.writer = FactBatchWriter(fact_dir) if fact_dir else None
+        self.count = 0
+        self._entities: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, fact: Dict):
+        with self._lock:
+            self.count += 1
+            self._entities[fact.get("entity") or ""] += 1
+            if self.writer is not None:
+                self.writer.add(fact)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def entity_code(self) -> str:
+        """提出者的EDINET代码（取出现最多的实体标识，无法识别时为空）"""
+        return _most_common_code(self._entities)
+
+
+def extract_members_content(
+    xbrl_parser, members: Iterable[Dict], max_workers: int = 4, facts: Optional[FactCollector] = None
+) -> List[Dict]:
+    """
+    并行解析文档的ZIP成员（members 可为边解压边产出的迭代器，成员到达即提交解析）
+
+    线程池使解析与解压、下载重叠进行（I/O并行）；解析本身受GIL限制，
+    多个文档之间的CPU并行由解析进程池（parse_workers）提供。
+
+    实例文档提供数值事实（边解析边交给 facts，不在内存中累积）；存在内联XBRL页面时
+    正文取自页面（按页面顺序），实例中重复的textBlock文本不再使用。
+
+    Returns:
+        章节记录；正文过短时为空
+    """
+    instance_sections: List[Dict] = []
+    page_sections: List[Dict] = []
+    on_fact = facts.add if facts is not None else None
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [
+            (member["role"], member["path"], executor.submit(_extract_file, xbrl_parser, member["path"], on_fact))
+            for member in members
+        ]
+        for role, path, future in futures:
+            try:
+                sections = future.result()
+            except Exception as e:
+                logger.error(f"成员解析失败 {path}: {e}")
+                continue
+            (page_sections if role == MEMBER_IXBRL else instance_sections).extend(sections)
+
+    if facts is not None:
+        facts.close()
+    sections = page_sections or instance_sections
+    return sections if _sections_length(sections) > 100 else []
+
+
+def _extract_file(xbrl_parser, file_path, on_fact: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """解析单个文件，返回（未做长度过滤的）章节记录；数值事实逐条交给 on_fact"""
+    if Path(file_path).suffix.lower() in (".htm", ".html", ".xhtml"):
+        return extract_html_sections(file_path)
+
+    sections = []
+    plain = []
+    for fact in xbrl_parser.iter_facts(file_path):
+        # 数值事实（带unitRef）由财务数据处理，这里只保留文本
+        if fact["unit_ref"]:
+            if on_fact is not None:
+                on_fact(fact)
+            continue
+        if not fact["value"]:
+            continue
+        # textBlock中为转义的HTML，按其中的标题与段落切分
+        if fact["element"].endswith("TextBlock"):
+            sections.extend(extract_fragment_sections(fact["value"], section_title(fact["element"])))
+            continue
+        text = re.sub(r'\s+', ' ', fact["value"]).strip()
+        if text:
+            plain.append(text)
+
+    if plain:
+        text = re.sub(r'[^\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF\u0020-\u007E\u3000-\u303F\uFF00-\uFFEF\n。、]+', ' ', "\n\n".join(plain))
+        sections.insert(0, {"section": "", "heading_path": [], "text": text})
+
+    return sections
+
+
+# 实例上下文中的实体标识（E00001-000）
+_ENTITY_CODE_RE = re.compile(r"^([EG]\d{5})-\d{3}$")
+
+
+def entity_edinet_code(numeric_facts: Iterable[Dict]) -> str:
+    """从数值事实的实体标识取提出者的EDINET代码（取出现最多的一个，无法识别时为空）"""
+    return _most_common_code(Counter(fact.get("entity") or "" for fact in numeric_facts))
+
+
+def _most_common_code(entities: Counter) -> str:
+    codes = Counter()
+    for entity, n in entities.items():
+        match = _ENTITY_CODE_RE.match(entity)
+        if match:
+            codes[match.group(1)] += n
+    return codes.most_common(1)[0][0] if codes else ""
+
+
+def _sections_length(sections: List[Dict]) -> int:
+    return sum(len(record["text"]) for record in sections)
+
+
+def create_chunks(doc_id: str, company_name: str, text_content: Union[str, List[Dict]]) -> List[Dict]:
+    """创建文档块（text_content 为章节记录时按章节分块，块不跨章节）"""
+    if not isinstance(text_content, str):
+        return assign_chunk_ids(doc_id, create_section_chunks(doc_id, company_name, text_content))
+    chunks = []
+
+    # 按段落或固定长度分割
+    chunk_size = 500
+    overlap = 50
+
+    # 首先尝试按段落分割
+    paragraphs = re.split(r'\n\s*\n', text_content)
+
+    current_chunk = ""
+
+    for para in paragraphs:
+        para = para.strip()
+        if not para:
+            continue
+
+        if len(current_chunk) + len(para) > chunk_size:
+            if current_chunk:
+                chunks.append({
+                    "doc_id": doc_id,
+                    "company_name": company_name,
+                    "text": current_chunk,
+                    "type": "text",
+                    "section": "",
+                    "filing_date": ""
+                })
+
+                # 保留重叠部分
+                overlap_text = current_chunk[-overlap:] if len(current_chunk) > overlap else ""
+                current_chunk = overlap_text + " " + para
+            else:
+                current_chunk = para
+        else:
+            current_chunk += " " + para if current_chunk else para
+
+    # 处理最后一个块
+    if current_chunk and len(current_chunk) > 50:
+        chunks.append({
+            "doc_id": doc_id,
+            "company_name": company_name,
+            "text": current_chunk,
+            "type": "text",
+            "section": "",
+            "filing_date": ""
+        })
+
+    # 如果分块太少，使用固定长度分割
+    if len(chunks) < 3 and len(text_content) > chunk_size:
+        chunks = []
+        for i in range(0, len(text_content), chunk_size - overlap):
+            chunk_text = text_content[i:i + chunk_size]
+            if len(chunk_text) > 50:
+                chunks.append({
+                    "doc_id": doc_id,
+                    "company_name": company_name,
+                    "text": chunk_text,
+                    "type": "text",
+                    "section": "",
+                    "filing_date": ""
+                })
+
+    return assign_chunk_ids(doc_id, chunks)
+
+
+def create_section_chunks(
+    doc_id: str, company_name: str, sections: List[Dict], chunk_size: int = 500, overlap: int = 50
+) -> List[Dict]:
+    """
+    按章节记录分块：段落在章节内合并到 chunk_size，重叠只在同一章节内保留，
+    超长段落按固定长度切开；块带 section 与标题路径 heading
+    """
+    chunks = []
+    for record in sections:
+        section = record.get("section", "")
+        heading = " > ".join(record.get("heading_path") or [])
+
+        def add(text: str):
+            if len(text) > 50:
+                chunks.append({
+                    "doc_id": doc_id,
+                    "company_name": company_name,
+                    "text": text,
+                    "type": "text",
+                    "section": section,
+                    "heading": heading,
+                    "filing_date": ""
+                })
+
+        current = ""
+        for para in re.split(r'\n\s*\n', record.get("text", "")):
+            para = para.strip()
+            for start in range(0, len(para), chunk_size):
+                piece = para[start:start + chunk_size]
+                if current and len(current) + len(piece) > chunk_size:
+                    add(current)
+                    current = current[-overlap:] + " " + piece
+                else:
+                    current = current + " " + piece if current else piece
+        if current:
+            add(current)
+    return chunks
+
+
+def assign_chunk_ids(doc_id: str, chunks: List[Dict]) -> List[Dict]:
+    """
+    按内容生成块ID（doc_id + 文本摘要，文档内重复文本追加序号）
+
+    修订后重新入库时未变化的块保持同一ID，只需处理新增或变化的块
+    """
+    seen: Dict[str, int] = {}
+    for chunk in chunks:
+        digest = hashlib.blake2b(chunk["text"].encode("utf-8"), digest_size=6).hexdigest()
+        n = seen.get(digest, 0)
+        seen[digest] = n + 1
+        chunk["chunk_id"] = f"{doc_id}_{digest}" if n == 0 else f"{doc_id}_{digest}_{n}"
+    return chunks
+
+
+def _notify(on_progress: Optional[Callable], doc_id: str, stage: str):
+    """调用阶段回调（回调出错不影响处理）"""
+    if on_progress is None:
+        return
+    try:
+        on_progress(doc_id, stage)
+    except Exception as e:
+        logger.warning(f"进度回调失败 {doc_id}: {e}")
+
+
+# 解析子进程内复用的XBRL解析器（不带事实存储，数值事实暂存到 fact_dir 后由主进程写入）
+_worker_parser = None
+
+
+def parse_and_chunk(
+    doc_id: str,
+    company_name: str,
+    members: Optional[Iterable[Dict]],
+    fallback_text: str = "",
+    xbrl_parser=None,
+    member_workers: int = 4,
+    fact_dir: Optional[str] = None
+) -> Dict:
+    """
+    解析ZIP成员并分块（CPU密集阶段，可在子进程中运行）
+
+    Args:
+        members: 成员 [{"role", "path"}]；在子进程中运行时为已解压的列表，
+            在下载线程中运行时可为边解压边产出的迭代器。没有成员时使用 fallback_text
+        fact_dir: 数值事实的暂存目录（FactBatchWriter 按批写入）；为空时只计数
+
+    Returns:
+        {"doc_id", "chunks", "entity_code", "fact_count", "error"}（数值事实不经进程间传回）
+    """
+    global _worker_parser
+    if xbrl_parser is None:
+        if _worker_parser is None:
+            from app.core.xbrl_parser import XBRLParser
+            _worker_parser = XBRLParser()
+        xbrl_parser = _worker_parser
+
+    paths: List = []
+
+    def tracked():
+        for member in members or ():
+            paths.append(member["path"])
+            yield member
+
+    facts = FactCollector(fact_dir)
+    text_content = extract_members_content(xbrl_parser, tracked(), member_workers, facts)
+    for path in paths:
+        os.remove(path)
+    if not paths:
+        text_content = fallback_text
+
+    result = {"doc_id": doc_id, "chunks": [], "entity_code": facts.entity_code(), "fact_count": facts.count, "error": None}
+    if not text_content:
+        return {**result, "error": "无法提取文本内容"}
+
+    chunks = create_chunks(doc_id, company_name, text_content)
+    if not chunks:
+        return {**result, "error": "分块为空"}
+
+    return {**result, "chunks": chunks}
 
 
 class DocumentProcessor:
     """文档处理器"""
 
-    def __init__(self, edinet_client, xbrl_parser, text_chunker, vector_store, config: Dict):
+    def __init__(self, edinet_client, xbrl_parser, text_chunker, vector_store, config: Dict, company_directory=None):
         """
         初始化文档处理器
 
@@ -24,24 +359,41 @@ class DocumentProcessor:
             text_chunker: 文本分块器
             vector_store: 向量存储管理器
             config: 配置字典
+            company_directory: 公司目录（可选，用于给块标注 edinet_code）
         """
         self.edinet_client = edinet_client
         self.xbrl_parser = xbrl_parser
         self.text_chunker = text_chunker
         self.vector_store = vector_store
         self.config = config
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.company_directory = company_directory
+
+        # 流水线配置：下载（线程）→ 解析分块（进程）→ 跨文档批量嵌入与存储
+        self.download_workers = config.get("download_workers", 4)
+        self.parse_workers = config.get("parse_workers", os.cpu_count() or 1)
+        self.embed_batch_size = config.get("embed_batch_size", 256)
+        self.embed_max_wait = config.get("embed_max_wait", 0.5)
+        self.max_in_flight = config.get("max_in_flight", 32)
+        # 单个文档内并行解析ZIP成员（实例与各内联XBRL页面）的线程数
+        self.member_workers = config.get("member_workers", 4)
+
+        self.executor = ThreadPoolExecutor(max_workers=self.download_workers)
+        self._parse_executor: Optional[ProcessPoolExecutor] = None
+        # 多个入库工作线程可能同时调用 process_batch，进程池只创建一次
+        self._parse_executor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
         self._processed_count = 0
         self._failed_count = 0
         logger.info("初始化文档处理器")
 
-    def process_document(self, doc_id: str, company_name: str = "") -> Dict:
+    def process_document(self, doc_id: str, company_name: str = "", on_progress: Optional[Callable] = None) -> Dict:
         """
         处理单个文档
 
         Args:
             doc_id: 文档ID
             company_name: 公司名称（可选）
+            on_progress: 阶段回调 on_progress(doc_id, "downloading" | "embedding")
 
         Returns:
             处理结果
@@ -50,24 +402,29 @@ class DocumentProcessor:
             logger.info(f"处理文档: {doc_id}")
 
             # 1. 下载文档
+            _notify(on_progress, doc_id, "downloading")
             with tempfile.TemporaryDirectory() as temp_dir:
-                file_path = self.edinet_client.download_document(
+                members = self.edinet_client.iter_document_members(
                     doc_id=doc_id,
                     save_dir=Path(temp_dir),
                     file_type="1"  # XBRL
                 )
+                first = next(members, None)
+                entity_code = ""
 
-                if not file_path:
+                if first is None:
                     # XBRL不可用，尝试下载PDF并提取文本
                     logger.warning(f"XBRL下载失败，尝试获取文档概要")
                     text_content = self._get_document_summary(doc_id)
                 else:
-                    # 2. 读取XBRL内容
-                    text_content = self._extract_text_from_xbrl(file_path)
+                    # 2. 边解压边解析实例与内联XBRL页面
+                    text_content, entity_code = self._extract_members(
+                        itertools.chain([first], members), doc_id, Path(temp_dir) / "facts"
+                    )
 
                 if not text_content:
                     logger.warning(f"文档 {doc_id} 无法提取文本内容")
-                    self._failed_count += 1
+                    self._record(success=False)
                     return {
                         "doc_id": doc_id,
                         "status": "failed",
@@ -79,7 +436,7 @@ class DocumentProcessor:
 
                 if not chunks:
                     logger.warning(f"文档 {doc_id} 分块为空")
-                    self._failed_count += 1
+                    self._record(success=False)
                     return {
                         "doc_id": doc_id,
                         "status": "failed",
@@ -87,10 +444,12 @@ class DocumentProcessor:
                     }
 
                 # 4. 存储到向量数据库
+                _notify(on_progress, doc_id, "embedding")
+                self._tag_company(chunks, doc_id, entity_code)
                 success = self.vector_store.add_documents(chunks)
 
                 if success:
-                    self._processed_count += 1
+                    self._record(success=True)
                     logger.info(f"文档 {doc_id} 处理成功，创建了 {len(chunks)} 个块")
                     return {
                         "doc_id": doc_id,
@@ -98,7 +457,7 @@ class DocumentProcessor:
                         "chunks_created": len(chunks)
                     }
                 else:
-                    self._failed_count += 1
+                    self._record(success=False)
                     return {
                         "doc_id": doc_id,
                         "status": "failed",
@@ -107,31 +466,36 @@ class DocumentProcessor:
 
         except Exception as e:
             logger.error(f"文档处理失败 {doc_id}: {e}")
-            self._failed_count += 1
+            self._record(success=False)
             return {
                 "doc_id": doc_id,
                 "status": "failed",
                 "error": str(e)
             }
 
-    def _extract_text_from_xbrl(self, file_path: Path) -> str:
-        """从XBRL文件中提取文本内容"""
+    def _extract_members(self, members: Iterable[Dict], doc_id: str, fact_dir: Path) -> Tuple[List[Dict], str]:
+        """并行解析ZIP成员，返回章节记录与实例中的提出者EDINET代码（数值事实按批暂存后写入事实存储）"""
+        fact_dir = str(fact_dir) if self._fact_store() is not None else None
+        facts = FactCollector(fact_dir)
+        sections = extract_members_content(self.xbrl_parser, members, self.member_workers, facts)
+        self._store_facts(doc_id, facts.count, fact_dir)
+        return sections, facts.entity_code()
+
+    def _fact_store(self):
+        return getattr(self.xbrl_parser, "fact_store", None)
+
+    def _store_facts(self, doc_id: str, fact_count: int, fact_dir: Optional[str]):
+        """将暂存的数值事实写入事实存储（没有数值事实的文档不替换已有数据）"""
+        fact_store = self._fact_store()
+        if fact_store is None or not fact_dir:
+            return
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # 移除XML标签，保留文本
-            text = re.sub(r'<[^>]+>', ' ', content)
-            # 清理多余空白
-            text = re.sub(r'\s+', ' ', text).strip()
-            # 移除非文本内容
-            text = re.sub(r'[^\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF\u0020-\u007E\u3000-\u303F\uFF00-\uFFEF\n。、]+', ' ', text)
-
-            return text if len(text) > 100 else ""
-
+            if fact_count:
+                fact_store.add_staged(doc_id, fact_dir)
         except Exception as e:
-            logger.error(f"XBRL文本提取失败: {e}")
-            return ""
+            logger.error(f"写入财务事实失败 {doc_id}: {e}")
+        finally:
+            shutil.rmtree(fact_dir, ignore_errors=True)
 
     def _get_document_summary(self, doc_id: str) -> str:
         """获取文档概要信息（当XBRL不可用时）"""
@@ -143,95 +507,231 @@ class DocumentProcessor:
             logger.error(f"获取文档概要失败: {e}")
             return ""
 
-    def _create_chunks(self, doc_id: str, company_name: str, text_content: str) -> List[Dict]:
+    def _create_chunks(self, doc_id: str, company_name: str, text_content: Union[str, List[Dict]]) -> List[Dict]:
         """创建文档块"""
-        chunks = []
-
-        # 按段落或固定长度分割
-        chunk_size = 500
-        overlap = 50
-
-        # 首先尝试按段落分割
-        paragraphs = re.split(r'\n\s*\n', text_content)
-
-        current_chunk = ""
-        chunk_index = 0
+        return create_chunks(doc_id, company_name, text_content)
 
-        for para in paragraphs:
-            para = para.strip()
-            if not para:
-                continue
-
-            if len(current_chunk) + len(para) > chunk_size:
-                if current_chunk:
-                    chunks.append({
-                        "chunk_id": f"{doc_id}_{chunk_index}",
-                        "doc_id": doc_id,
-                        "company_name": company_name,
-                        "text": current_chunk,
-                        "type": "text",
-                        "section": "",
-                        "filing_date": ""
-                    })
-                    chunk_index += 1
-
-                    # 保留重叠部分
-                    overlap_text = current_chunk[-overlap:] if len(current_chunk) > overlap else ""
-                    current_chunk = overlap_text + " " + para
-                else:
-                    current_chunk = para
-            else:
-                current_chunk += " " + para if current_chunk else para
-
-        # 处理最后一个块
-        if current_chunk and len(current_chunk) > 50:
-            chunks.append({
-                "chunk_id": f"{doc_id}_{chunk_index}",
-                "doc_id": doc_id,
-                "company_name": company_name,
-                "text": current_chunk,
-                "type": "text",
-                "section": "",
-                "filing_date": ""
-            })
-
-        # 如果分块太少，使用固定长度分割
-        if len(chunks) < 3 and len(text_content) > chunk_size:
-            chunks = []
-            for i in range(0, len(text_content), chunk_size - overlap):
-                chunk_text = text_content[i:i + chunk_size]
-                if len(chunk_text) > 50:
-                    chunks.append({
-                        "chunk_id": f"{doc_id}_{i // (chunk_size - overlap)}",
-                        "doc_id": doc_id,
-                        "company_name": company_name,
-                        "text": chunk_text,
-                        "type": "text",
-                        "section": "",
-                        "filing_date": ""
-                    })
-
-        return chunks
-
-    def process_batch(self, doc_ids: List[str], company_names: Dict[str, str] = None) -> List[Dict]:
+    def process_batch(
+        self, doc_ids: List[str], company_names: Dict[str, str] = None, on_progress: Optional[Callable] = None
+    ) -> List[Dict]:
         """
         批量处理文档
 
+        多个文档时以流水线方式处理：下载在线程池中进行，解析与分块在进程池中进行，
+        嵌入与存储跨文档合批。各阶段之间在途文档数受 max_in_flight 限制。
+
         Args:
             doc_ids: 文档ID列表
             company_names: 文档ID到公司名的映射
+            on_progress: 阶段回调 on_progress(doc_id, "downloading" | "embedding")
 
         Returns:
-            处理结果列表
+            处理结果列表（与doc_ids顺序一致，每个输入ID一项；重复的ID只处理一次，共用同一结果）
         """
         company_names = company_names or {}
+        if len(doc_ids) <= 1:
+            return [self.process_document(doc_id, company_names.get(doc_id, ""), on_progress) for doc_id in doc_ids]
+        return self._run_pipeline(doc_ids, company_names, on_progress)
+
+    def _get_parse_executor(self) -> Optional[ProcessPoolExecutor]:
+        """按需创建解析进程池（parse_workers为0时在下载线程中解析）"""
+        if self.parse_workers <= 0:
+            return None
+        if self._parse_executor is None:
+            with self._parse_executor_lock:
+                if self._parse_executor is None:
+                    # 主进程中已有多个线程，使用spawn避免fork带来的锁状态问题
+                    self._parse_executor = ProcessPoolExecutor(
+                        max_workers=self.parse_workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._parse_executor
+
+    def _run_pipeline(
+        self, doc_ids: List[str], company_names: Dict[str, str], on_progress: Optional[Callable] = None
+    ) -> List[Dict]:
+        requested = doc_ids
+        doc_ids = list(dict.fromkeys(doc_ids))
+        results: Dict[str, Dict] = {}
+        # 在途文档数上限（背压）；解析结果队列容量与之相同，因此写入队列不会阻塞
+        in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        stop = threading.Event()
+        parsed_queue: "queue.Queue[Dict]" = queue.Queue(maxsize=self.max_in_flight)
+        parse_executor = self._get_parse_executor()
+        store_facts = self._fact_store() is not None
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+
+            def failed(doc_id: str, error: str) -> Dict:
+                return {"doc_id": doc_id, "chunks": [], "entity_code": "", "fact_count": 0, "error": error}
+
+            def on_parsed(doc_id: str, future):
+                try:
+                    parsed_queue.put(future.result())
+                except Exception as e:
+                    parsed_queue.put(failed(doc_id, str(e)))
+
+            def download_stage(doc_id: str):
+                company_name = company_names.get(doc_id, "")
+                try:
+                    logger.info(f"处理文档: {doc_id}")
+                    _notify(on_progress, doc_id, "downloading")
+                    members = self.edinet_client.iter_document_members(
+                        doc_id=doc_id,
+                        save_dir=Path(temp_dir),
+                        file_type="1"  # XBRL
+                    )
+                    first = next(members, None)
+                    if first is None:
+                        args = (doc_id, company_name, [], self._get_document_summary(doc_id))
+                    elif parse_executor is None:
+                        # 在本线程解析：成员边解压边提交解析
+                        args = (doc_id, company_name, itertools.chain([first], members), "")
+                    else:
+                        # 子进程需要可序列化的成员列表，先解压全部成员
+                        args = (doc_id, company_name, [
+                            {"role": member["role"], "path": str(member["path"])}
+                            for member in itertools.chain([first], members)
+                        ], "")
+
+                    # 数值事实由解析方按批暂存到文档各自的目录，写入事实存储时读取
+                    fact_dir = os.path.join(temp_dir, "facts", doc_id) if store_facts else None
+                    if parse_executor is None:
+                        parsed_queue.put(parse_and_chunk(
+                            *args, xbrl_parser=self.xbrl_parser, member_workers=self.member_workers, fact_dir=fact_dir
+                        ))
+                    else:
+                        future = parse_executor.submit(
+                            parse_and_chunk, *args, member_workers=self.member_workers, fact_dir=fact_dir
+                        )
+                        future.add_done_callback(lambda f: on_parsed(doc_id, f))
+                except Exception as e:
+                    parsed_queue.put(failed(doc_id, str(e)))
+
+            def acquire() -> bool:
+                # 主循环异常退出后不再等待
+                while not stop.is_set():
+                    if in_flight.acquire(timeout=0.5):
+                        return True
+                return False
+
+            def produce():
+                for i, doc_id in enumerate(doc_ids):
+                    if not acquire():
+                        return
+                    try:
+                        self.executor.submit(download_stage, doc_id)
+                    except Exception as e:
+                        # 无法提交时其余文档全部记为失败，保证主循环能够结束
+                        logger.error(f"提交下载任务失败: {e}")
+                        for remaining in doc_ids[i:]:
+                            if remaining != doc_id and not acquire():
+                                return
+                            parsed_queue.put(failed(remaining, str(e)))
+                        return
+
+            producer = threading.Thread(target=produce, daemon=True)
+            producer.start()
+
+            pending: List[Dict] = []
+            pending_chunks = 0
+            finished = 0
+
+            def flush():
+                nonlocal pending, pending_chunks, finished
+                if not pending:
+                    return
+                for result in self._store_parsed_batch(pending, on_progress, os.path.join(temp_dir, "facts")):
+                    results[result["doc_id"]] = result
+                    in_flight.release()
+                    finished += 1
+                pending, pending_chunks = [], 0
+
+            try:
+                while finished < len(doc_ids):
+                    try:
+                        item = parsed_queue.get(timeout=self.embed_max_wait if pending else None)
+                    except queue.Empty:
+                        flush()
+                        continue
+
+                    if item["error"]:
+                        if store_facts:
+                            shutil.rmtree(os.path.join(temp_dir, "facts", item["doc_id"]), ignore_errors=True)
+                        logger.warning(f"文档 {item['doc_id']} 处理失败: {item['error']}")
+                        self._record(success=False)
+                        results[item["doc_id"]] = {"doc_id": item["doc_id"], "status": "failed", "error": item["error"]}
+                        in_flight.release()
+                        finished += 1
+                        continue
+
+                    pending.append(item)
+                    pending_chunks += len(item["chunks"])
+                    if pending_chunks >= self.embed_batch_size:
+                        flush()
+            finally:
+                stop.set()
+                producer.join()
+
+        return [results[doc_id] for doc_id in requested]
+
+    def _store_parsed_batch(
+        self, parsed_items: List[Dict], on_progress: Optional[Callable] = None, fact_root: Optional[str] = None
+    ) -> List[Dict]:
+        """将多个文档的块合并为一次嵌入与写入（数值事实从 fact_root 下各文档的暂存目录写入事实存储）"""
+        for item in parsed_items:
+            _notify(on_progress, item["doc_id"], "embedding")
+            if fact_root:
+                self._store_facts(item["doc_id"], item["fact_count"], os.path.join(fact_root, item["doc_id"]))
+
+        for item in parsed_items:
+            self._tag_company(item["chunks"], item["doc_id"], item["entity_code"])
+        all_chunks = [chunk for item in parsed_items for chunk in item["chunks"]]
+        success = self.vector_store.add_documents(all_chunks)
+
         results = []
-        for doc_id in doc_ids:
-            company_name = company_names.get(doc_id, "")
-            result = self.process_document(doc_id, company_name)
-            results.append(result)
+        for item in parsed_items:
+            self._record(success=success)
+            if success:
+                logger.info(f"文档 {item['doc_id']} 处理成功，创建了 {len(item['chunks'])} 个块")
+                results.append({"doc_id": item["doc_id"], "status": "success", "chunks_created": len(item["chunks"])})
+            else:
+                results.append({"doc_id": item["doc_id"], "status": "failed", "error": "向量存储失败"})
         return results
 
+    def _tag_company(self, chunks: List[Dict], doc_id: str, entity_code: str = ""):
+        """
+        给块写入提出者的 edinet_code（公司名为空时按公司目录补全）
+
+        公司目录中没有该文档的提出记录时，使用实例中实体标识（E00001-000）的EDINET代码
+        """
+        if not chunks:
+            return
+        edinet_code = self.company_directory.lookup_filing(doc_id) if self.company_directory is not None else None
+        if not edinet_code:
+            edinet_code = entity_code
+        if not edinet_code:
+            logger.debug(f"无法确定文档 {doc_id} 的提出者")
+            return
+        name = (self.company_directory.get_name(edinet_code) if self.company_directory is not None else None) or ""
+        for chunk in chunks:
+            chunk["edinet_code"] = edinet_code
+            if not chunk.get("company_name"):
+                chunk["company_name"] = name
+
+    def _record(self, success: bool):
+        with self._stats_lock:
+            if success:
+                self._processed_count += 1
+            else:
+                self._failed_count += 1
+
+    def shutdown(self):
+        """关闭下载线程池与解析进程池"""
+        self.executor.shutdown(wait=True)
+        if self._parse_executor is not None:
+            self._parse_executor.shutdown(wait=True)
+
     def get_processing_stats(self) -> Dict:
         """
         返回处理统计信息
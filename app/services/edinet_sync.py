@@ -0,0 +1,211 @@
+"""
+EDINET持续同步
+后台线程按固定间隔拉取书类一览，只把高水位 (日期, seqNumber) 之后的新文档送入入库流程；
+高水位持久化到JSON文件，重启后从上次的位置继续。稳定状态下每个轮询周期只请求当天的一览一次。
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from app.services.job_queue import wait_ready
+
+# EDINET的提交日期按日本时间计
+JST = timezone(timedelta(hours=9))
+
+
+class EdinetSyncDaemon:
+    """轮询EDINET新提交的文档并送入入库任务队列（无队列时直接批处理）"""
+
+    def __init__(
+        self,
+        edinet_client,
+        state_path: str,
+        doc_types: Iterable[str] = ("120",),
+        interval: float = 600.0,
+        initial_days: int = 1,
+        max_catchup_days: int = 30,
+        job_queue=None,
+        ingest_workers=None,
+        document_processor=None,
+        ready: Optional[threading.Event] = None,
+    ):
+        """
+        Args:
+            state_path: 高水位文件路径
+            doc_types: 同步的文档类型代码
+            interval: 轮询间隔（秒）
+            initial_days: 首次运行时回溯的天数（0=只同步今天）
+            max_catchup_days: 长时间停止后最多补拉的天数
+            job_queue / ingest_workers: 新文档写入持久化队列并唤醒工作线程
+            document_processor: 未启用队列时直接调用 process_batch
+            ready: 可选的就绪事件（如嵌入模型加载完成），置位前不开始轮询
+        """
+        self.edinet_client = edinet_client
+        self.state_path = Path(state_path)
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        self.doc_types = {str(doc_type).strip() for doc_type in doc_types if str(doc_type).strip()}
+        self.interval = interval
+        self.initial_days = max(0, initial_days)
+        self.max_catchup_days = max(1, max_catchup_days)
+        self.job_queue = job_queue
+        self.ingest_workers = ingest_workers
+        self.document_processor = document_processor
+        self.ready = ready
+
+        self.watermark: Optional[Tuple[str, int]] = self._load_watermark()
+        self.last_poll: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.polls = 0
+        self.submitted = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        logger.info(f"初始化EDINET同步: 文档类型={sorted(self.doc_types)}, 间隔={interval}s, 高水位={self.watermark}")
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(JST).strftime("%Y-%m-%d")
+
+    def _load_watermark(self) -> Optional[Tuple[str, int]]:
+        if not self.state_path.exists():
+            return None
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            return state["date"], int(state["seq"])
+        except Exception as e:
+            logger.warning(f"读取同步高水位失败，重新开始: {e}")
+            return None
+
+    def _save_watermark(self, watermark: Tuple[str, int]):
+        tmp_path = self.state_path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps({"date": watermark[0], "seq": watermark[1], "updated_at": time.time()}),
+            encoding="utf-8"
+        )
+        os.replace(tmp_path, self.state_path)
+        self.watermark = watermark
+
+    def _date_range(self, today: str) -> Tuple[str, int]:
+        """本次轮询的起始日期与起始日期上已处理的seqNumber"""
+        today_date = datetime.strptime(today, "%Y-%m-%d")
+        earliest = (today_date - timedelta(days=self.max_catchup_days - 1)).strftime("%Y-%m-%d")
+        if self.watermark is None:
+            start = (today_date - timedelta(days=self.initial_days)).strftime("%Y-%m-%d")
+            return max(start, earliest), 0
+        date, seq = self.watermark
+        if date < earliest:
+            logger.warning(f"同步高水位 {date} 早于补拉上限，从 {earliest} 开始")
+            return earliest, 0
+        return date, seq
+
+    def run_once(self) -> Dict:
+        """
+        执行一次同步
+
+        Returns:
+            {"new": 新文档数, "job_id": 入库任务ID, "watermark": 新高水位, "failed_dates": 获取失败的日期}
+        """
+        with self._lock:
+            today = self._today()
+            start_date, start_seq = self._date_range(today)
+            # 最近的一览在客户端有缓存，同步时总是重新获取
+            result = self.edinet_client.search_documents_detailed(
+                date_from=start_date, date_to=today, doc_type=None, refresh=True
+            )
+            self.polls += 1
+            self.last_poll = time.time()
+
+            new_docs = []
+            for doc in result["documents"]:
+                date, seq = (doc.get("submit_date") or "")[:10], doc.get("seq_number") or 0
+                if not date or (date, seq) <= (start_date, start_seq):
+                    continue
+                if self.doc_types and doc.get("doc_type_code") not in self.doc_types:
+                    continue
+                # 只入库带XBRL的文档
+                if not doc.get("xbrl_flag"):
+                    continue
+                new_docs.append((date, seq, doc))
+            new_docs.sort(key=lambda item: (item[0], item[1]))
+
+            # 失败日期及其之后的文档留到下次轮询（高水位不越过失败日期）
+            failed = sorted(result.get("failed_dates") or {})
+            if failed:
+                new_docs = [item for item in new_docs if item[0] < failed[0]]
+
+            job_id = self._submit([doc for _, _, doc in new_docs]) if new_docs else None
+
+            if failed:
+                self.last_error = f"获取书类一览失败: {', '.join(failed)}"
+                watermark = max([(start_date, start_seq)] + [(date, seq) for date, seq, _ in new_docs])
+            else:
+                self.last_error = None
+                # 起始日期之后的每日一览都已完整读取，高水位可以移到今天
+                today_seqs = [seq for date, seq, _ in new_docs if date == today]
+                if start_date == today:
+                    today_seqs.append(start_seq)
+                watermark = (today, max(today_seqs, default=0))
+            if watermark != self.watermark:
+                self._save_watermark(watermark)
+
+            if new_docs:
+                logger.info(f"EDINET同步: 新文档 {len(new_docs)} 份，任务 {job_id}，高水位 {watermark}")
+            return {
+                "new": len(new_docs),
+                "job_id": job_id,
+                "watermark": watermark,
+                "failed_dates": failed,
+            }
+
+    def _submit(self, docs: List[Dict]) -> Optional[str]:
+        doc_ids = [doc["doc_id"] for doc in docs]
+        company_names = {doc["doc_id"]: doc.get("company_name") or "" for doc in docs}
+        self.submitted += len(doc_ids)
+        if self.job_queue is not None:
+            job_id = self.job_queue.create_job(doc_ids, company_names, source="sync")
+            if self.ingest_workers is not None:
+                self.ingest_workers.notify()
+            return job_id
+        if self.document_processor is not None:
+            self.document_processor.process_batch(doc_ids, company_names)
+        return None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="edinet-sync", daemon=True)
+        self._thread.start()
+        logger.info("启动EDINET同步线程")
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        if not wait_ready(self.ready, self._stop, "EDINET同步"):
+            return
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"EDINET同步失败: {e}")
+            self._stop.wait(self.interval)
+
+    def get_stats(self) -> Dict:
+        return {
+            "doc_types": sorted(self.doc_types),
+            "interval": self.interval,
+            "watermark": {"date": self.watermark[0], "seq": self.watermark[1]} if self.watermark else None,
+            "last_poll": self.last_poll,
+            "last_error": self.last_error,
+            "polls": self.polls,
+            "submitted": self.submitted,
+        }
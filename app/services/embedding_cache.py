@@ -0,0 +1,227 @@
+"""
+文档嵌入磁盘缓存模块
+按 (模型名, 文本哈希) 持久化嵌入向量，重建集合或重新入库时未变化的文本无需再次调用模型
+
+存储布局（每个模型一个子目录）:
+    manifest.json          维度、分片容量与各分片的已提交行数
+    shard_00000.keys       uint64 文本哈希（追加写入）
+    shard_00000.vecs       float16 向量（追加写入，内存映射读取）
+"""
+import hashlib
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+def text_key(text: str) -> int:
+    """文本的64位哈希"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class _ModelShards:
+    """单个模型的分片集合"""
+
+    def __init__(self, model_dir: Path, shard_rows: int):
+        self.model_dir = model_dir
+        self.model_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_rows = shard_rows
+        self.manifest_path = model_dir / "manifest.json"
+        self.dim: Optional[int] = None
+        self.shards: List[int] = []  # 各分片已提交的行数
+
+        # 索引：已排序的键数组 + 对应的全局行号；新写入的条目先放入字典，积累到一定数量再合并
+        self._sorted_keys = np.empty(0, dtype=np.uint64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+        self._recent: Dict[int, int] = {}
+        self._memmaps: Dict[int, np.memmap] = {}
+        self._load()
+
+    def _shard_path(self, shard: int, kind: str) -> Path:
+        return self.model_dir / f"shard_{shard:05d}.{kind}"
+
+    def _load(self):
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.dim = manifest["dim"]
+            self.shards = manifest["shards"]
+            # 行号按分片容量换算，必须沿用写入时的容量
+            self.shard_rows = manifest.get("shard_rows", self.shard_rows)
+
+        # 删除未写入manifest的分片（新分片写入后、manifest更新前中断），否则之后的追加会接在残留数据之后
+        for path in self.model_dir.glob("shard_*.*"):
+            match = re.fullmatch(r"shard_(\d+)\.(keys|vecs)", path.name)
+            if match and int(match.group(1)) >= len(self.shards):
+                path.unlink()
+        if not self.shards:
+            return
+
+        keys, rows = [], []
+        base = 0
+        for shard, n_rows in enumerate(self.shards):
+            # 丢弃未写入manifest的尾部（写入中断）
+            for kind, itemsize in (("keys", 8), ("vecs", 2 * self.dim)):
+                path = self._shard_path(shard, kind)
+                if path.exists() and path.stat().st_size > n_rows * itemsize:
+                    with open(path, "r+b") as f:
+                        f.truncate(n_rows * itemsize)
+            shard_keys = np.fromfile(self._shard_path(shard, "keys"), dtype=np.uint64, count=n_rows)
+            keys.append(shard_keys)
+            rows.append(np.arange(base, base + n_rows, dtype=np.int64))
+            base += n_rows
+
+        if keys:
+            all_keys = np.concatenate(keys)
+            all_rows = np.concatenate(rows)
+            order = np.argsort(all_keys, kind="stable")
+            self._sorted_keys = all_keys[order]
+            self._sorted_rows = all_rows[order]
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "shard_rows": self.shard_rows, "shards": self.shards}, f)
+        tmp_path.replace(self.manifest_path)
+
+    def _merge_recent(self):
+        if not self._recent:
+            return
+        keys = np.fromiter(self._recent.keys(), dtype=np.uint64, count=len(self._recent))
+        rows = np.fromiter(self._recent.values(), dtype=np.int64, count=len(self._recent))
+        all_keys = np.concatenate([self._sorted_keys, keys])
+        all_rows = np.concatenate([self._sorted_rows, rows])
+        order = np.argsort(all_keys, kind="stable")
+        self._sorted_keys = all_keys[order]
+        self._sorted_rows = all_rows[order]
+        self._recent.clear()
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """返回每个键对应的全局行号，未命中为 -1"""
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if len(self._sorted_keys):
+            pos = np.searchsorted(self._sorted_keys, keys)
+            pos = np.minimum(pos, len(self._sorted_keys) - 1)
+            found = self._sorted_keys[pos] == keys
+            rows[found] = self._sorted_rows[pos[found]]
+        if self._recent:
+            for i, key in enumerate(keys.tolist()):
+                if rows[i] < 0:
+                    rows[i] = self._recent.get(key, -1)
+        return rows
+
+    def _vectors(self, shard: int) -> np.memmap:
+        n_rows = self.shards[shard]
+        mm = self._memmaps.get(shard)
+        if mm is None or mm.shape[0] != n_rows:
+            mm = np.memmap(self._shard_path(shard, "vecs"), dtype=np.float16, mode="r", shape=(n_rows, self.dim))
+            self._memmaps[shard] = mm
+        return mm
+
+    def read(self, rows: np.ndarray) -> np.ndarray:
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        shard_ids = rows // self.shard_rows
+        offsets = rows % self.shard_rows
+        for shard in np.unique(shard_ids).tolist():
+            mask = shard_ids == shard
+            out[mask] = self._vectors(shard)[offsets[mask]]
+        return out
+
+    def append(self, keys: np.ndarray, vectors: np.ndarray):
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"嵌入维度不一致: {vectors.shape[1]} != {self.dim}")
+
+        vectors = vectors.astype(np.float16)
+        start = 0
+        while start < len(keys):
+            if not self.shards or self.shards[-1] >= self.shard_rows:
+                self.shards.append(0)
+            shard = len(self.shards) - 1
+            take = min(self.shard_rows - self.shards[shard], len(keys) - start)
+            with open(self._shard_path(shard, "keys"), "ab") as f:
+                keys[start:start + take].tofile(f)
+            with open(self._shard_path(shard, "vecs"), "ab") as f:
+                vectors[start:start + take].tofile(f)
+
+            base = shard * self.shard_rows + self.shards[shard]
+            for i, key in enumerate(keys[start:start + take].tolist()):
+                self._recent[key] = base + i
+            self.shards[shard] += take
+            start += take
+
+        self._save_manifest()
+        if len(self._recent) > 100000:
+            self._merge_recent()
+
+    @property
+    def rows(self) -> int:
+        return sum(self.shards)
+
+
+class EmbeddingDiskCache:
+    """按 (模型名, 文本哈希) 缓存嵌入的磁盘缓存"""
+
+    def __init__(self, root_dir: str, shard_rows: int = 65536):
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_rows = shard_rows
+        self.hits = 0
+        self.misses = 0
+        self._models: Dict[str, _ModelShards] = {}
+        self._lock = threading.Lock()
+        logger.info(f"初始化嵌入磁盘缓存: {self.root_dir}")
+
+    def _model(self, model_name: str) -> _ModelShards:
+        shards = self._models.get(model_name)
+        if shards is None:
+            dirname = re.sub(r"[^A-Za-z0-9._-]+", "__", model_name)
+            shards = self._models[model_name] = _ModelShards(self.root_dir / dirname, self.shard_rows)
+        return shards
+
+    def get_many(self, model_name: str, texts: List[str]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        批量查询
+
+        Returns:
+            (命中掩码, 命中行的嵌入数组（按命中顺序），全部未命中时为None)
+        """
+        keys = np.array([text_key(t) for t in texts], dtype=np.uint64)
+        with self._lock:
+            shards = self._model(model_name)
+            rows = shards.lookup(keys)
+            hit_mask = rows >= 0
+            vectors = shards.read(rows[hit_mask]) if hit_mask.any() else None
+            n_hits = int(hit_mask.sum())
+            self.hits += n_hits
+            self.misses += len(texts) - n_hits
+        return hit_mask, vectors
+
+    def put_many(self, model_name: str, texts: List[str], embeddings: np.ndarray):
+        """批量写入（已存在的文本跳过）"""
+        if not texts:
+            return
+        keys = np.array([text_key(t) for t in texts], dtype=np.uint64)
+        with self._lock:
+            shards = self._model(model_name)
+            new_mask = shards.lookup(keys) < 0
+            # 同一批内的重复文本只写一次
+            _, first = np.unique(keys, return_index=True)
+            unique_mask = np.zeros(len(keys), dtype=bool)
+            unique_mask[first] = True
+            new_mask &= unique_mask
+            if new_mask.any():
+                shards.append(keys[new_mask], np.asarray(embeddings)[new_mask])
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "models": {name: shards.rows for name, shards in self._models.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,167 @@
+"""
+嵌入合批服务模块
+并发的生产者（入库与查询）提交文本，服务按批大小和最长等待时间合并为一次模型调用，
+查询请求优先于批量入库请求
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+
+import numpy as np
+from loguru import logger
+
+# 优先级：数值越小越先处理
+PRIORITY_QUERY = 0
+PRIORITY_BULK = 1
+PRIORITIES = {"query": PRIORITY_QUERY, "bulk": PRIORITY_BULK}
+
+
+class _Request:
+    """一次提交；较大的请求被拆成多个片段，全部完成后设置Future结果"""
+
+    def __init__(self, n_pieces: int):
+        self.future: Future = Future()
+        self.parts: List = [None] * n_pieces
+        self.remaining = n_pieces
+        self.lock = threading.Lock()
+
+    def complete_piece(self, index: int, embeddings: np.ndarray):
+        with self.lock:
+            self.parts[index] = embeddings
+            self.remaining -= 1
+            done = self.remaining == 0
+        if done and not self.future.done():
+            try:
+                self.future.set_result(np.vstack(self.parts))
+            except Exception as e:
+                self.future.set_exception(e)
+
+    def fail(self, error: Exception):
+        if not self.future.done():
+            self.future.set_exception(error)
+
+
+class EmbeddingService:
+    """跨请求合批的嵌入服务"""
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+    ):
+        """
+        Args:
+            encode_fn: 实际执行编码的函数（如 VectorStoreManager.create_embeddings）
+            max_batch_size: 单次模型调用的最大文本数
+            max_wait_ms: 凑批时等待后续请求的最长时间
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._heap: List = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = True
+        self._batches = 0
+        self._texts = 0
+
+        self._worker = threading.Thread(target=self._run, daemon=True, name="embedding-service")
+        self._worker.start()
+        logger.info(f"初始化嵌入合批服务 (max_batch_size={self.max_batch_size}, max_wait_ms={max_wait_ms})")
+
+    def submit(self, texts: List[str], priority: str = "bulk") -> Future:
+        """
+        提交文本，返回结果为 (len(texts), dim) 嵌入数组的Future
+
+        Args:
+            texts: 文本列表
+            priority: "query"（交互查询，优先）或 "bulk"（批量入库）
+        """
+        if not texts:
+            future: Future = Future()
+            future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return future
+
+        level = PRIORITIES[priority]
+        pieces = [texts[i:i + self.max_batch_size] for i in range(0, len(texts), self.max_batch_size)]
+        request = _Request(len(pieces))
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("嵌入合批服务已关闭")
+            for index, piece in enumerate(pieces):
+                heapq.heappush(self._heap, (level, next(self._seq), piece, request, index))
+            self._cond.notify()
+        return request.future
+
+    def embed(self, texts: List[str], priority: str = "bulk") -> np.ndarray:
+        """同步获取嵌入"""
+        return self.submit(texts, priority=priority).result()
+
+    def _next_batch(self) -> List:
+        """取出下一批：按优先级出队，直至达到批大小或等待超时"""
+        with self._cond:
+            while self._running and not self._heap:
+                self._cond.wait()
+            if not self._heap:
+                return []
+
+            batch = [heapq.heappop(self._heap)]
+            count = len(batch[0][2])
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch_size:
+                if self._heap:
+                    if count + len(self._heap[0][2]) > self.max_batch_size:
+                        break
+                    item = heapq.heappop(self._heap)
+                    batch.append(item)
+                    count += len(item[2])
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._running:
+                    break
+                self._cond.wait(remaining)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+
+            texts = [text for item in batch for text in item[2]]
+            try:
+                embeddings = self.encode_fn(texts)
+            except Exception as e:
+                logger.error(f"合批嵌入失败: {e}")
+                for _, _, _, request, _ in batch:
+                    request.fail(e)
+                continue
+
+            self._batches += 1
+            self._texts += len(texts)
+            offset = 0
+            for _, _, piece, request, index in batch:
+                request.complete_piece(index, embeddings[offset:offset + len(piece)])
+                offset += len(piece)
+
+    def get_stats(self) -> Dict:
+        with self._cond:
+            queued = sum(len(item[2]) for item in self._heap)
+        return {
+            "batches": self._batches,
+            "texts": self._texts,
+            "avg_batch_size": round(self._texts / self._batches, 2) if self._batches else 0.0,
+            "queued_texts": queued,
+        }
+
+    def shutdown(self):
+        """停止服务；队列中剩余的请求处理完后退出"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._worker.join()
@@ -0,0 +1,532 @@
+"""
+财务事实列式存储模块
+将XBRL解析出的数值事实按列保存为NumPy数组（元素名、公司代码等字典编码），
+支持按元素、期间、公司进行向量化筛选与聚合
+"""
+import json
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from loguru import logger
+
+# 字典编码的列
+DICT_COLUMNS = ("doc", "company", "element", "unit", "context")
+
+# decimals 列的特殊值
+DECIMALS_UNKNOWN = np.iinfo(np.int16).min
+DECIMALS_INF = np.iinfo(np.int16).max
+
+COLUMN_DTYPES = {
+    "doc": np.int32,
+    "company": np.int32,
+    "element": np.int32,
+    "unit": np.int32,
+    "context": np.int32,
+    "period_start": "datetime64[D]",
+    "period_end": "datetime64[D]",
+    "value": np.float64,
+    "decimals": np.int16,
+    "dimensional": np.bool_,
+}
+
+AGGREGATIONS = ("sum", "mean", "min", "max", "count")
+
+# 段数超过该值时合并最小的段
+MAX_SEGMENTS = 32
+
+# FactBatchWriter 每批暂存的事实数
+FACT_BATCH_SIZE = 10000
+
+
+def _parse_decimals(decimals: Optional[str]) -> int:
+    if decimals is None:
+        return DECIMALS_UNKNOWN
+    if decimals.upper() == "INF":
+        return DECIMALS_INF
+    try:
+        return int(decimals)
+    except ValueError:
+        return DECIMALS_UNKNOWN
+
+
+def _company_code(entity: Optional[str]) -> str:
+    """'E00001-000' -> 'E00001'"""
+    return (entity or "").split("-", 1)[0]
+
+
+def _empty_rows() -> Dict[str, list]:
+    return {name: [] for name in COLUMN_DTYPES if name != "doc"}
+
+
+def _append_row(rows: Dict[str, list], fact: Dict) -> bool:
+    """将一条事实追加到按列收集的原始行（字典列保存原值）；非数值或 nil 的事实返回 False"""
+    if not fact.get("unit_ref") or fact.get("is_nil"):
+        return False
+    try:
+        value = float(fact["value"])
+    except (TypeError, ValueError):
+        return False
+
+    period = fact.get("period") or {}
+    rows["company"].append(_company_code(fact.get("entity")))
+    rows["element"].append(fact["element"])
+    rows["unit"].append(fact.get("unit") or fact["unit_ref"])
+    rows["context"].append(fact.get("context_ref") or "")
+    rows["period_start"].append(period.get("start") or "NaT")
+    rows["period_end"].append(period.get("end") or period.get("instant") or "NaT")
+    rows["value"].append(value)
+    rows["decimals"].append(_parse_decimals(fact.get("decimals")))
+    rows["dimensional"].append(bool(fact.get("dimensions")))
+    return True
+
+
+def _raw_columns(rows: Dict[str, list]) -> Dict[str, np.ndarray]:
+    return {
+        name: np.array(values, dtype=str if name in DICT_COLUMNS else COLUMN_DTYPES[name])
+        for name, values in rows.items()
+    }
+
+
+class FactBatchWriter:
+    """
+    将数值事实按批写入暂存目录（每批一个 .npz，字典列保存原值）
+
+    FactStore 只能由主进程写入（字典与清单在内存中维护），解析子进程用它暂存事实，
+    主进程再用 FactStore.add_staged 提交；内存中最多保留 batch_size 条。
+    """
+
+    def __init__(self, staging_dir: str, batch_size: Optional[int] = None):
+        self.staging_dir = Path(staging_dir)
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size or FACT_BATCH_SIZE
+        self.count = 0
+        self._batches = 0
+        self._rows = _empty_rows()
+
+    def add(self, fact: Dict) -> bool:
+        """追加一条事实，返回是否为可写入的数值事实"""
+        if not _append_row(self._rows, fact):
+            return False
+        self.count += 1
+        if len(self._rows["value"]) >= self.batch_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        if not self._rows["value"]:
+            return
+        np.savez(self.staging_dir / f"batch-{self._batches:05d}.npz", **_raw_columns(self._rows))
+        self._batches += 1
+        self._rows = _empty_rows()
+
+
+class FactStore:
+    """XBRL数值事实的列式存储（按段追加，段清单 manifest.json 记录各段包含的文档，保存在 processed_data_dir/facts 下）"""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = Path(root_dir)
+        self.segments_dir = self.root_dir / "segments"
+        self.segments_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._dictionaries: Dict[str, List[str]] = {name: [] for name in DICT_COLUMNS}
+        self._codes: Dict[str, Dict[str, int]] = {name: {} for name in DICT_COLUMNS}
+        self._columns: Optional[Dict[str, np.ndarray]] = None
+        self.manifest_path = self.root_dir / "manifest.json"
+        self._manifest: Dict = {}
+        self._doc_segment: Dict[int, str] = {}
+        self._load_dictionaries()
+        self._load_manifest()
+        logger.info(f"初始化财务事实存储: {self.root_dir}")
+
+    # ---------- 字典与持久化 ----------
+
+    def _load_dictionaries(self):
+        path = self.root_dir / "dictionaries.json"
+        if not path.exists():
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+        for name in DICT_COLUMNS:
+            values = stored.get(name, [])
+            self._dictionaries[name] = values
+            self._codes[name] = {v: i for i, v in enumerate(values)}
+
+    def _save_dictionaries(self):
+        path = self.root_dir / "dictionaries.json"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._dictionaries, f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    def _encode(self, name: str, value: str) -> int:
+        codes = self._codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self._dictionaries[name])
+            self._dictionaries[name].append(value)
+        return code
+
+    def _load_manifest(self):
+        """
+        读取段清单（清单为唯一可信来源：未列入清单的段目录视为写入中断的残留并删除）
+
+        清单: {"next_seq", "segments": {段名: {"rows", "docs": [文档编码], "tombstones": [文档编码]}}}
+        """
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self._manifest = json.load(f)
+        else:
+            self._manifest = {"next_seq": 1, "segments": {}}
+
+        for path in self.segments_dir.iterdir():
+            if path.name not in self._manifest["segments"]:
+                shutil.rmtree(path, ignore_errors=True)
+
+        # 文档 -> 所在段（不含已标记删除的）
+        self._doc_segment = {}
+        for name, segment in self._manifest["segments"].items():
+            tombstones = set(segment["tombstones"])
+            for doc_code in segment["docs"]:
+                if doc_code not in tombstones:
+                    self._doc_segment[doc_code] = name
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f)
+        tmp_path.replace(self.manifest_path)
+
+    def _segment_names(self) -> List[str]:
+        return sorted(self._manifest["segments"])
+
+    def _write_segment(self, columns: Dict[str, np.ndarray]) -> str:
+        """写入新段（先写临时目录再改名），返回段名；段在写入清单前不可见"""
+        seq = self._manifest["next_seq"]
+        self._manifest["next_seq"] = seq + 1
+        name = f"{seq:06d}"
+        tmp_dir = self.segments_dir / f".{name}.tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        for column, array in columns.items():
+            np.save(tmp_dir / f"{column}.npy", array)
+        tmp_dir.rename(self.segments_dir / name)
+        return name
+
+    def _read_segment(self, name: str) -> Dict[str, np.ndarray]:
+        """读取一个段（去除已标记删除的文档）"""
+        segment_dir = self.segments_dir / name
+        columns = {column: np.load(segment_dir / f"{column}.npy", mmap_mode="r") for column in COLUMN_DTYPES}
+        tombstones = self._manifest["segments"][name]["tombstones"]
+        if tombstones:
+            keep = ~np.isin(columns["doc"], tombstones)
+            columns = {column: np.asarray(array[keep]) for column, array in columns.items()}
+        return columns
+
+    def _load_columns(self) -> Dict[str, np.ndarray]:
+        """读取并拼接所有段（结果缓存，写入时失效）"""
+        if self._columns is None:
+            parts: Dict[str, List[np.ndarray]] = {name: [] for name in COLUMN_DTYPES}
+            for segment_name in self._segment_names():
+                for name, array in self._read_segment(segment_name).items():
+                    parts[name].append(array)
+            self._columns = {
+                name: np.concatenate(arrays) if arrays else np.empty(0, dtype=COLUMN_DTYPES[name])
+                for name, arrays in parts.items()
+            }
+        return self._columns
+
+    # ---------- 写入 ----------
+
+    def add_facts(self, doc_id: str, facts: Iterable[Dict]) -> int:
+        """
+        写入某文档的数值事实（同一文档再次写入时替换旧数据）
+
+        每次写入一个新段；旧数据按文档→段索引定位，整段属于该文档时直接移除，
+        否则在段上标记删除。段数过多时合并小段。
+
+        Args:
+            doc_id: 文档ID
+            facts: XBRLParser.iter_facts 产出的事实（可为迭代器）
+
+        Returns:
+            写入的事实数
+        """
+        # 事实在锁外逐条读取（facts 可为边解析边产出的迭代器），字典列先保存原值
+        rows = _empty_rows()
+        for fact in facts:
+            _append_row(rows, fact)
+        return self._replace_doc(doc_id, [_raw_columns(rows)])
+
+    def add_staged(self, doc_id: str, staging_dir: str) -> int:
+        """
+        提交 FactBatchWriter 暂存的某文档的事实（同一文档再次写入时替换旧数据）
+
+        Returns:
+            写入的事实数
+        """
+        paths = sorted(Path(staging_dir).glob("batch-*.npz"))
+        return self._replace_doc(doc_id, (dict(np.load(path)) for path in paths))
+
+    def _encode_batch(self, batch: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """将原始列中的字典列编码（每个不同的值只查一次字典）"""
+        columns = dict(batch)
+        for name in DICT_COLUMNS[1:]:
+            uniques, inverse = np.unique(batch[name], return_inverse=True)
+            codes = np.array([self._encode(name, str(value)) for value in uniques], dtype=np.int32)
+            columns[name] = codes[inverse].reshape(-1)
+        return columns
+
+    def _replace_doc(self, doc_id: str, batches: Iterable[Dict[str, np.ndarray]]) -> int:
+        """将按批给出的原始列写成该文档的新段，并移除该文档的旧数据"""
+        with self._lock:
+            doc_code = self._encode("doc", doc_id)
+            parts = [self._encode_batch(batch) for batch in batches]
+            parts = [part for part in parts if len(part["value"])]
+            columns = {
+                name: np.concatenate([part[name] for part in parts]).astype(dtype, copy=False)
+                if parts else np.empty(0, dtype=dtype)
+                for name, dtype in COLUMN_DTYPES.items() if name != "doc"
+            }
+            columns["doc"] = np.full(len(columns["value"]), doc_code, dtype=np.int32)
+
+            # 段只引用已持久化的字典编码
+            self._save_dictionaries()
+            new_segment = self._write_segment(columns) if len(columns["value"]) else None
+            removed = self._detach_doc(doc_code)
+            if new_segment is not None:
+                self._manifest["segments"][new_segment] = {
+                    "rows": int(len(columns["value"])), "docs": [doc_code], "tombstones": []
+                }
+                self._doc_segment[doc_code] = new_segment
+            self._save_manifest()
+            self._remove_segment_dirs(removed)
+            self._columns = None
+            if len(self._manifest["segments"]) > MAX_SEGMENTS:
+                self.compact()
+
+        logger.info(f"文档 {doc_id} 写入 {len(columns['value'])} 条财务事实")
+        return len(columns["value"])
+
+    def _detach_doc(self, doc_code: int) -> List[str]:
+        """
+        在清单中移除某文档（调用方随后保存清单），返回可以删除目录的段名
+
+        只含该文档的段整体移除；多文档段中标记删除，待合并时清理
+        """
+        name = self._doc_segment.pop(doc_code, None)
+        if name is None:
+            return []
+        segment = self._manifest["segments"][name]
+        live = [d for d in segment["docs"] if d not in segment["tombstones"] and d != doc_code]
+        if not live:
+            del self._manifest["segments"][name]
+            return [name]
+        segment["tombstones"].append(doc_code)
+        return []
+
+    def _remove_segment_dirs(self, names: Iterable[str]):
+        # 清单已不再引用这些段；中途崩溃时残留目录在下次加载时清理
+        for name in names:
+            shutil.rmtree(self.segments_dir / name, ignore_errors=True)
+
+    def compact(self, max_segments: Optional[int] = None):
+        """
+        合并最小的若干段（同时清除其中标记删除的行），使段数不超过 max_segments
+
+        新段写入并更新清单后才删除旧段目录，中途崩溃不会产生重复数据
+        """
+        if max_segments is None:
+            max_segments = MAX_SEGMENTS // 2
+        with self._lock:
+            segments = self._manifest["segments"]
+            if len(segments) <= max_segments:
+                return
+            names = sorted(segments, key=lambda n: segments[n]["rows"])[:len(segments) - max_segments + 1]
+            parts = [self._read_segment(name) for name in names]
+            merged = {name: np.concatenate([part[name] for part in parts]) for name in COLUMN_DTYPES}
+            docs = sorted({d for name in names for d in segments[name]["docs"] if d not in segments[name]["tombstones"]})
+
+            new_segment = self._write_segment(merged) if len(merged["value"]) else None
+            for name in names:
+                del segments[name]
+            if new_segment is not None:
+                segments[new_segment] = {"rows": int(len(merged["value"])), "docs": docs, "tombstones": []}
+                for doc_code in docs:
+                    self._doc_segment[doc_code] = new_segment
+            self._save_manifest()
+            self._remove_segment_dirs(names)
+            self._columns = None
+            logger.info(f"财务事实存储合并 {len(names)} 段")
+
+    def delete_document(self, doc_id: str) -> bool:
+        with self._lock:
+            doc_code = self._codes["doc"].get(doc_id)
+            if doc_code is None or doc_code not in self._doc_segment:
+                return False
+            removed = self._detach_doc(doc_code)
+            self._save_manifest()
+            self._remove_segment_dirs(removed)
+            self._columns = None
+            return True
+
+    # ---------- 查询 ----------
+
+    def _codes_for(self, name: str, values: Sequence[str]) -> np.ndarray:
+        codes = self._codes[name]
+        return np.array([codes[v] for v in values if v in codes], dtype=np.int32)
+
+    def _mask(
+        self,
+        columns: Dict[str, np.ndarray],
+        elements: Optional[Sequence[str]] = None,
+        companies: Optional[Sequence[str]] = None,
+        doc_ids: Optional[Sequence[str]] = None,
+        period_from: Optional[str] = None,
+        period_to: Optional[str] = None,
+        include_dimensional: bool = False,
+    ) -> np.ndarray:
+        mask = np.ones(len(columns["value"]), dtype=bool)
+        if elements is not None:
+            mask &= np.isin(columns["element"], self._codes_for("element", elements))
+        if companies is not None:
+            mask &= np.isin(columns["company"], self._codes_for("company", companies))
+        if doc_ids is not None:
+            mask &= np.isin(columns["doc"], self._codes_for("doc", doc_ids))
+        if period_from is not None:
+            mask &= columns["period_end"] >= np.datetime64(period_from, "D")
+        if period_to is not None:
+            mask &= columns["period_end"] <= np.datetime64(period_to, "D")
+        if not include_dimensional:
+            mask &= ~columns["dimensional"]
+        return mask
+
+    def _latest_mask(self, columns: Dict[str, np.ndarray], mask: np.ndarray) -> np.ndarray:
+        """
+        同一事实（公司、元素、期间、维度成员相同）在多个文档中出现时只保留最新文档的一条
+
+        各年度报告都会再次提交前期比较数据（Prior1Year* 上下文），订正报告书会重新提交同一期间；
+        EDINET文档ID按提交顺序递增，以文档ID较大者为最新。
+        """
+        rows = np.nonzero(mask)[0]
+        if len(rows) < 2:
+            return mask
+        doc_rank = np.argsort(np.argsort(np.array(self._dictionaries["doc"], dtype=object)))
+        # 上下文ID的相对期间前缀（CurrentYear / Prior1Year 等）不同，只比较 "_" 之后的维度成员部分
+        contexts = self._dictionaries["context"]
+        member_codes = {}
+        member_of_context = np.array(
+            [member_codes.setdefault(c.split("_", 1)[1] if "_" in c else "", len(member_codes)) for c in contexts],
+            dtype=np.int64,
+        )
+        order = np.lexsort((
+            -doc_rank[columns["doc"][rows]],
+            member_of_context[columns["context"][rows]],
+            columns["period_end"][rows].astype(np.int64),
+            columns["period_start"][rows].astype(np.int64),
+            columns["element"][rows],
+            columns["company"][rows],
+        ))
+        sorted_rows = rows[order]
+        keys = [
+            columns["company"][sorted_rows],
+            columns["element"][sorted_rows],
+            columns["period_start"][sorted_rows].astype(np.int64),
+            columns["period_end"][sorted_rows].astype(np.int64),
+            member_of_context[columns["context"][sorted_rows]],
+        ]
+        first = np.ones(len(sorted_rows), dtype=bool)
+        first[1:] = np.any([key[1:] != key[:-1] for key in keys], axis=0)
+        latest = np.zeros_like(mask)
+        latest[sorted_rows[first]] = True
+        return latest
+
+    def query(self, **filters) -> Dict[str, np.ndarray]:
+        """
+        按条件筛选事实
+
+        Args:
+            elements: 元素名列表（如 ["NetSales"]）
+            companies: EDINET代码列表（如 ["E00001"]）
+            doc_ids: 文档ID列表
+            period_from / period_to: 期末日期范围 (YYYY-MM-DD)
+            include_dimensional: 是否包含带维度（分部等）的事实，默认只返回无维度事实
+
+        Returns:
+            列名 -> 数组（字典编码列已解码为字符串）
+        """
+        with self._lock:
+            columns = self._load_columns()
+            mask = self._mask(columns, **filters)
+            result = {}
+            for name, array in columns.items():
+                selected = np.asarray(array[mask])
+                if name in DICT_COLUMNS:
+                    selected = np.array(self._dictionaries[name], dtype=object)[selected] if len(selected) else np.empty(0, dtype=object)
+                result[name] = selected
+            return result
+
+    def aggregate(
+        self, element: str, by: str = "company", agg: str = "sum", latest_only: bool = True, **filters
+    ) -> Dict[str, float]:
+        """
+        对某元素按公司或期末日期聚合
+
+        Args:
+            element: 元素名
+            by: "company" 或 "period_end"
+            agg: sum / mean / min / max / count
+            latest_only: 同一事实在多个文档（后续年度的比较数据、订正报告书）中出现时只计最新的一条
+            **filters: 同 query
+
+        Returns:
+            分组键 -> 聚合值
+        """
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"不支持的聚合方式: {agg}")
+        if by not in ("company", "period_end"):
+            raise ValueError(f"不支持的分组字段: {by}")
+
+        with self._lock:
+            columns = self._load_columns()
+            mask = self._mask(columns, elements=[element], **filters)
+            if latest_only:
+                mask = self._latest_mask(columns, mask)
+            values = np.asarray(columns["value"][mask])
+            keys = np.asarray(columns[by][mask])
+            if by == "company":
+                labels = self._dictionaries["company"]
+            else:
+                unique_keys, keys = np.unique(keys, return_inverse=True)
+                labels = [str(d) for d in unique_keys]
+
+        if not len(values):
+            return {}
+
+        n_groups = len(labels)
+        counts = np.bincount(keys, minlength=n_groups)
+        if agg == "count":
+            result = counts.astype(np.float64)
+        elif agg in ("sum", "mean"):
+            result = np.bincount(keys, weights=values, minlength=n_groups)
+            if agg == "mean":
+                result = result / np.maximum(counts, 1)
+        else:
+            fill = np.inf if agg == "min" else -np.inf
+            result = np.full(n_groups, fill)
+            (np.minimum if agg == "min" else np.maximum).at(result, keys, values)
+
+        present = np.nonzero(counts)[0]
+        return {labels[i]: float(result[i]) for i in present}
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            columns = self._load_columns()
+            return {
+                "facts": int(len(columns["value"])),
+                "documents": int(len(np.unique(columns["doc"]))),
+                "companies": len(self._dictionaries["company"]),
+                "elements": len(self._dictionaries["element"]),
+                "segments": len(self._manifest["segments"]),
+            }
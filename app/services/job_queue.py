@@ -0,0 +1,290 @@
+"""
+持久化入库任务队列
+每个任务包含若干文档，逐文档记录状态（queued → downloading → embedding → done / failed）；
+多个工作线程从SQLite队列中认领文档，交给 DocumentProcessor 处理。重启后未完成的文档重新入队继续处理。
+"""
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+EMBEDDING = "embedding"
+DONE = "done"
+FAILED = "failed"
+STATES = (QUEUED, DOWNLOADING, EMBEDDING, DONE, FAILED)
+ACTIVE_STATES = (DOWNLOADING, EMBEDDING)
+
+
+class IngestJobQueue:
+    """SQLite实现的入库任务队列（WAL模式，认领操作原子化）"""
+
+    def __init__(self, db_path: str, max_attempts: int = 3):
+        """
+        Args:
+            db_path: SQLite文件路径
+            max_attempts: 每个文档最多处理次数（中断后重新入队也计入）
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " created_at REAL NOT NULL,"
+            " source TEXT);"
+            "CREATE TABLE IF NOT EXISTS job_items ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " job_id TEXT NOT NULL,"
+            " doc_id TEXT NOT NULL,"
+            " company_name TEXT NOT NULL DEFAULT '',"
+            " state TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " chunks INTEGER,"
+            " error TEXT,"
+            " updated_at REAL NOT NULL,"
+            " UNIQUE (job_id, doc_id));"
+            "CREATE INDEX IF NOT EXISTS idx_job_items_state ON job_items (state, seq);"
+            "CREATE INDEX IF NOT EXISTS idx_job_items_job ON job_items (job_id);"
+        )
+        self.recover()
+        logger.info(f"初始化入库任务队列: {self.db_path}")
+
+    def recover(self) -> int:
+        """将上次运行中断时处理到一半的文档重新入队（超过最大次数的标记失败）"""
+        now = time.time()
+        placeholders = ",".join("?" * len(ACTIVE_STATES))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                f"UPDATE job_items SET state = ?, error = ?, updated_at = ?"
+                f" WHERE state IN ({placeholders}) AND attempts >= ?",
+                (FAILED, "处理中断次数过多", now, *ACTIVE_STATES, self.max_attempts),
+            )
+            requeued = self._conn.execute(
+                f"UPDATE job_items SET state = ?, updated_at = ? WHERE state IN ({placeholders})",
+                (QUEUED, now, *ACTIVE_STATES),
+            ).rowcount
+            self._conn.execute("COMMIT")
+        if requeued:
+            logger.info(f"恢复 {requeued} 个中断的入库文档")
+        return requeued
+
+    def create_job(self, doc_ids: List[str], company_names: Optional[Dict[str, str]] = None, source: str = "api") -> str:
+        """创建任务（同一任务内重复的docID只保留一次）"""
+        company_names = company_names or {}
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        rows = [
+            (job_id, doc_id, company_names.get(doc_id, "") or "", QUEUED, now)
+            for doc_id in dict.fromkeys(doc_ids)
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("INSERT INTO jobs (job_id, created_at, source) VALUES (?, ?, ?)", (job_id, now, source))
+            self._conn.executemany(
+                "INSERT INTO job_items (job_id, doc_id, company_name, state, updated_at) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute("COMMIT")
+        logger.info(f"创建入库任务 {job_id}: {len(rows)} 个文档")
+        return job_id
+
+    def claim(self, limit: int = 1) -> List[Tuple[str, str, str]]:
+        """按入队顺序认领最多 limit 个文档并置为 downloading
+
+        Returns:
+            [(job_id, doc_id, company_name)]
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE job_items SET state = ?, attempts = attempts + 1, updated_at = ?"
+                " WHERE seq IN (SELECT seq FROM job_items WHERE state = ? ORDER BY seq LIMIT ?)"
+                " RETURNING seq, job_id, doc_id, company_name",
+                (DOWNLOADING, time.time(), QUEUED, limit),
+            ).fetchall()
+        return [(job_id, doc_id, company_name) for _, job_id, doc_id, company_name in sorted(rows)]
+
+    def set_state(
+        self,
+        job_id: str,
+        doc_id: str,
+        state: str,
+        error: Optional[str] = None,
+        chunks: Optional[int] = None,
+    ):
+        if state not in STATES:
+            raise ValueError(f"未知状态: {state}")
+        with self._lock:
+            self._conn.execute(
+                "UPDATE job_items SET state = ?, error = ?, chunks = COALESCE(?, chunks), updated_at = ?"
+                " WHERE job_id = ? AND doc_id = ?",
+                (state, error, chunks, time.time(), job_id, doc_id),
+            )
+
+    def pending_count(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM job_items WHERE state = ?", (QUEUED,)
+            ).fetchone()
+        return count
+
+    def get_job(self, job_id: str, include_items: bool = True) -> Optional[Dict]:
+        """任务进度：各状态文档数、完成比例，以及逐文档状态"""
+        with self._lock:
+            job = self._conn.execute(
+                "SELECT job_id, created_at, source FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT state, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY state", (job_id,)
+            ).fetchall())
+            items = self._conn.execute(
+                "SELECT doc_id, state, attempts, chunks, error, updated_at FROM job_items"
+                " WHERE job_id = ? ORDER BY seq", (job_id,)
+            ).fetchall() if include_items else []
+
+        total = sum(counts.values())
+        finished = counts.get(DONE, 0) + counts.get(FAILED, 0)
+        if finished == total:
+            status = FAILED if counts.get(FAILED, 0) == total and total else DONE
+        elif any(counts.get(s, 0) for s in ACTIVE_STATES) or finished:
+            status = "running"
+        else:
+            status = QUEUED
+        result = {
+            "job_id": job[0],
+            "created_at": job[1],
+            "source": job[2],
+            "status": status,
+            "total": total,
+            "counts": {state: counts.get(state, 0) for state in STATES},
+            "progress": round(finished / total, 4) if total else 1.0,
+        }
+        if include_items:
+            result["items"] = [
+                dict(zip(("doc_id", "state", "attempts", "chunks", "error", "updated_at"), row)) for row in items
+            ]
+        return result
+
+    def list_jobs(self, limit: int = 20) -> List[Dict]:
+        with self._lock:
+            job_ids = [row[0] for row in self._conn.execute(
+                "SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            )]
+        return [job for job in (self.get_job(job_id, include_items=False) for job_id in job_ids) if job]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM job_items GROUP BY state").fetchall())
+        return {state: counts.get(state, 0) for state in STATES}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def wait_ready(ready: Optional[threading.Event], stop: threading.Event, name: str) -> bool:
+    """等待就绪事件，期间可被 stop 打断；返回是否就绪"""
+    if ready is None or ready.is_set():
+        return True
+    logger.info(f"{name}等待嵌入模型加载完成")
+    while not stop.is_set():
+        if ready.wait(1.0):
+            return True
+    return False
+
+
+class IngestWorkers:
+    """从任务队列认领文档并交给 DocumentProcessor 的工作线程"""
+
+    def __init__(self, job_queue: IngestJobQueue, document_processor, workers: int = 2, batch_size: int = 8,
+                 poll_interval: float = 1.0, ready: Optional[threading.Event] = None):
+        """
+        Args:
+            workers: 工作线程数（各自独立认领，互不重复）
+            batch_size: 每次认领的文档数（多个文档时走 process_batch 的流水线合批嵌入）
+            poll_interval: 队列为空时的轮询间隔（秒）
+            ready: 可选的就绪事件（如嵌入模型加载完成），置位前不认领任务
+        """
+        self.job_queue = job_queue
+        self.document_processor = document_processor
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self.ready = ready
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"启动 {self.workers} 个入库工作线程")
+
+    def notify(self):
+        """有新任务时唤醒空闲的工作线程"""
+        self._wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止认领新文档；正在处理的文档完成后退出（未完成的在下次启动时恢复）"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        if not wait_ready(self.ready, self._stop, "入库工作线程"):
+            return
+        while not self._stop.is_set():
+            try:
+                claimed = self.job_queue.claim(self.batch_size)
+            except Exception as e:
+                logger.error(f"认领入库任务失败: {e}")
+                claimed = []
+            if not claimed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self.process_claimed(claimed)
+
+    def process_claimed(self, claimed: List[Tuple[str, str, str]]):
+        # 同一docID可能出现在不同任务中，按docID回写所有对应的任务
+        jobs_of: Dict[str, List[str]] = {}
+        company_names: Dict[str, str] = {}
+        for job_id, doc_id, company_name in claimed:
+            jobs_of.setdefault(doc_id, []).append(job_id)
+            if company_name:
+                company_names[doc_id] = company_name
+
+        def on_progress(doc_id: str, state: str):
+            for job_id in jobs_of.get(doc_id, ()):
+                self.job_queue.set_state(job_id, doc_id, state)
+
+        doc_ids = list(jobs_of)
+        try:
+            results = self.document_processor.process_batch(doc_ids, company_names, on_progress=on_progress)
+        except Exception as e:
+            logger.error(f"入库批处理失败: {e}")
+            results = [{"doc_id": doc_id, "status": "failed", "error": str(e)} for doc_id in doc_ids]
+
+        for result in results:
+            success = result.get("status") == "success"
+            for job_id in jobs_of.get(result["doc_id"], ()):
+                self.job_queue.set_state(
+                    job_id, result["doc_id"], DONE if success else FAILED,
+                    error=None if success else result.get("error"),
+                    chunks=result.get("chunks_created"),
+                )
@@ -0,0 +1,534 @@
+"""
+进程内向量索引模块
+单机部署时替代ChromaDB HTTP服务：向量保存在内存映射的矩阵文件中，元数据保存在SQLite旁表中，
+使用NumPy精确检索（余弦相似度）。接口与 ChromaDB Collection 中 VectorStoreManager 用到的部分一致。
+
+存储布局（index_dir 下）:
+    manifest.json             维度、数据类型、已提交行数、当前代数（指定使用的向量文件与元数据库）
+    vectors[.<代数>].bin       归一化后的向量（float16/float32，按行追加，内存映射读取）
+    metadata[.<代数>].sqlite3  行号 -> 块ID、文本、元数据、删除标记
+
+压缩时写入下一代的向量文件与元数据库，再替换manifest切换，旧代文件随后删除
+"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+from loguru import logger
+
+# 检索时分块计算相似度的行数，限制临时内存
+SEARCH_BLOCK_ROWS = 65536
+# 删除的行超过该比例时压缩存储
+COMPACT_RATIO = 0.3
+
+DEFAULT_INCLUDE = ("documents", "metadatas")
+
+# 建立等值索引的元数据字段（where 条件中这些字段的等值/$in 条件不再逐行匹配）
+INDEXED_FIELDS = ("doc_id", "edinet_code", "section")
+
+
+def _match_condition(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, operand in condition.items():
+        if op == "$eq":
+            ok = value == operand
+        elif op == "$ne":
+            ok = value != operand
+        elif op == "$in":
+            ok = value in operand
+        elif op == "$nin":
+            ok = value not in operand
+        elif op == "$contains":
+            ok = isinstance(value, str) and operand in value
+        elif op == "$gt":
+            ok = value is not None and value > operand
+        elif op == "$gte":
+            ok = value is not None and value >= operand
+        elif op == "$lt":
+            ok = value is not None and value < operand
+        elif op == "$lte":
+            ok = value is not None and value <= operand
+        else:
+            raise ValueError(f"不支持的过滤运算符: {op}")
+        if not ok:
+            return False
+    return True
+
+
+def _equality_values(condition: Any) -> Optional[List[Any]]:
+    """条件可由等值索引求出候选时返回候选值（$eq / $in），否则返回 None"""
+    if not isinstance(condition, dict):
+        return [condition]
+    if "$eq" in condition:
+        return [condition["$eq"]]
+    if "$in" in condition:
+        return list(condition["$in"])
+    return None
+
+
+def match_where(metadata: Dict, where: Optional[Dict]) -> bool:
+    """判断元数据是否满足ChromaDB风格的where条件"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(match_where(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(match_where(metadata, c) for c in condition):
+                return False
+        elif not _match_condition(metadata.get(key), condition):
+            return False
+    return True
+
+
+class LocalVectorIndex:
+    """持久化的进程内向量索引（首次访问时才加载）"""
+
+    def __init__(self, index_dir: str, dtype: str = "float16"):
+        """
+        Args:
+            index_dir: 索引目录
+            dtype: 向量存储类型 float16 / float32
+        """
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.index_dir / "manifest.json"
+        self.generation = 0
+        self.vectors_path, self.metadata_path = self._generation_paths(0)
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self.rows = 0
+
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._conn: Optional[sqlite3.Connection] = None
+        self._vectors: Optional[np.memmap] = None
+        self._ids: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        self._metadatas: List[Dict] = []
+        self._alive = np.zeros(0, dtype=bool)
+        # 字段 -> 值 -> 存活行号
+        self._field_rows: Dict[str, Dict[Any, Set[int]]] = {field: {} for field in INDEXED_FIELDS}
+        logger.info(f"初始化本地向量索引: {self.index_dir}（首次访问时加载）")
+
+    # ---------- 加载与持久化 ----------
+
+    def _generation_paths(self, generation: int):
+        """代数对应的向量文件与元数据库（第0代沿用旧版本的文件名）"""
+        suffix = f".{generation}" if generation else ""
+        return self.index_dir / f"vectors{suffix}.bin", self.index_dir / f"metadata{suffix}.sqlite3"
+
+    def _connect(self, path: Path) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(path), check_same_thread=False)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " row INTEGER PRIMARY KEY,"
+            " id TEXT NOT NULL,"
+            " document TEXT,"
+            " metadata TEXT NOT NULL,"
+            " deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.commit()
+        return conn
+
+    def _remove_stale_generations(self):
+        """删除当前代以外的向量文件与元数据库（压缩中断或切换后未删除的残留）"""
+        for path in self.index_dir.glob("vectors*.bin"):
+            if path != self.vectors_path:
+                path.unlink(missing_ok=True)
+        for path in self.index_dir.glob("metadata*.sqlite3*"):
+            if not path.name.startswith(self.metadata_path.name):
+                path.unlink(missing_ok=True)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if self.manifest_path.exists():
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                self.dim = manifest["dim"]
+                self.dtype = np.dtype(manifest["dtype"])
+                self.rows = manifest["rows"]
+                self.generation = manifest.get("generation", 0)
+                self.vectors_path, self.metadata_path = self._generation_paths(self.generation)
+            self._remove_stale_generations()
+            self._conn = self._connect(self.metadata_path)
+
+            # 丢弃未写入manifest的尾部（写入中断）
+            if self.dim is not None and self.vectors_path.exists():
+                committed = self.rows * self.dim * self.dtype.itemsize
+                if self.vectors_path.stat().st_size > committed:
+                    with open(self.vectors_path, "r+b") as f:
+                        f.truncate(committed)
+            self._conn.execute("DELETE FROM chunks WHERE row >= ?", (self.rows,))
+            self._conn.commit()
+
+            self._ids = [""] * self.rows
+            self._metadatas = [{}] * self.rows
+            self._alive = np.zeros(self.rows, dtype=bool)
+            for row, chunk_id, metadata, deleted in self._conn.execute(
+                "SELECT row, id, metadata, deleted FROM chunks ORDER BY row"
+            ):
+                self._ids[row] = chunk_id
+                self._metadatas[row] = json.loads(metadata)
+                if not deleted:
+                    self._alive[row] = True
+                    self._row_of[chunk_id] = row
+            self._rebuild_field_index()
+            self._remap()
+            self._loaded = True
+            logger.info(f"本地向量索引加载完成: {int(self._alive.sum())} 条")
+
+    def _remap(self):
+        if self.rows and self.dim:
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(self.rows, self.dim))
+        else:
+            self._vectors = None
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name, "rows": self.rows, "generation": self.generation}, f)
+        tmp_path.replace(self.manifest_path)
+
+    # ---------- 等值索引 ----------
+
+    def _index_row(self, row: int):
+        metadata = self._metadatas[row]
+        for field, index in self._field_rows.items():
+            index.setdefault(metadata.get(field), set()).add(row)
+
+    def _unindex_row(self, row: int):
+        metadata = self._metadatas[row]
+        for field, index in self._field_rows.items():
+            rows = index.get(metadata.get(field))
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del index[metadata.get(field)]
+
+    def _rebuild_field_index(self):
+        self._field_rows = {field: {} for field in INDEXED_FIELDS}
+        for row in np.nonzero(self._alive)[0].tolist():
+            self._index_row(row)
+
+    def _indexed_candidates(self, where: Dict) -> Optional[Set[int]]:
+        """由等值索引求出满足 where 的候选行（超集）；无可用的索引条件时返回 None"""
+        candidates: Optional[Set[int]] = None
+
+        def narrow(rows: Optional[Set[int]]):
+            nonlocal candidates
+            if rows is not None:
+                candidates = rows if candidates is None else candidates & rows
+
+        for key, condition in where.items():
+            if key == "$and":
+                for sub in condition:
+                    narrow(self._indexed_candidates(sub))
+            elif key == "$or":
+                parts = [self._indexed_candidates(sub) for sub in condition]
+                if parts and all(part is not None for part in parts):
+                    narrow(set().union(*parts))
+            elif key in self._field_rows:
+                values = _equality_values(condition)
+                if values is not None:
+                    index = self._field_rows[key]
+                    narrow(set().union(*(index.get(value, ()) for value in values)))
+        return candidates
+
+    # ---------- 写入 ----------
+
+    def add(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[Sequence[str]] = None,
+        metadatas: Optional[Sequence[Dict]] = None,
+    ):
+        """追加向量；已存在的ID跳过（与ChromaDB add一致）"""
+        self._ensure_loaded()
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("embeddings 与 ids 数量不一致")
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{}] * len(ids)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"嵌入维度不一致: {vectors.shape[1]} != {self.dim}")
+
+            seen = set()
+            keep = []
+            for i, chunk_id in enumerate(ids):
+                if chunk_id in self._row_of or chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                keep.append(i)
+            if len(keep) < len(ids):
+                logger.warning(f"跳过 {len(ids) - len(keep)} 个已存在的ID")
+            if not keep:
+                return
+
+            vectors = vectors[keep]
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            with open(self.vectors_path, "ab") as f:
+                vectors.astype(self.dtype).tofile(f)
+
+            start = self.rows
+            records = []
+            for offset, i in enumerate(keep):
+                metadata = dict(metadatas[i] or {})
+                records.append((start + offset, ids[i], documents[i], json.dumps(metadata, ensure_ascii=False)))
+                self._ids.append(ids[i])
+                self._metadatas.append(metadata)
+                self._row_of[ids[i]] = start + offset
+                self._index_row(start + offset)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)", records
+            )
+            self._conn.commit()
+
+            self.rows += len(keep)
+            self._alive = np.concatenate([self._alive, np.ones(len(keep), dtype=bool)])
+            self._save_manifest()
+            self._remap()
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        documents: Optional[Sequence[str]] = None,
+        metadatas: Optional[Sequence[Dict]] = None,
+    ):
+        """写入向量；已存在的ID先删除再追加（与ChromaDB upsert一致）"""
+        self._ensure_loaded()
+        with self._lock:
+            existing = [chunk_id for chunk_id in ids if chunk_id in self._row_of]
+            if existing:
+                self.delete(ids=existing)
+            self.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def update(
+        self,
+        ids: Sequence[str],
+        metadatas: Optional[Sequence[Dict]] = None,
+        documents: Optional[Sequence[str]] = None,
+    ):
+        """只更新已存在块的元数据与文本，不改动向量（与ChromaDB update一致，不存在的ID跳过）"""
+        self._ensure_loaded()
+        with self._lock:
+            records = []
+            for i, chunk_id in enumerate(ids):
+                row = self._row_of.get(chunk_id)
+                if row is None:
+                    continue
+                if metadatas is not None:
+                    self._unindex_row(row)
+                    self._metadatas[row] = dict(metadatas[i] or {})
+                    self._index_row(row)
+                document = documents[i] if documents is not None else None
+                records.append((json.dumps(self._metadatas[row], ensure_ascii=False), document, row))
+            if documents is None:
+                self._conn.executemany("UPDATE chunks SET metadata = ? WHERE row = ?", [(m, r) for m, _, r in records])
+            else:
+                self._conn.executemany("UPDATE chunks SET metadata = ?, document = ? WHERE row = ?", records)
+            self._conn.commit()
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None):
+        """按ID或条件删除（标记删除，比例过高时压缩）"""
+        self._ensure_loaded()
+        with self._lock:
+            rows = self._select_rows(ids=ids, where=where)
+            if not rows:
+                return
+            for row in rows:
+                self._alive[row] = False
+                self._row_of.pop(self._ids[row], None)
+                self._unindex_row(row)
+            self._conn.executemany("UPDATE chunks SET deleted = 1 WHERE row = ?", [(r,) for r in rows])
+            self._conn.commit()
+            if self.rows and 1 - self._alive.sum() / self.rows > COMPACT_RATIO:
+                self.compact()
+
+    def compact(self):
+        """
+        重写存储，去除已删除的行
+
+        新行写入下一代的向量文件与元数据库，提交后替换manifest切换到新一代；
+        切换前中断时旧一代保持完整，新一代残留文件在下次加载时删除
+        """
+        self._ensure_loaded()
+        with self._lock:
+            keep = np.nonzero(self._alive)[0]
+            generation = self.generation + 1
+            vectors_path, metadata_path = self._generation_paths(generation)
+            for path in (vectors_path, metadata_path):
+                path.unlink(missing_ok=True)
+
+            with open(vectors_path, "wb") as f:
+                for start in range(0, len(keep), SEARCH_BLOCK_ROWS):
+                    np.asarray(self._vectors[keep[start:start + SEARCH_BLOCK_ROWS]]).tofile(f)
+
+            old_rows = {int(old): new for new, old in enumerate(keep.tolist())}
+            records = self._conn.execute(
+                "SELECT row, id, document, metadata FROM chunks WHERE deleted = 0 ORDER BY row"
+            ).fetchall()
+            conn = self._connect(metadata_path)
+            conn.executemany(
+                "INSERT INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [(old_rows[row], chunk_id, document, metadata) for row, chunk_id, document, metadata in records],
+            )
+            conn.commit()
+
+            # 切换到新一代（manifest写入失败时保持旧一代）
+            previous = (self.generation, self.rows)
+            self.generation, self.rows = generation, len(keep)
+            try:
+                self._save_manifest()
+            except Exception:
+                self.generation, self.rows = previous
+                conn.close()
+                raise
+
+            self._vectors = None
+            self._conn.close()
+            self._conn = conn
+            self.vectors_path, self.metadata_path = vectors_path, metadata_path
+            self._remove_stale_generations()
+
+            self._ids = [self._ids[i] for i in keep]
+            self._metadatas = [self._metadatas[i] for i in keep]
+            self._row_of = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+            self._alive = np.ones(self.rows, dtype=bool)
+            self._rebuild_field_index()
+            self._remap()
+            logger.info(f"本地向量索引压缩完成: {self.rows} 条（第 {self.generation} 代）")
+
+    # ---------- 查询 ----------
+
+    def _select_rows(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None) -> List[int]:
+        if ids is not None:
+            rows = [self._row_of[i] for i in ids if i in self._row_of]
+        else:
+            candidates = self._indexed_candidates(where) if where else None
+            rows = sorted(candidates) if candidates is not None else np.nonzero(self._alive)[0].tolist()
+        if where:
+            rows = [r for r in rows if match_where(self._metadatas[r], where)]
+        return rows
+
+    def _where_mask(self, where: Optional[Dict]) -> np.ndarray:
+        if not where:
+            return self._alive
+        mask = np.zeros(self.rows, dtype=bool)
+        mask[self._select_rows(where=where)] = True
+        return mask
+
+    def _documents(self, rows: List[int]) -> List[Optional[str]]:
+        found = {}
+        # 分批查询，避免超出SQLite参数个数上限
+        for start in range(0, len(rows), 500):
+            batch = rows[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            found.update(self._conn.execute(
+                f"SELECT row, document FROM chunks WHERE row IN ({placeholders})", batch
+            ).fetchall())
+        return [found.get(r) for r in rows]
+
+    def _result(self, rows: List[int], include: Sequence[str]) -> Dict[str, List]:
+        result: Dict[str, List] = {"ids": [self._ids[r] for r in rows]}
+        if "documents" in include:
+            result["documents"] = self._documents(rows)
+        if "metadatas" in include:
+            result["metadatas"] = [dict(self._metadatas[r]) for r in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [np.asarray(self._vectors[r], dtype=np.float32).tolist() for r in rows]
+        return result
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        include: Sequence[str] = DEFAULT_INCLUDE,
+    ) -> Dict[str, List]:
+        self._ensure_loaded()
+        with self._lock:
+            rows = self._select_rows(ids=ids, where=where)
+            rows = rows[offset:offset + limit] if limit is not None else rows[offset:]
+            return self._result(rows, include)
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Sequence[str] = ("documents", "metadatas", "distances"),
+    ) -> Dict[str, List[List]]:
+        """精确最近邻检索，distances 为余弦距离 (1 - 余弦相似度)"""
+        self._ensure_loaded()
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries / (np.linalg.norm(queries, axis=1, keepdims=True) + 1e-12)
+
+        with self._lock:
+            results: Dict[str, List[List]] = {"ids": []}
+            for key in include:
+                results[key] = []
+            mask = self._where_mask(where)
+            candidates = np.nonzero(mask)[0]
+
+            for query in queries:
+                if not len(candidates) or self._vectors is None:
+                    rows, scores = [], np.empty(0, dtype=np.float32)
+                else:
+                    if self.dim != len(query):
+                        raise ValueError(f"查询向量维度不一致: {len(query)} != {self.dim}")
+                    scores = np.empty(len(candidates), dtype=np.float32)
+                    for start in range(0, len(candidates), SEARCH_BLOCK_ROWS):
+                        block = candidates[start:start + SEARCH_BLOCK_ROWS]
+                        if len(block) == block[-1] - block[0] + 1:
+                            # 连续行直接切片，避免花式索引复制
+                            vectors = self._vectors[block[0]:block[-1] + 1]
+                        else:
+                            vectors = self._vectors[block]
+                        scores[start:start + len(block)] = np.asarray(vectors, dtype=np.float32) @ query
+                    k = min(n_results, len(candidates))
+                    top = np.argpartition(-scores, k - 1)[:k]
+                    top = top[np.argsort(-scores[top], kind="stable")]
+                    rows, scores = candidates[top].tolist(), scores[top]
+
+                single = self._result(rows, include)
+                results["ids"].append(single["ids"])
+                for key in include:
+                    if key == "distances":
+                        results["distances"].append((1.0 - scores).tolist())
+                    else:
+                        results[key].append(single[key])
+            return results
+
+    def count(self) -> int:
+        self._ensure_loaded()
+        return int(self._alive.sum())
+
+    def get_stats(self) -> Dict:
+        if not self._loaded:
+            return {"loaded": False}
+        with self._lock:
+            return {
+                "loaded": True,
+                "rows": self.rows,
+                "alive": int(self._alive.sum()),
+                "dim": self.dim,
+                "dtype": self.dtype.name,
+                "bytes": self.rows * (self.dim or 0) * self.dtype.itemsize,
+            }
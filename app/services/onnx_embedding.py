@@ -0,0 +1,215 @@
+"""
+ONNX int8 嵌入运行时
+将 SentenceTransformer 的 Transformer 主干导出为ONNX并做动态int8量化，用 onnxruntime 在CPU上推理；
+切换前与fp32模型在样本集上比较嵌入（余弦相似度、recall@k、吞吐），达标才替换。
+
+导出与量化需要 torch、onnx、onnxruntime；推理只需要 onnxruntime 与 transformers 的分词器。
+"""
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from loguru import logger
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+REPORT_FILE = "accuracy_report.json"
+
+# 内置的精度检查样本（有价证券报告书常见表述）
+SAMPLE_TEXTS = [
+    "当連結会計年度の売上高は前年同期比で増加しました。",
+    "原材料価格の高騰により営業利益は減少しました。",
+    "為替変動リスクについては継続的に監視しております。",
+    "設備投資は主に生産能力の増強を目的としております。",
+    "研究開発費の総額は前年を上回りました。",
+    "のれんの減損損失を特別損失に計上しました。",
+    "従業員数は連結で前期末より増加しております。",
+    "自己株式の取得を取締役会で決議しました。",
+    "配当方針として安定的な配当の継続を基本としております。",
+    "金融サービス事業のセグメント利益は改善しました。",
+    "気候変動への対応としてサステナビリティ委員会を設置しました。",
+    "有利子負債残高は社債の償還により減少しました。",
+    "主要な顧客との取引条件に重要な変更はありません。",
+    "営業活動によるキャッシュ・フローは増加しました。",
+    "当社の監査法人は有限責任監査法人です。",
+    "新型感染症の影響により海外拠点の稼働率が低下しました。",
+    "役員報酬は固定報酬と業績連動報酬で構成されております。",
+    "棚卸資産の評価方法は移動平均法によっております。",
+    "リース取引に関する会計基準を適用しております。",
+    "重要な後発事象として子会社株式の譲渡を決定しました。",
+]
+
+
+class OnnxEmbeddingModel:
+    """与 SentenceTransformer.encode 兼容的ONNX嵌入模型（平均池化 + L2归一化）"""
+
+    def __init__(self, model_path: str, tokenizer_dir: str, max_length: int = 512, num_threads: Optional[int] = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir)
+        self.max_length = max_length
+        self.model_path = model_path
+
+    def encode(self, texts, batch_size: int = 32, normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        parts = []
+        for start in range(0, len(texts), batch_size):
+            batch = self.tokenizer(
+                list(texts[start:start + batch_size]),
+                padding=True, truncation=True, max_length=self.max_length, return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in batch.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = batch["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            parts.append(pooled.astype(np.float32))
+        emb = np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+        if normalize_embeddings and len(emb):
+            emb /= np.linalg.norm(emb, axis=1, keepdims=True) + 1e-12
+        return emb
+
+
+def export_int8(sentence_model, output_dir: str, opset: int = 17) -> Path:
+    """
+    导出 SentenceTransformer 的Transformer主干并做动态int8量化
+
+    Returns:
+        量化后的模型路径（分词器同时保存在 output_dir）
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    transformer = sentence_model[0]
+    hf_model, tokenizer = transformer.auto_model, transformer.tokenizer
+    hf_model.eval()
+
+    sample = tokenizer(["サンプル"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = output_dir / FP32_FILE
+    with torch.no_grad():
+        torch.onnx.export(
+            hf_model,
+            tuple(sample[name] for name in input_names),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            dynamo=False,
+        )
+    int8_path = output_dir / INT8_FILE
+    quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(str(output_dir))
+    logger.info(f"已导出int8 ONNX模型: {int8_path}")
+    return int8_path
+
+
+def evaluate_embedding_model(reference, candidate, texts: Sequence[str], k: int = 5, batch_size: int = 32) -> Dict:
+    """
+    在样本集上比较候选模型与参考模型（fp32）
+
+    每个样本作为查询，比较两者在样本集内的 top-k 近邻是否一致（recall@k），
+    并报告逐条嵌入的余弦相似度与各自的吞吐（texts/sec）。
+    """
+    texts = list(texts)
+    report: Dict = {"samples": len(texts), "k": k}
+    embeddings = {}
+    for label, model in (("reference", reference), ("candidate", candidate)):
+        start = time.perf_counter()
+        emb = np.asarray(model.encode(texts, batch_size=batch_size, normalize_embeddings=True), dtype=np.float32)
+        elapsed = time.perf_counter() - start
+        embeddings[label] = emb / (np.linalg.norm(emb, axis=1, keepdims=True) + 1e-12)
+        report[f"{label}_texts_per_sec"] = round(len(texts) / max(elapsed, 1e-9), 2)
+
+    ref, cand = embeddings["reference"], embeddings["candidate"]
+    cosine = (ref * cand).sum(axis=1)
+    report["cosine_mean"] = round(float(cosine.mean()), 5)
+    report["cosine_min"] = round(float(cosine.min()), 5)
+
+    k = min(k, len(texts) - 1)
+    if k > 0:
+        # 排除自身后的近邻
+        ref_sim, cand_sim = ref @ ref.T, cand @ cand.T
+        np.fill_diagonal(ref_sim, -np.inf)
+        np.fill_diagonal(cand_sim, -np.inf)
+        ref_top = np.argsort(-ref_sim, axis=1)[:, :k]
+        cand_top = np.argsort(-cand_sim, axis=1)[:, :k]
+        overlap = [len(set(a) & set(b)) / k for a, b in zip(ref_top.tolist(), cand_top.tolist())]
+        report["recall_at_k"] = round(float(np.mean(overlap)), 4)
+    else:
+        report["recall_at_k"] = 1.0
+    report["speedup"] = round(report["candidate_texts_per_sec"] / max(report["reference_texts_per_sec"], 1e-9), 2)
+    return report
+
+
+class OnnxInt8Runtime:
+    """管理ONNX int8模型的导出、加载与精度检查报告（按模型名分目录）"""
+
+    def __init__(
+        self,
+        model_name: str,
+        root_dir: str,
+        min_recall: float = 0.9,
+        min_cosine: float = 0.97,
+        num_threads: Optional[int] = None,
+    ):
+        self.model_name = model_name
+        self.model_dir = Path(root_dir) / model_name.replace("/", "__")
+        self.min_recall = min_recall
+        self.min_cosine = min_cosine
+        self.num_threads = num_threads
+
+    @property
+    def model_path(self) -> Path:
+        return self.model_dir / INT8_FILE
+
+    def load(self, reference=None) -> OnnxEmbeddingModel:
+        """加载int8模型；不存在时由 reference（fp32 SentenceTransformer）导出"""
+        if not self.model_path.exists():
+            if reference is None:
+                raise FileNotFoundError(f"ONNX模型不存在: {self.model_path}")
+            export_int8(reference, str(self.model_dir))
+        return OnnxEmbeddingModel(str(self.model_path), str(self.model_dir), num_threads=self.num_threads)
+
+    def passed(self, report: Dict) -> bool:
+        return report.get("recall_at_k", 0) >= self.min_recall and report.get("cosine_min", 0) >= self.min_cosine
+
+    def _fingerprint(self) -> Dict:
+        stat = self.model_path.stat()
+        return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+    def verified_report(self) -> Optional[Dict]:
+        """当前模型文件已通过检查时返回保存的报告"""
+        path = self.model_dir / REPORT_FILE
+        if not path.exists() or not self.model_path.exists():
+            return None
+        try:
+            report = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            return None
+        if report.get("model_file") != self._fingerprint() or not self.passed(report):
+            return None
+        return report
+
+    def check(self, reference, candidate: OnnxEmbeddingModel, texts: Optional[List[str]] = None, k: int = 5) -> Dict:
+        """运行精度检查并保存报告"""
+        report = evaluate_embedding_model(reference, candidate, texts or SAMPLE_TEXTS, k=k)
+        report["passed"] = self.passed(report)
+        report["thresholds"] = {"recall_at_k": self.min_recall, "cosine_min": self.min_cosine}
+        report["model_file"] = self._fingerprint()
+        (self.model_dir / REPORT_FILE).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        return report
@@ -0,0 +1,218 @@
+"""
+原始文档存储模块
+按内容哈希保存从EDINET下载的原始文件（ZIP/PDF），按 doc_id 索引，超出容量时按LRU淘汰
+"""
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional, Tuple
+
+from loguru import logger
+
+# 允许保存的响应类型；EDINET出错时会以JSON返回，不应写入存储
+STORABLE_CONTENT_TYPES = ("application/zip", "application/pdf")
+
+# get_or_fetch 按文档分散到固定数量的锁上（不同文档偶尔共用一把锁，只会串行下载）
+KEY_LOCK_STRIPES = 64
+
+
+class _HashingWriter:
+    """写入文件的同时计算SHA-256"""
+
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
+
+
+class RawDocumentStore:
+    """内容寻址的原始文档存储"""
+
+    def __init__(self, root_dir: str, max_bytes: int = 20 * 1024 ** 3):
+        """
+        Args:
+            root_dir: 存储根目录（settings.raw_data_dir）
+            max_bytes: 存储容量上限，超出时淘汰最久未访问的文档
+        """
+        self.root_dir = Path(root_dir)
+        self.objects_dir = self.root_dir / "objects"
+        self.tmp_dir = self.root_dir / "tmp"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+        self._conn = sqlite3.connect(str(self.root_dir / "index.sqlite3"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " doc_id TEXT NOT NULL,"
+            " file_type TEXT NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " content_type TEXT NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " PRIMARY KEY (doc_id, file_type))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_sha256 ON documents (sha256)")
+        self._conn.commit()
+        logger.info(f"初始化原始文档存储: {self.root_dir}")
+
+    def _object_path(self, sha256: str) -> Path:
+        return self.objects_dir / sha256[:2] / sha256
+
+    def get(self, doc_id: str, file_type: str = "1") -> Optional[Tuple[Path, str]]:
+        """
+        获取已保存的文档
+
+        Returns:
+            (文件路径, Content-Type)，不存在时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256, content_type FROM documents WHERE doc_id = ? AND file_type = ?",
+                (doc_id, file_type),
+            ).fetchone()
+            if row is None:
+                return None
+
+            sha256, content_type = row
+            path = self._object_path(sha256)
+            if not path.exists():
+                # 文件被外部删除，清理索引
+                self._conn.execute(
+                    "DELETE FROM documents WHERE doc_id = ? AND file_type = ?", (doc_id, file_type)
+                )
+                self._conn.commit()
+                return None
+
+            self._conn.execute(
+                "UPDATE documents SET last_access = ? WHERE doc_id = ? AND file_type = ?",
+                (time.time(), doc_id, file_type),
+            )
+            self._conn.commit()
+            return path, content_type
+
+    def put(
+        self,
+        doc_id: str,
+        file_type: str,
+        writer: Callable[[BinaryIO], Optional[str]],
+    ) -> Optional[Tuple[Path, str]]:
+        """
+        通过回调写入文档内容并保存
+
+        Args:
+            doc_id: 文档ID
+            file_type: EDINET文件类型
+            writer: 将内容写入给定文件对象并返回Content-Type的回调
+
+        Returns:
+            (文件路径, Content-Type)，内容类型不可保存时返回None
+        """
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir)
+        tmp_path = Path(tmp_name)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                hashing_writer = _HashingWriter(f)
+                content_type = writer(hashing_writer)
+
+            if content_type not in STORABLE_CONTENT_TYPES:
+                logger.warning(f"文档 {doc_id} 的响应类型 {content_type} 不保存到原始存储")
+                return None
+
+            sha256 = hashing_writer.sha256.hexdigest()
+            path = self._object_path(sha256)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists():
+                tmp_path.unlink()
+            else:
+                os.replace(tmp_path, path)
+
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents"
+                    " (doc_id, file_type, sha256, size, content_type, last_access)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (doc_id, file_type, sha256, hashing_writer.size, content_type, time.time()),
+                )
+                self._conn.commit()
+                self._evict(keep=(doc_id, file_type))
+
+            return path, content_type
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def get_or_fetch(
+        self,
+        doc_id: str,
+        file_type: str,
+        writer: Callable[[BinaryIO], Optional[str]],
+    ) -> Optional[Tuple[Path, str]]:
+        """命中则直接返回，否则调用writer下载并保存（同一文档并发请求只下载一次）"""
+        key_lock = self._key_locks[hash((doc_id, file_type)) % len(self._key_locks)]
+        with key_lock:
+            cached = self.get(doc_id, file_type)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+            return self.put(doc_id, file_type, writer)
+
+    def _total_bytes(self) -> int:
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT sha256, MAX(size) AS size FROM documents GROUP BY sha256)"
+        ).fetchone()
+        return total
+
+    def _evict(self, keep: Tuple[str, str]):
+        """按最久未访问顺序淘汰，直到总大小不超过上限（调用方持有锁）"""
+        total = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT doc_id, file_type, sha256, size FROM documents ORDER BY last_access ASC"
+        ).fetchall()
+        for doc_id, file_type, sha256, size in rows:
+            if total <= self.max_bytes:
+                break
+            if (doc_id, file_type) == keep:
+                continue
+
+            self._conn.execute(
+                "DELETE FROM documents WHERE doc_id = ? AND file_type = ?", (doc_id, file_type)
+            )
+            (refs,) = self._conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+            if refs == 0:
+                self._object_path(sha256).unlink(missing_ok=True)
+                total -= size
+            logger.info(f"淘汰原始文档: {doc_id} (type={file_type})")
+
+        self._conn.commit()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()
+            total = self._total_bytes()
+        return {
+            "entries": entries,
+            "total_bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
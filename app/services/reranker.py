@@ -0,0 +1,126 @@
+"""
+重排序模块
+对向量检索的候选块用Cross-Encoder重新打分并保留前k个；
+(问题哈希, 块ID) 的得分缓存使重复的问题跳过模型推理
+"""
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from app.utils.lru_cache import LRUCache
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class CrossEncoderReranker:
+    """基于sentence-transformers CrossEncoder的重排序器（CPU推理，模型后台加载）"""
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1",
+        device: str = "cpu",
+        batch_size: int = 16,
+        max_length: int = 512,
+        cache_size: int = 10000,
+        cache_ttl: Optional[float] = None,
+        preload: bool = True,
+    ):
+        """
+        Args:
+            model_name: Cross-Encoder模型
+            batch_size: 推理批大小
+            max_length: (问题, 块) 对的最大token数
+            cache_size: 得分缓存条数上限
+            preload: 是否在后台线程中预先加载模型
+        """
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.model = None
+        self.load_error: Optional[str] = None
+        self.score_cache = LRUCache(max_size=cache_size, ttl_seconds=cache_ttl)
+        self.hits = 0
+        self.misses = 0
+        self._load_lock = threading.Lock()
+        if preload:
+            threading.Thread(target=self._get_model, daemon=True).start()
+        logger.info(f"初始化重排序器: {model_name}")
+
+    def _get_model(self):
+        if self.model is not None or self.load_error is not None:
+            return self.model
+        with self._load_lock:
+            if self.model is None and self.load_error is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    self.model = CrossEncoder(self.model_name, device=self.device, max_length=self.max_length)
+                    logger.info(f"重排序模型加载完成: {self.model_name}")
+                except Exception as e:
+                    self.load_error = str(e)
+                    logger.warning(f"重排序模型加载失败，跳过重排序: {e}")
+        return self.model
+
+    @staticmethod
+    def query_hash(query: str) -> str:
+        return _digest(unicodedata.normalize("NFKC", query).strip())
+
+    def rerank(self, query: str, documents: List[Dict], top_k: int) -> List[Dict]:
+        """
+        重新打分并返回得分最高的 top_k 个块（写入 rerank_score）
+
+        Args:
+            documents: 检索结果（含 chunk_id、text）
+
+        模型不可用或仍在加载时按原顺序截取
+        """
+        if not documents:
+            return []
+        model = self.model or (None if self._load_lock.locked() else self._get_model())
+        if model is None:
+            return documents[:top_k]
+
+        query_hash = self.query_hash(query)
+        scores: List[Optional[float]] = []
+        missing = []
+        for i, doc in enumerate(documents):
+            # 缓存值带上块文本摘要，块被重新入库后旧得分不再使用
+            cached = self.score_cache.get((query_hash, doc.get("chunk_id")))
+            text_digest = _digest(doc.get("text", ""))
+            if cached is not None and cached[0] == text_digest:
+                scores.append(cached[1])
+            else:
+                scores.append(None)
+                missing.append((i, text_digest))
+
+        self.hits += len(documents) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            pairs = [(query, documents[i].get("text", "")) for i, _ in missing]
+            predicted = model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            for (i, text_digest), score in zip(missing, predicted):
+                scores[i] = float(score)
+                self.score_cache.put((query_hash, documents[i].get("chunk_id")), (text_digest, float(score)))
+
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)[:top_k]
+        reranked = []
+        for i in order:
+            doc = dict(documents[i])
+            doc["rerank_score"] = scores[i]
+            reranked.append(doc)
+        return reranked
+
+    def get_stats(self) -> Dict:
+        return {
+            "model": self.model_name,
+            "loaded": self.model is not None,
+            "error": self.load_error,
+            "score_cache_size": len(self.score_cache),
+            "score_cache_hits": self.hits,
+            "score_cache_misses": self.misses,
+        }
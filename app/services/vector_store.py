@@ -1,4 +1,6 @@
 import chromadb
+import hashlib
+import json
 import os
 import threading
 from chromadb.config import Settings
@@ -7,6 +9,16 @@ from typing import List, Dict, Any, Optional
 import numpy as np
 from loguru import logger
 import time
+import unicodedata
+import re
+
+from app.services.bm25_index import reciprocal_rank_fusion
+from app.services.local_index import LocalVectorIndex
+from app.services.onnx_embedding import OnnxInt8Runtime, SAMPLE_TEXTS
+from app.utils.lru_cache import LRUCache
+
+# 参与块内容哈希的元数据字段
+HASHED_METADATA = ("company_name", "edinet_code", "filing_date", "type", "section", "heading")
 
 
 class VectorStoreManager:
@@ -21,42 +33,98 @@ class VectorStoreManager:
         fallback_model: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
         device: str = "cpu",
         max_retries: int = 3,
+        batch_size: int = 32,
+        query_cache_size: int = 1024,
+        embedding_cache=None,
+        backend: str = "chroma",
+        index_dir: Optional[str] = None,
+        index_dtype: str = "float16",
+        embedding_runtime: str = "torch",
+        onnx_model_dir: str = "models/onnx",
+        onnx_min_recall: float = 0.9,
+        onnx_min_cosine: float = 0.97,
     ):
         self.host = host
         self.port = port
         self.collection_name = collection_name
         self.device = device
         self.max_retries = max_retries
+        self.batch_size = max(1, batch_size)
         self.primary_model = embedding_model
         self.fallback_model = fallback_model
-
-        # 初始化 ChromaDB 客户端（优先 HTTP 客户端，失败则回退到内存客户端）
-        try:
-            self.client = chromadb.HttpClient(
-                host=host,
-                port=port,
-                settings=Settings(
-                    chroma_server_auth_provider="token",
-                    chroma_server_auth_credentials="test-token",
-                ),
+        # 可选的跨请求合批服务（由应用启动时设置）
+        self.embedding_service = None
+        # 查询嵌入缓存（键: 模型名 + 规范化查询文本），替换模型时自动清空
+        self.query_cache = LRUCache(max_size=query_cache_size)
+        # 文档嵌入磁盘缓存（键: 模型名 + 文本哈希），可选
+        self.embedding_cache = embedding_cache
+        # 可选的语义回答缓存（由应用启动时设置），文档重新入库或删除时使其失效
+        self.answer_cache = None
+        # 可选的BM25关键词索引（由应用启动时设置），设置后检索为向量与关键词的RRF融合
+        self.keyword_index = None
+        self.rrf_k = 60
+        self.hybrid_candidates = 4  # 每路候选数 = n_results * hybrid_candidates
+        # 嵌入运行时：torch（fp32）/ onnx-int8（导出并量化主模型，通过精度检查后替换）
+        self.embedding_runtime = embedding_runtime
+        self.onnx_runtime = None
+        self.embedding_runtime_report: Optional[Dict] = None
+        if embedding_runtime == "onnx-int8":
+            self.onnx_runtime = OnnxInt8Runtime(
+                embedding_model, onnx_model_dir, min_recall=onnx_min_recall, min_cosine=onnx_min_cosine
             )
-        except Exception as e:
-            logger.warning(f"ChromaDB连接失败（带认证）: {e}，尝试不带认证...")
+        elif embedding_runtime != "torch":
+            raise ValueError(f"未知的嵌入运行时: {embedding_runtime}")
+
+        self.backend = backend
+        if backend == "local":
+            # 进程内索引：无HTTP往返，持久化到 index_dir，首次访问时加载
+            if not index_dir:
+                raise ValueError("local 后端需要指定 index_dir")
+            self.client = None
+        else:
+            # 初始化 ChromaDB 客户端（优先 HTTP 客户端，失败则回退到内存客户端）
             try:
-                self.client = chromadb.HttpClient(host=host, port=port)
-            except Exception as e2:
-                logger.error(f"ChromaDB连接失败（不带认证）: {e2}")
-                logger.info("使用内存客户端")
-                self.client = chromadb.EphemeralClient()
+                self.client = chromadb.HttpClient(
+                    host=host,
+                    port=port,
+                    settings=Settings(
+                        chroma_server_auth_provider="token",
+                        chroma_server_auth_credentials="test-token",
+                    ),
+                )
+            except Exception as e:
+                logger.warning(f"ChromaDB连接失败（带认证）: {e}，尝试不带认证...")
+                try:
+                    self.client = chromadb.HttpClient(host=host, port=port)
+                except Exception as e2:
+                    logger.error(f"ChromaDB连接失败（不带认证）: {e2}")
+                    logger.info("使用内存客户端")
+                    self.client = chromadb.EphemeralClient()
 
         # 先使用轻量简单模型，避免在启动时被大模型下载阻塞
         self.embedding_model = self._create_simple_embedding_model()
+        # 真实模型（或通过精度检查的ONNX模型）就绪后置位；入库任务应等待它，避免写入随机向量
+        self.model_ready = threading.Event()
 
         # 在后台异步加载主模型与备用模型（成功后替换 self.embedding_model）
         threading.Thread(target=self._load_embedding_model_background, daemon=True).start()
 
         # 获取或创建集合
-        self.collection = self._get_or_create_collection()
+        if backend == "local":
+            self.collection = LocalVectorIndex(index_dir, dtype=index_dtype)
+        else:
+            self.collection = self._get_or_create_collection()
+
+    @property
+    def embedding_model(self):
+        return self._embedding_model
+
+    @embedding_model.setter
+    def embedding_model(self, model):
+        """替换嵌入模型，并使查询嵌入缓存失效。"""
+        self._embedding_model = model
+        self.embedding_model_name = type(model).__name__
+        self.query_cache.clear()
 
     def _load_embedding_model_with_retry(self):
         """带重试的模型加载函数（同步）。"""
@@ -73,7 +141,7 @@ class VectorStoreManager:
 
                     model = SentenceTransformer(model_name, device=self.device, cache_folder="/app/models")
                     logger.info(f"✅ 成功加载模型: {model_name}")
-                    return model
+                    return model_name, model
 
                 except Exception as e:
                     logger.warning(f"加载模型 {model_name} 失败 (尝试 {attempt + 1}): {e}")
@@ -85,23 +153,80 @@ class VectorStoreManager:
                         logger.error(f"无法加载模型 {model_name}，已重试 {self.max_retries} 次")
 
         logger.error("所有模型加载失败，使用简单嵌入模型作为退路")
-        return None
+        return None, None
 
     def _load_embedding_model_background(self):
         """在后台加载真实模型；加载成功后替换当前的简单模型。"""
         try:
-            model = self._load_embedding_model_with_retry()
+            if self.onnx_runtime is not None and self._load_verified_onnx():
+                self.model_ready.set()
+                return
+            model_name, model = self._load_embedding_model_with_retry()
             if model:
                 self.embedding_model = model
+                self.embedding_model_name = model_name
                 logger.info("后台模型加载完成，已替换简单嵌入模型")
+                if self.onnx_runtime is not None and model_name == self.primary_model:
+                    self._switch_to_onnx(model)
+                self.model_ready.set()
+            else:
+                logger.error("没有可用的嵌入模型，入库将保持暂停")
         except Exception as e:
             logger.error(f"后台加载嵌入模型失败: {e}")
 
+    def _use_onnx_model(self, model, report: Dict):
+        self.embedding_model = model
+        self.embedding_model_name = f"{self.primary_model}@onnx-int8"
+        self.embedding_runtime_report = report
+        logger.info(
+            f"已切换到ONNX int8嵌入 (recall@{report.get('k')}={report.get('recall_at_k')}, "
+            f"cosine_min={report.get('cosine_min')}, speedup={report.get('speedup')}x)"
+        )
+
+    def _load_verified_onnx(self) -> bool:
+        """已有通过精度检查的int8模型时直接加载，无需先加载fp32模型"""
+        report = self.onnx_runtime.verified_report()
+        if report is None:
+            return False
+        try:
+            self._use_onnx_model(self.onnx_runtime.load(), report)
+            return True
+        except Exception as e:
+            logger.warning(f"加载ONNX int8模型失败，使用fp32模型: {e}")
+            return False
+
+    def _switch_to_onnx(self, reference):
+        """导出（如需要）int8模型，与fp32模型比较后决定是否替换"""
+        try:
+            candidate = self.onnx_runtime.load(reference)
+            report = self.onnx_runtime.check(reference, candidate, self._accuracy_sample_texts())
+        except Exception as e:
+            logger.warning(f"ONNX int8运行时不可用，继续使用fp32模型: {e}")
+            self.embedding_runtime_report = {"passed": False, "error": str(e)}
+            return
+        if report["passed"]:
+            self._use_onnx_model(candidate, report)
+        else:
+            self.embedding_runtime_report = report
+            logger.warning(f"ONNX int8模型未通过精度检查，继续使用fp32模型: {report}")
+
+    def _accuracy_sample_texts(self, limit: int = 200) -> List[str]:
+        """精度检查样本：内置样本加上集合中已有的块"""
+        texts = list(SAMPLE_TEXTS)
+        try:
+            texts += [d for d in self.collection.get(limit=limit, include=["documents"])["documents"] if d]
+        except Exception as e:
+            logger.debug(f"读取精度检查样本失败: {e}")
+        return texts
+
     def _create_simple_embedding_model(self):
         """创建一个非常轻量的嵌入实现，接受与 SentenceTransformer 兼容的参数。"""
         import numpy as _np
 
         class SimpleEmbeddingModel:
+            # 随机向量，不能写入嵌入缓存
+            cacheable = False
+
             def __init__(self):
                 self.embedding_dim = 384
                 logger.warning("使用简单的嵌入模型（仅用于开发/快速启动）")
@@ -126,92 +251,389 @@ class VectorStoreManager:
             logger.info(f"创建新集合: {self.collection_name}")
             return self.client.create_collection(name=self.collection_name, metadata={"description": "EDINET有价证券报告书"})
 
-    def create_embeddings(self, texts: List[str]) -> np.ndarray:
-        """创建文本嵌入，统一调用当前可用的 embedding_model.encode。"""
+    def create_embeddings(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """创建文本嵌入。
+
+        按文本长度排序后分小批调用 embedding_model.encode，使同一批内长度接近以减少padding浪费，
+        最后按原顺序还原结果。
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        batch_size = max(1, batch_size or self.batch_size)
+        # 固定本次调用使用的模型，避免后台加载中途替换导致同一批嵌入维度不一致
+        model = self.embedding_model
         prefixed_texts = [f"query: {t}" for t in texts]
+        order = sorted(range(len(prefixed_texts)), key=lambda i: len(prefixed_texts[i]))
+
+        parts = []
+        for start in range(0, len(order), batch_size):
+            batch = [prefixed_texts[i] for i in order[start:start + batch_size]]
+            parts.append(self._encode_batch(model, batch, batch_size))
+
+        sorted_emb = np.vstack(parts)
+        emb = np.empty_like(sorted_emb)
+        emb[order] = sorted_emb
+        return emb
+
+    def embed(self, texts: List[str], priority: str = "bulk") -> np.ndarray:
+        """获取嵌入：批量入库时先查磁盘缓存，配置了合批服务时经服务合批（查询优先），否则直接编码。"""
+        if priority == "bulk" and self.embedding_cache is not None and getattr(self.embedding_model, "cacheable", True):
+            return self._embed_with_disk_cache(texts)
+        return self._embed_uncached(texts, priority)
+
+    def _embed_uncached(self, texts: List[str], priority: str) -> np.ndarray:
+        if self.embedding_service is not None:
+            return self.embedding_service.embed(texts, priority=priority)
+        return self.create_embeddings(texts)
+
+    def _embed_with_disk_cache(self, texts: List[str]) -> np.ndarray:
+        """只对磁盘缓存未命中的文本调用模型，并回写缓存"""
+        model_name = self.embedding_model_name
+        hit_mask, hit_vectors = self.embedding_cache.get_many(model_name, texts)
+        if hit_mask.all():
+            return hit_vectors
+
+        miss_idx = np.nonzero(~hit_mask)[0]
+        miss_texts = [texts[i] for i in miss_idx]
+        miss_vectors = self._embed_uncached(miss_texts, "bulk")
+        # 编码期间模型被替换时不回写，避免把新模型的向量记在旧模型名下
+        if self.embedding_model_name == model_name:
+            self.embedding_cache.put_many(model_name, miss_texts, miss_vectors)
+
+        if hit_vectors is None:
+            return miss_vectors
+        if hit_vectors.shape[1] != miss_vectors.shape[1]:
+            return self._embed_uncached(texts, "bulk")
+        emb = np.empty((len(texts), miss_vectors.shape[1]), dtype=np.float32)
+        emb[hit_mask] = hit_vectors
+        emb[miss_idx] = miss_vectors
+        return emb
+
+    @staticmethod
+    def _encode_batch(model, texts: List[str], batch_size: int) -> np.ndarray:
+        """对一批文本调用模型编码。"""
         try:
-            emb = self.embedding_model.encode(prefixed_texts, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
-            return emb
+            emb = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
         except TypeError:
             # SimpleEmbeddingModel 不支持这些关键字参数
-            emb = self.embedding_model.encode(prefixed_texts)
-            return np.asarray(emb)
+            emb = model.encode(texts)
+        return np.asarray(emb, dtype=np.float32)
+
+    def _max_add_batch_size(self) -> int:
+        """ChromaDB 单次 add 允许的最大条数。"""
+        try:
+            return int(self.client.get_max_batch_size())
+        except Exception:
+            return int(getattr(self.client, "max_batch_size", 0) or 5000)
+
+    @staticmethod
+    def content_hash(text: str, metadata: Dict[str, Any]) -> str:
+        """块内容哈希（文本与检索用元数据），用于判断块是否变化"""
+        payload = json.dumps([text, {k: metadata.get(k) for k in HASHED_METADATA}], ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """块文本哈希：文本变化时才需要重新嵌入"""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def document_hash(chunk_hashes: Dict[str, Optional[str]]) -> str:
+        """文档哈希：按块ID排序的 (块ID, 块哈希) 的哈希"""
+        payload = "\n".join(f"{chunk_id}:{chunk_hashes[chunk_id] or ''}" for chunk_id in sorted(chunk_hashes))
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _stored_chunks(self, doc_ids: List[str]) -> Dict[str, Dict[str, Dict]]:
+        """已存储的块：doc_id -> {块ID: 元数据}"""
+        stored: Dict[str, Dict[str, Dict]] = {doc_id: {} for doc_id in doc_ids}
+        if not doc_ids:
+            return stored
+        where = {"doc_id": doc_ids[0]} if len(doc_ids) == 1 else {"doc_id": {"$in": doc_ids}}
+        existing = self.collection.get(where=where, include=["metadatas"])
+        for chunk_id, metadata in zip(existing["ids"], existing["metadatas"]):
+            metadata = metadata or {}
+            stored.setdefault(metadata.get("doc_id"), {})[chunk_id] = metadata
+        return stored
 
     def add_documents(self, documents: List[Dict[str, Any]]) -> bool:
+        """写入文档块（幂等，见 upsert_documents）"""
+        return self.upsert_documents(documents) is not None
+
+    def upsert_documents(self, documents: List[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+        """
+        幂等写入文档块
+
+        与已存储的块按内容哈希比较：新增块、文本变化的块以及由其他嵌入模型（如启动时的
+        简单模型）编码的块重新嵌入；只有元数据变化的块只更新元数据。
+        批次中各文档已不存在的旧块批量删除。文档哈希与嵌入模型都未变时整篇跳过。
+
+        Returns:
+            {"added", "updated", "metadata_updated", "unchanged", "deleted"} 块数；没有有效块或失败时返回 None
+        """
         try:
-            ids, texts, metadatas, embeddings = [], [], [], []
+            # 固定本批使用的模型名；编码期间模型被替换时块记在旧名下，之后会被重新嵌入
+            model_name = self.embedding_model_name
+            # 同一批内重复的块ID只保留最后一次
+            chunks: Dict[str, Dict[str, Any]] = {}
             for doc in documents:
                 chunk_id = doc.get("chunk_id")
                 text = doc.get("text", "")
                 if not text or not chunk_id:
                     continue
-                emb = self.create_embeddings([text])[0]
-                ids.append(chunk_id)
-                texts.append(text)
-                embeddings.append(emb.tolist())
-                metadatas.append({
+                metadata = {
                     "doc_id": doc.get("doc_id"),
                     "company_name": doc.get("company_name", ""),
+                    "edinet_code": doc.get("edinet_code", ""),
                     "filing_date": doc.get("filing_date", ""),
                     "type": doc.get("type", "text"),
                     "section": doc.get("section", ""),
+                    "heading": doc.get("heading", ""),
                     "chunk_size": len(text),
-                })
+                    "embedding_model_name": model_name,
+                }
+                metadata["content_hash"] = self.content_hash(text, metadata)
+                metadata["text_hash"] = self.text_hash(text)
+                chunks[chunk_id] = {"text": text, "metadata": metadata}
 
-            if not ids:
+            if not chunks:
                 logger.warning("没有有效的文档可添加")
-                return False
+                return None
 
-            self.collection.add(embeddings=embeddings, documents=texts, metadatas=metadatas, ids=ids)
-            logger.info(f"成功添加 {len(ids)} 个文档块")
-            return True
+            by_doc: Dict[str, List[str]] = {}
+            for chunk_id, chunk in chunks.items():
+                by_doc.setdefault(chunk["metadata"]["doc_id"], []).append(chunk_id)
+            stored = self._stored_chunks(list(by_doc))
+
+            stats = {"added": 0, "updated": 0, "metadata_updated": 0, "unchanged": 0, "deleted": 0}
+            ids, relabeled, orphans, changed_docs = [], [], [], set()
+            for doc_id, chunk_ids in by_doc.items():
+                old = stored.get(doc_id, {})
+                new_hashes = [chunks[c]["metadata"]["content_hash"] for c in chunk_ids]
+                old_hashes = {c: m.get("content_hash") for c, m in old.items()}
+                same_model = all(m.get("embedding_model_name") == model_name for m in old.values())
+                if old and same_model and self.document_hash(dict(zip(chunk_ids, new_hashes))) == self.document_hash(old_hashes):
+                    stats["unchanged"] += len(chunk_ids)
+                    continue
+                changed_docs.add(doc_id)
+                for chunk_id in chunk_ids:
+                    new_meta, old_meta = chunks[chunk_id]["metadata"], old.get(chunk_id)
+                    if old_meta is None:
+                        stats["added"] += 1
+                        ids.append(chunk_id)
+                    elif (old_meta.get("text_hash") != new_meta["text_hash"]
+                          or old_meta.get("embedding_model_name") != model_name):
+                        stats["updated"] += 1
+                        ids.append(chunk_id)
+                    elif old_meta.get("content_hash") != new_meta["content_hash"]:
+                        stats["metadata_updated"] += 1
+                        relabeled.append(chunk_id)
+                    else:
+                        stats["unchanged"] += 1
+                orphans.extend(c for c in old if c not in chunks)
+
+            if ids:
+                texts = [chunks[c]["text"] for c in ids]
+                metadatas = [chunks[c]["metadata"] for c in ids]
+                # 只对变化的块批量编码，再批量写入
+                embeddings = self.embed(texts, priority="bulk").tolist()
+                step = self._max_add_batch_size()
+                for start in range(0, len(ids), step):
+                    end = start + step
+                    self.collection.upsert(
+                        embeddings=embeddings[start:end],
+                        documents=texts[start:end],
+                        metadatas=metadatas[start:end],
+                        ids=ids[start:end],
+                    )
+                if self.keyword_index is not None:
+                    self.keyword_index.add(ids, texts, metadatas)
+            if relabeled:
+                # 只有元数据变化：不重新嵌入
+                metadatas = [chunks[c]["metadata"] for c in relabeled]
+                step = self._max_add_batch_size()
+                for start in range(0, len(relabeled), step):
+                    self.collection.update(ids=relabeled[start:start + step], metadatas=metadatas[start:start + step])
+                if self.keyword_index is not None:
+                    self.keyword_index.add(relabeled, [chunks[c]["text"] for c in relabeled], metadatas)
+            if orphans:
+                self.collection.delete(ids=orphans)
+                if self.keyword_index is not None:
+                    self.keyword_index.delete(orphans)
+                stats["deleted"] = len(orphans)
+
+            logger.info(
+                f"写入文档块: 新增 {stats['added']}，更新 {stats['updated']}，"
+                f"仅元数据 {stats['metadata_updated']}，未变 {stats['unchanged']}，删除 {stats['deleted']}"
+            )
+            if changed_docs:
+                self._invalidate_answers(changed_docs)
+            return stats
         except Exception as e:
             logger.error(f"添加文档失败: {e}")
-            return False
+            return None
 
-    def search(self, query: str, n_results: int = 5, filter_conditions: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        try:
-            query_embedding = self.create_embeddings([query])[0]
-            results = self.collection.query(
-                query_embeddings=[query_embedding.tolist()],
-                n_results=n_results,
-                where=filter_conditions,
-                include=["documents", "metadatas", "distances", "ids"],
-            )
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """规范化查询文本（NFKC、合并空白），作为缓存键"""
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query)).strip()
+
+    def get_query_embedding(self, query: str) -> np.ndarray:
+        """获取查询嵌入（带LRU缓存）"""
+        key = (self.embedding_model_name, self._normalize_query(query))
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = self.embed([query], priority="query")[0]
+            self.query_cache.put(key, embedding)
+        return embedding
 
-            formatted = []
-            docs = results.get("documents", [])
-            if docs:
-                for i in range(len(docs[0])):
-                    formatted.append({
-                        "text": results["documents"][0][i],
-                        "metadata": results["metadatas"][0][i],
-                        "score": 1 - results["distances"][0][i] if results.get("distances") else None,
-                        "id": results["ids"][0][i] if results.get("ids") else None,
-                    })
-
-            return formatted
+    def search(
+        self,
+        query: str,
+        n_results: int = 5,
+        filter_conditions: Optional[Dict] = None,
+        hybrid: Optional[bool] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        检索相关块
+
+        Args:
+            hybrid: 是否融合BM25结果；默认在配置了 keyword_index 时融合
+        """
+        try:
+            if hybrid is None:
+                hybrid = self.keyword_index is not None
+            if hybrid and self.keyword_index is not None:
+                return self._hybrid_search(query, n_results, filter_conditions)
+            return self._vector_search(query, n_results, filter_conditions)
         except Exception as e:
             logger.error(f"搜索失败: {e}")
             return []
 
+    def _vector_search(self, query: str, n_results: int, filter_conditions: Optional[Dict]) -> List[Dict[str, Any]]:
+        query_embedding = self.get_query_embedding(query)
+        # ids 总会返回，不能放在 include 中
+        results = self.collection.query(
+            query_embeddings=[query_embedding.tolist()],
+            n_results=n_results,
+            where=filter_conditions,
+            include=["documents", "metadatas", "distances"],
+        )
+
+        formatted = []
+        docs = results.get("documents", [])
+        if docs:
+            for i in range(len(docs[0])):
+                formatted.append({
+                    "text": results["documents"][0][i],
+                    "metadata": results["metadatas"][0][i],
+                    "score": 1 - results["distances"][0][i] if results.get("distances") else None,
+                    "id": results["ids"][0][i] if results.get("ids") else None,
+                })
+        return formatted
+
+    def _hybrid_search(self, query: str, n_results: int, filter_conditions: Optional[Dict]) -> List[Dict[str, Any]]:
+        """向量检索与BM25检索各取候选，按倒数排名融合"""
+        n_candidates = max(n_results * self.hybrid_candidates, n_results)
+        vector_results = self._vector_search(query, n_candidates, filter_conditions)
+        keyword_results = self.keyword_index.search(query, n_candidates, where=filter_conditions)
+        fused = reciprocal_rank_fusion(
+            [[r["id"] for r in vector_results], [chunk_id for chunk_id, _ in keyword_results]], k=self.rrf_k
+        )[:n_results]
+
+        by_id = {r["id"]: r for r in vector_results}
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in by_id]
+        if missing:
+            # 仅被BM25召回的块：从集合取文本，相似度按余弦计算
+            got = self.collection.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+            query_embedding = self.get_query_embedding(query)
+            for i, chunk_id in enumerate(got["ids"]):
+                embedding = np.asarray(got["embeddings"][i], dtype=np.float32)
+                similarity = float(embedding @ query_embedding / (np.linalg.norm(embedding) * np.linalg.norm(query_embedding) + 1e-12))
+                by_id[chunk_id] = {
+                    "text": got["documents"][i],
+                    "metadata": got["metadatas"][i],
+                    "score": similarity,
+                    "id": chunk_id,
+                }
+
+        bm25_scores = dict(keyword_results)
+        results = []
+        for chunk_id, rrf_score in fused:
+            if chunk_id not in by_id:
+                continue  # 关键词索引与集合不同步（如正在重建）
+            result = dict(by_id[chunk_id])
+            result["rrf_score"] = rrf_score
+            result["bm25_score"] = bm25_scores.get(chunk_id)
+            results.append(result)
+        return results
+
+    def sync_keyword_index(self):
+        """BM25索引块数与集合不一致时重建（失败时抛出，由调用方处理）"""
+        if self.keyword_index is None:
+            return
+        if self.keyword_index.count() != self.collection.count():
+            self.rebuild_keyword_index()
+
+    def rebuild_keyword_index(self, page_size: int = 1000):
+        """从集合全量重建BM25索引（索引缺失或与集合不一致时）"""
+        if self.keyword_index is None:
+            return
+        self.keyword_index.clear()
+        offset = 0
+        while True:
+            page = self.collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            if not page["ids"]:
+                break
+            self.keyword_index.add(page["ids"], [d or "" for d in page["documents"]], page["metadatas"])
+            offset += len(page["ids"])
+        self.keyword_index.save()
+        logger.info(f"BM25索引重建完成: {offset} 个块")
+
     def delete_document(self, doc_id: str) -> bool:
         try:
-            results = self.collection.get(where={"doc_id": doc_id}, include=["ids"])
+            # ids 总会返回，include 为空即可
+            results = self.collection.get(where={"doc_id": doc_id}, include=[])
             ids = results.get("ids", [])
             if ids:
                 self.collection.delete(ids=ids)
                 logger.info(f"删除文档 {doc_id} 的 {len(ids)} 个块")
+            if self.keyword_index is not None:
+                self.keyword_index.delete_document(doc_id)
+            self._invalidate_answers([doc_id])
             return True
         except Exception as e:
             logger.error(f"删除文档失败: {e}")
             return False
 
+    def _invalidate_answers(self, doc_ids):
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate_documents(doc_ids)
+
     def get_collection_stats(self) -> Dict[str, Any]:
         try:
             count = self.collection.count()
             sample = self.collection.get(limit=1)
-            return {"total_chunks": count, "collection_name": self.collection_name, "sample_metadata": (sample.get("metadatas") or [None])[0]}
+            stats = {"total_chunks": count, "collection_name": self.collection_name, "sample_metadata": (sample.get("metadatas") or [None])[0]}
+            stats["backend"] = self.backend
+            if self.backend == "local":
+                stats["local_index"] = self.collection.get_stats()
+            stats["query_cache"] = self.query_cache.get_stats()
+            if self.embedding_cache is not None:
+                stats["embedding_cache"] = self.embedding_cache.get_stats()
+            if self.embedding_service is not None:
+                stats["embedding_service"] = self.embedding_service.get_stats()
+            if self.answer_cache is not None:
+                stats["answer_cache"] = self.answer_cache.get_stats()
+            if self.keyword_index is not None:
+                stats["keyword_index"] = self.keyword_index.get_stats()
+            if self.onnx_runtime is not None:
+                stats["embedding_runtime"] = {
+                    "runtime": self.embedding_runtime,
+                    "active_model": self.embedding_model_name,
+                    "accuracy_report": self.embedding_runtime_report,
+                }
+            return stats
         except Exception as e:
             logger.error(f"获取统计信息失败: {e}")
             return {}
\ No newline at end of file
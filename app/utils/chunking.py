@@ -1,8 +1,16 @@
 import re
+import threading
+import unicodedata
 from typing import List, Dict, Any
 from loguru import logger
 import os
 
+# 检索分词：英数字串（含小数点、千位分隔符）整体保留，非ASCII的词字符（汉字、假名）连续段另行处理
+_ASCII_RUN = r"[0-9a-z]+(?:[.,][0-9]+)*"
+_CJK_RUN = r"[^\x00-\x7f\W]+"
+_TOKEN_RUN_RE = re.compile(f"{_ASCII_RUN}|{_CJK_RUN}")
+_WORD_RE = re.compile(r"\w")
+
 class JapaneseTextChunker:
     """日语文本分块器"""
     
@@ -10,6 +18,7 @@ class JapaneseTextChunker:
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.tagger = None
+        self._tagger_lock = threading.Lock()
         self._init_mecab()
     
     def _init_mecab(self):
@@ -47,6 +56,29 @@ class JapaneseTextChunker:
             logger.warning("MeCab未安装，将使用简单的文本分块")
             self.tagger = None
         
+    def tokenize(self, text: str) -> List[str]:
+        """
+        检索用分词（NFKC规范化、小写）
+
+        MeCab可用时按形态素切分；否则日文连续段切成字符二元组，英数字串整体保留
+        """
+        text = unicodedata.normalize("NFKC", text or "").lower()
+        if self.tagger is not None:
+            try:
+                with self._tagger_lock:
+                    words = self.tagger.parse(text).split()
+                return [w for w in words if _WORD_RE.search(w)]
+            except Exception as e:
+                logger.warning(f"MeCab分词失败，使用字符n-gram: {e}")
+
+        tokens = []
+        for run in _TOKEN_RUN_RE.findall(text):
+            if run.isascii() or len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        return tokens
+
     def chunk_document(self, document: Dict[str, Any]) -> List[Dict[str, Any]]:
         """将文档分块"""
         chunks = []
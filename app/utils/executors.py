@@ -0,0 +1,71 @@
+"""
+阻塞任务执行池
+按工作类型（EDINET请求、向量存储等）划分有界线程池，
+使异步接口中的同步调用不阻塞事件循环，并分别限制各类工作的并发
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from loguru import logger
+
+
+class PoolSaturatedError(RuntimeError):
+    """某类工作的在途任务数已达上限"""
+
+
+class BlockingWorkPools:
+    """按类型划分的有界线程池"""
+
+    def __init__(self, limits: Dict[str, int], max_queue: int = 100):
+        """
+        Args:
+            limits: 工作类型 -> 最大并发线程数
+            max_queue: 每类工作在并发数之外允许排队的任务数，超出时拒绝
+        """
+        self.max_queue = max_queue
+        self._limits = dict(limits)
+        self._pools = {
+            kind: ThreadPoolExecutor(max_workers=max(1, n), thread_name_prefix=f"{kind}-worker")
+            for kind, n in limits.items()
+        }
+        self._in_flight = {kind: 0 for kind in limits}
+        self._lock = threading.Lock()
+        logger.info(f"初始化阻塞任务执行池: {self._limits}")
+
+    async def run(self, kind: str, func: Callable, *args, **kwargs):
+        """在指定类型的线程池中执行同步函数并等待结果"""
+        pool = self._pools[kind]
+        with self._lock:
+            if self._in_flight[kind] >= self._limits[kind] + self.max_queue:
+                raise PoolSaturatedError(f"{kind} 任务过多，请稍后重试")
+            self._in_flight[kind] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+        finally:
+            with self._lock:
+                self._in_flight[kind] -= 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                kind: {"max_workers": self._limits[kind], "in_flight": self._in_flight[kind]}
+                for kind in self._limits
+            }
+
+    def shutdown(self):
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_blocking(kind: str, func: Callable, *args, **kwargs):
+    """在应用状态中的执行池里运行阻塞调用；执行池未初始化时退回默认线程池"""
+    from app.state import get_component
+
+    pools = get_component("work_pools")
+    if pools is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return await pools.run(kind, func, *args, **kwargs)
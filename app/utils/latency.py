@@ -0,0 +1,38 @@
+"""
+分阶段延迟统计
+按阶段保留最近若干次耗时，输出 p50/p95/最大值（毫秒）
+"""
+import threading
+from collections import deque
+from typing import Deque, Dict
+
+import numpy as np
+
+
+class LatencyRecorder:
+    """线程安全的滑动窗口延迟统计"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def get_stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            snapshot = {stage: np.array(samples) * 1000 for stage, samples in self._samples.items()}
+        return {
+            stage: {
+                "count": int(len(values)),
+                "p50_ms": round(float(np.percentile(values, 50)), 2),
+                "p95_ms": round(float(np.percentile(values, 95)), 2),
+                "max_ms": round(float(values.max()), 2),
+            }
+            for stage, values in snapshot.items() if len(values)
+        }
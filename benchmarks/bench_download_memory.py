@@ -0,0 +1,100 @@
+"""
+文档下载内存基准测试
+在本地HTTP服务上提供合成的大ZIP（默认200MB），比较整包读入内存（旧路径）与流式落盘（download_document）的峰值内存
+
+用法:
+    python benchmarks/bench_download_memory.py --size-mb 200
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import tracemalloc
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import requests
+
+from app.core.edinet_client import EdinetClient
+
+
+def build_archive(path: Path, size_mb: int):
+    """生成包含一个小XBRL实例与一个大附件（不可压缩数据）的ZIP"""
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as zf:
+        zf.writestr("XBRL/PublicDoc/jpcrp030000-asr-001.xbrl", "<xbrl>" + "売上高" * 1000 + "</xbrl>")
+        with zf.open("XBRL/AttachDoc/attachment.bin", "w", force_zip64=True) as dst:
+            for _ in range(size_mb):
+                dst.write(os.urandom(1024 * 1024))
+
+
+def serve_archive(path: Path) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(path.stat().st_size))
+            self.end_headers()
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile, 1024 * 1024)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def download_in_memory(client: EdinetClient, doc_id: str, save_dir: Path) -> Path:
+    """旧路径：response.content 整包读入内存后再解压"""
+    response = requests.get(f"{client.api_url}/v2/documents/{doc_id}", params={"type": "1"}, timeout=120)
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+        name = [f for f in zf.namelist() if f.endswith((".xbrl", ".xml"))][0]
+        save_path = save_dir / f"{doc_id}.xbrl"
+        save_path.write_bytes(zf.read(name))
+        return save_path
+
+
+def measure(func, *args) -> float:
+    """返回函数执行期间Python分配的峰值内存（MB）"""
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        archive = temp_dir / "archive.zip"
+        build_archive(archive, args.size_mb)
+        server = serve_archive(archive)
+        host, port = server.server_address
+        client = EdinetClient(api_url=f"http://{host}:{port}/api", rate_limit=0)
+
+        try:
+            before = measure(download_in_memory, client, "S100BENCH", temp_dir)
+            after = measure(client.download_document, "S100BENCH", temp_dir)
+        finally:
+            server.shutdown()
+
+    print(f"archive={args.size_mb}MB")
+    print(f"in-memory peak: {before:8.1f} MB")
+    print(f"streaming peak: {after:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
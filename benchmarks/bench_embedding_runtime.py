@@ -0,0 +1,45 @@
+"""
+嵌入运行时基准测试
+比较 fp32 PyTorch 模型与动态int8量化的ONNX模型：吞吐（texts/sec）与相对fp32的 recall@k、余弦相似度
+
+用法:
+    python benchmarks/bench_embedding_runtime.py --model intfloat/multilingual-e5-large-instruct --texts 1000 --k 10
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sentence_transformers import SentenceTransformer
+
+from app.services.onnx_embedding import OnnxInt8Runtime, evaluate_embedding_model
+from bench_ingest import make_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="intfloat/multilingual-e5-large-instruct")
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--onnx-dir", default="", help="ONNX模型目录，留空则导出到临时目录")
+    args = parser.parse_args()
+
+    texts = [f"passage: {c['text']}" for c in make_corpus(args.texts)]
+    reference = SentenceTransformer(args.model, device="cpu")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        runtime = OnnxInt8Runtime(args.model, args.onnx_dir or temp_dir)
+        candidate = runtime.load(reference)
+        report = evaluate_embedding_model(reference, candidate, texts, k=args.k, batch_size=args.batch_size)
+
+    print(f"model={args.model} texts={args.texts} k={args.k}")
+    print(f"{'runtime':<12}{'texts/sec':>12}{'recall@k':>12}")
+    print(f"{'fp32 torch':<12}{report['reference_texts_per_sec']:>12.1f}{1.0:>12.4f}")
+    print(f"{'int8 onnx':<12}{report['candidate_texts_per_sec']:>12.1f}{report['recall_at_k']:>12.4f}")
+    print(f"speedup: {report['speedup']:.2f}x  cosine mean/min: {report['cosine_mean']:.4f}/{report['cosine_min']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Ollama客户端开销基准测试
+在本地模拟Ollama服务上比较每次新建连接（旧路径 requests.post）与RAGEngine长连接池的单次请求开销
+
+用法:
+    python benchmarks/bench_ollama_client.py --requests 500 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import requests
+
+from app.core.rag_engine import RAGEngine
+
+CONTEXT = [{"company": "テスト株式会社", "text": "当社グループの売上高は前年同期比で増加しました。"}]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """立即返回的 /api/generate（支持keep-alive），统计建立的连接数"""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # 与Ollama（Go net/http）一致关闭Nagle，否则头部与正文分开写入会触发延迟ACK
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"response": "売上高は100億円です。", "done": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+    server.lock = threading.Lock()
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_fresh_connections(engine: RAGEngine, n: int) -> float:
+    """旧路径：每次请求新建连接"""
+    prompt = engine._build_prompt("売上高は？", CONTEXT)
+    start = time.perf_counter()
+    for _ in range(n):
+        response = requests.post(
+            f"{engine.ollama_url}/api/generate",
+            json=engine._ollama_payload(prompt, stream=False),
+            timeout=120
+        )
+        response.json()
+    return time.perf_counter() - start
+
+
+def bench_pooled(engine: RAGEngine, n: int) -> float:
+    """RAGEngine.generate：同步长连接池"""
+    start = time.perf_counter()
+    for _ in range(n):
+        engine.generate("売上高は？", CONTEXT)
+    return time.perf_counter() - start
+
+
+async def bench_async(engine: RAGEngine, n: int, concurrency: int) -> float:
+    """RAGEngine.agenerate：异步连接池并发请求"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await engine.agenerate("売上高は？", CONTEXT)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(n)])
+    elapsed = time.perf_counter() - start
+    await engine.aclose()
+    return elapsed
+
+
+def run(label: str, server: ThreadingHTTPServer, n: int, fn) -> None:
+    before = server.connections
+    elapsed = fn()
+    print(f"{label:<10} {elapsed * 1000 / n:8.3f} ms/request  {n / elapsed:9.1f} req/sec  "
+          f"connections={server.connections - before}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    server = start_server()
+    port = server.server_address[1]
+    engine = RAGEngine(None, "127.0.0.1", port, "bench", max_connections=args.concurrency)
+
+    print(f"requests={args.requests} concurrency={args.concurrency}")
+    run("fresh", server, args.requests, lambda: bench_fresh_connections(engine, args.requests))
+    run("pooled", server, args.requests, lambda: bench_pooled(engine, args.requests))
+    run("async", server, args.requests,
+        lambda: asyncio.run(bench_async(engine, args.requests, args.concurrency)))
+
+    engine.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+XBRL解析吞吐基准测试
+生成合成的大型实例文档（默认约100MB），测量 iter_facts 的 facts/sec 与峰值RSS
+
+用法:
+    python benchmarks/bench_xbrl_parser.py --size-mb 100
+"""
+import argparse
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.xbrl_parser import XBRLParser
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance"
+    xmlns:xbrldi="http://xbrl.org/2006/xbrldi"
+    xmlns:iso4217="http://www.xbrl.org/2003/iso4217"
+    xmlns:jppfs_cor="http://disclosure.edinet-fsa.go.jp/taxonomy/jppfs/2023-12-01/jppfs_cor">
+  <xbrli:unit id="JPY"><xbrli:measure>iso4217:JPY</xbrli:measure></xbrli:unit>
+"""
+
+CONTEXT = """  <xbrli:context id="C{i}">
+    <xbrli:entity>
+      <xbrli:identifier scheme="http://disclosure.edinet-fsa.go.jp">E{i:05d}-000</xbrli:identifier>
+      <xbrli:segment><xbrldi:explicitMember dimension="jpcrp_cor:OperatingSegmentsAxis">jpcrp_cor:Segment{i}Member</xbrldi:explicitMember></xbrli:segment>
+    </xbrli:entity>
+    <xbrli:period><xbrli:startDate>2023-04-01</xbrli:startDate><xbrli:endDate>2024-03-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+"""
+
+FACT = '  <jppfs_cor:Element{e} contextRef="C{c}" unitRef="JPY" decimals="-6">{v}</jppfs_cor:Element{e}>\n'
+
+
+def build_instance(path: Path, size_mb: int, n_contexts: int = 1000) -> int:
+    """写出约 size_mb 大小的实例文档，返回事实数"""
+    target = size_mb * 1024 * 1024
+    n_facts = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(HEADER)
+        for i in range(n_contexts):
+            f.write(CONTEXT.format(i=i))
+        while f.tell() < target:
+            lines = [
+                FACT.format(e=(n_facts + k) % 500, c=(n_facts + k) % n_contexts, v=(n_facts + k) * 1000)
+                for k in range(10000)
+            ]
+            f.write("".join(lines))
+            n_facts += len(lines)
+        f.write("</xbrli:xbrl>\n")
+    return n_facts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir) / "large.xbrl"
+        expected = build_instance(path, args.size_mb)
+        xbrl_parser = XBRLParser()
+
+        # lxml 的内存分配不在 tracemalloc 统计范围内，因此使用进程峰值RSS
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        n_facts = sum(1 for _ in xbrl_parser.iter_facts(path))
+        elapsed = time.perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    assert n_facts == expected
+    print(f"instance={args.size_mb}MB facts={n_facts}")
+    print(f"elapsed:    {elapsed:8.2f}s")
+    print(f"throughput: {n_facts / elapsed:10.0f} facts/sec")
+    print(f"peak RSS:   {rss_before / 1024:8.1f} MB -> {rss_after / 1024:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
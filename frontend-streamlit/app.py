@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import json
 import pandas as pd
 from datetime import datetime, timedelta
 import time
@@ -106,10 +107,22 @@ def search_edinet(date_from=None, date_to=None, company_name=None, limit=100):
     except Exception as e:
         return {"count": 0, "documents": [], "error": str(e)}
 
-def process_document(doc_id):
+def process_document(doc_id, timeout=600):
+    """提交入库任务并轮询 /jobs/{job_id} 直到完成"""
     try:
         response = requests.post(f"{BACKEND_URL}/documents/process", json={"doc_ids": [doc_id]}, timeout=60)
-        return response.status_code == 200
+        if response.status_code != 200:
+            return False
+        job_id = response.json().get("job_id")
+        if not job_id:
+            return True
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = requests.get(f"{BACKEND_URL}/jobs/{job_id}", timeout=10).json()
+            if job.get("status") in ("done", "failed"):
+                return job.get("counts", {}).get("done", 0) > 0
+            time.sleep(1)
+        return False
     except:
         return False
 
@@ -125,6 +138,27 @@ def query_rag(question, company_filter=None):
     except Exception as e:
         return {"answer": f"接続エラー: {str(e)}", "sources": []}
 
+def query_rag_stream(question, company_filter=None):
+    """SSEで回答を逐次受信し、(イベント名, データ) を順に返す"""
+    payload = {"question": question}
+    if company_filter:
+        payload["company_filter"] = company_filter
+    try:
+        with requests.post(f"{BACKEND_URL}/query/stream", json=payload, stream=True, timeout=(5, 120)) as response:
+            if response.status_code != 200:
+                yield "error", {"message": f"エラー: {response.status_code}"}
+                return
+            event = "message"
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if not line:
+                    event = "message"
+                elif line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    yield event, json.loads(line[len("data:"):].strip())
+    except Exception as e:
+        yield "error", {"message": f"接続エラー: {str(e)}"}
+
 def view_document(doc_id):
     try:
         response = requests.get(f"{BACKEND_URL}/documents/{doc_id}/view", timeout=60)
@@ -335,27 +369,48 @@ if st.session_state.processed_docs:
         if not question:
             st.warning("質問を入力してください")
         else:
+            st.markdown("### 📝 回答")
+            answer_placeholder = st.empty()
+            sources_placeholder = st.container()
+            answer = ""
+            error_message = None
+
             with st.spinner("回答を生成中..."):
-                result = query_rag(question, company_filter if company_filter else None)
-
-                # 回答表示
-                st.markdown("### 📝 回答")
-                st.markdown(f'<div class="success-box">{result.get("answer", "回答を取得できませんでした")}</div>', unsafe_allow_html=True)
-
-                # ソース表示
-                if result.get("sources"):
-                    with st.expander(f"📚 参照元（{len(result['sources'])}件）"):
-                        for i, source in enumerate(result['sources'], 1):
-                            st.markdown(f"**{i}. {source.get('company', '不明')}** (類似度: {source.get('score', 0):.1%})")
-                            st.caption(source.get('text', '')[:300] + "...")
-                            st.markdown("---")
-
-                # 履歴に追加
-                st.session_state.chat_history.append({
-                    "question": question,
-                    "answer": result.get("answer", ""),
-                    "timestamp": datetime.now().strftime("%H:%M")
-                })
+                for event, data in query_rag_stream(question, company_filter if company_filter else None):
+                    if event == "sources":
+                        # 参照元は回答生成前に届くので先に表示する
+                        sources = data.get("sources", [])
+                        if sources:
+                            with sources_placeholder.expander(f"📚 参照元（{len(sources)}件）"):
+                                for i, source in enumerate(sources, 1):
+                                    st.markdown(f"**{i}. {source.get('company', '不明')}** (類似度: {source.get('score', 0):.1%})")
+                                    st.caption(source.get('text', '')[:300] + "...")
+                                    st.markdown("---")
+                    elif event == "token":
+                        # トークンを受信するたびに回答を更新
+                        answer += data.get("text", "")
+                        answer_placeholder.markdown(f'<div class="success-box">{answer}▌</div>', unsafe_allow_html=True)
+                    elif event == "done" and data.get("cached"):
+                        st.caption("⚡ キャッシュ済みの回答を表示しています")
+                    elif event == "error":
+                        error_message = data.get("message", "エラーが発生しました")
+
+            if answer:
+                answer_placeholder.markdown(f'<div class="success-box">{answer}</div>', unsafe_allow_html=True)
+                if error_message:
+                    # 途中で中断された回答は不完全であることを明示する
+                    st.warning(f"⚠️ {error_message}")
+                    answer += f"\n\n（{error_message}）"
+            else:
+                answer = error_message or "回答を取得できませんでした"
+                answer_placeholder.markdown(f'<div class="success-box">{answer}</div>', unsafe_allow_html=True)
+
+            # 履歴に追加
+            st.session_state.chat_history.append({
+                "question": question,
+                "answer": answer,
+                "timestamp": datetime.now().strftime("%H:%M")
+            })
 
     # 履歴表示
     if st.session_state.chat_history:
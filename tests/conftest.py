@@ -0,0 +1,32 @@
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def make_vector_store(monkeypatch):
+    """
+    创建不连接远程ChromaDB、不加载嵌入模型的向量存储
+
+    用法: make_vector_store(backend="chroma", **VectorStoreManager的其他参数)；
+    集合名每次随机生成，调用方自行设置 embedding_model
+    """
+    chromadb = pytest.importorskip("chromadb")
+    pytest.importorskip("sentence_transformers")
+    from app.services.vector_store import VectorStoreManager
+
+    def _refuse(*args, **kwargs):
+        raise ConnectionError("no chroma server in tests")
+
+    monkeypatch.setattr(chromadb, "HttpClient", _refuse)
+    monkeypatch.setattr(VectorStoreManager, "_load_embedding_model_background", lambda self: None)
+
+    def make(backend: str = "chroma", **kwargs):
+        return VectorStoreManager(collection_name=f"test-{uuid.uuid4().hex[:8]}", backend=backend, **kwargs)
+
+    return make
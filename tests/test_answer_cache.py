@@ -0,0 +1,148 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.rag_engine import RAGEngine
+from app.services.answer_cache import AnswerCache
+
+DOCS = [
+    {"chunk_id": "S100A_0", "doc_id": "S100A", "text": "売上高 100億円", "company": "A社"},
+    {"chunk_id": "S100B_0", "doc_id": "S100B", "text": "売上高 200億円", "company": "B社"},
+]
+
+
+def test_similar_query_hits_and_dissimilar_misses():
+    cache = AnswerCache(max_size=8, similarity_threshold=0.9)
+    key = cache.make_key("model", None, DOCS)
+    cache.put(key, np.array([1.0, 0.0]), ["S100A", "S100B"], {"answer": "100億円"}, generation_time=2.0)
+
+    hit = cache.get(key, np.array([0.99, 0.05]))
+    assert hit["answer"] == "100億円"
+    assert hit["cached"] is True
+    assert hit["saved_time"] == 2.0
+
+    assert cache.get(key, np.array([0.0, 1.0])) is None
+    # 检索到的块或公司过滤不同则不共用
+    assert cache.get(cache.make_key("model", "A社", DOCS), np.array([1.0, 0.0])) is None
+    assert cache.get(cache.make_key("model", None, DOCS[:1]), np.array([1.0, 0.0])) is None
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["saved_seconds"] == 2.0
+
+
+def test_ttl_and_size_bound():
+    cache = AnswerCache(max_size=2, ttl_seconds=0.1, similarity_threshold=0.9)
+    keys = [cache.make_key("model", str(i), DOCS) for i in range(3)]
+    for key in keys:
+        cache.put(key, np.array([1.0]), ["S100A"], {"answer": "x"}, generation_time=1.0)
+    assert cache.get(keys[0], np.array([1.0])) is None
+    assert cache.get(keys[2], np.array([1.0])) is not None
+
+    time.sleep(0.15)
+    assert cache.get(keys[2], np.array([1.0])) is None
+
+
+def test_invalidate_documents_and_epoch_guard():
+    cache = AnswerCache(similarity_threshold=0.9)
+    key = cache.make_key("model", None, DOCS)
+    cache.put(key, np.array([1.0]), ["S100A", "S100B"], {"answer": "x"}, generation_time=1.0)
+    other = cache.make_key("model", None, [{"chunk_id": "S100C_0"}])
+    cache.put(other, np.array([1.0]), ["S100C"], {"answer": "y"}, generation_time=1.0)
+
+    assert cache.invalidate_documents(["S100B"]) == 1
+    assert cache.get(key, np.array([1.0])) is None
+    assert cache.get(other, np.array([1.0])) is not None
+
+    # 生成期间文档被失效时，旧回答不写入缓存
+    epoch = cache.current_epoch()
+    cache.invalidate_documents(["S100A"])
+    cache.put(key, np.array([1.0]), ["S100A", "S100B"], {"answer": "stale"}, generation_time=1.0, since_epoch=epoch)
+    assert cache.get(key, np.array([1.0])) is None
+
+
+def test_epoch_records_are_pruned_after_requests_finish():
+    cache = AnswerCache(similarity_threshold=0.9)
+    # 没有进行中的请求时不保留失效记录
+    cache.invalidate_documents([f"S100{i:04d}" for i in range(100)])
+    assert cache._doc_epochs == {}
+
+    first = cache.current_epoch()
+    cache.invalidate_documents(["S100A"])
+    second = cache.current_epoch()
+    cache.invalidate_documents(["S100B"])
+    assert set(cache._doc_epochs) == {"S100A", "S100B"}
+
+    # 最早的请求结束后，只保留晚于剩余请求的记录
+    cache.release(first)
+    assert set(cache._doc_epochs) == {"S100B"}
+    cache.release(second)
+    assert cache._doc_epochs == {}
+
+
+class KeywordModel:
+    """按关键词决定方向的确定性嵌入：含“売上”的问题彼此相近"""
+
+    def encode(self, texts, **kwargs):
+        emb = np.zeros((len(texts), 3), dtype=np.float32)
+        for i, t in enumerate(texts):
+            emb[i] = [1.0, 0.0, 0.01 * len(t)] if "売上" in t else [0.0, 1.0, 0.01 * len(t)]
+        return emb
+
+
+@pytest.fixture
+def engine(make_vector_store):
+    store = make_vector_store()
+    store.embedding_model = KeywordModel()
+    store.add_documents([
+        {"chunk_id": d["chunk_id"], "doc_id": d["doc_id"], "text": d["text"], "company_name": d["company"]}
+        for d in DOCS
+    ])
+
+    cache = AnswerCache(similarity_threshold=0.95)
+    store.answer_cache = cache
+    rag = RAGEngine(store, "127.0.0.1", 1, "test", answer_cache=cache)
+    rag.generations = 0
+
+    def fake_generate(question, context, status=None):
+        rag.generations += 1
+        if status is not None:
+            status["complete"] = True
+        return f"回答{rag.generations}"
+
+    rag.generate = fake_generate
+    return rag
+
+
+def test_paraphrased_query_is_served_from_cache(engine):
+    first = engine.query("売上高はいくらですか")
+    second = engine.query("売上高を教えてください")
+    assert first["cached"] is False
+    assert second["cached"] is True
+    assert second["answer"] == first["answer"]
+    assert engine.generations == 1
+
+    # 不相近的问题重新生成
+    assert engine.query("従業員数は")["cached"] is False
+    assert engine.generations == 2
+
+
+def test_delete_and_reingest_invalidate_answers(engine):
+    store = engine.vector_store
+    engine.query("売上高はいくらですか")
+
+    assert store.delete_document("S100B")
+    assert store.collection.count() == 1
+    assert engine.query("売上高はいくらですか")["cached"] is False
+
+    engine.query("売上高はいくらですか")
+    store.add_documents([{"chunk_id": "S100A_0", "doc_id": "S100A", "text": "売上高 120億円", "company_name": "A社"}])
+    assert engine.query("売上高はいくらですか")["cached"] is False
+    assert engine.generations == 3
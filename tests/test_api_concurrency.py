@@ -0,0 +1,167 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+httpx = pytest.importorskip("httpx")
+
+from app.core.rag_engine import RAGEngine
+from app.main import app
+from app.state import app_state
+from app.utils.executors import BlockingWorkPools
+
+LLM_DELAY = 0.5
+
+
+class SlowOllamaHandler(BaseHTTPRequestHandler):
+    """生成耗时 LLM_DELAY 秒的Ollama模拟，记录建立的连接数"""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.payloads.append(json.loads(self.rfile.read(length)))
+        time.sleep(LLM_DELAY)
+        body = json.dumps({"response": "回答", "done": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubVectorStore:
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+
+    def search(self, query, n_results=5, filter_conditions=None):
+        return [{"text": "売上高 100億円", "metadata": {"company_name": "テスト", "doc_id": "S100TEST"}, "score": 0.9}]
+
+    def get_collection_stats(self):
+        time.sleep(self.delay)
+        return {"total_documents": 0}
+
+
+@pytest.fixture
+def ollama():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowOllamaHandler)
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.payloads = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def state(ollama):
+    pools = BlockingWorkPools({"edinet": 2, "vector": 2}, max_queue=100)
+    app_state.update({
+        "rag_engine": RAGEngine(
+            StubVectorStore(), "127.0.0.1", ollama.server_address[1], "test", max_connections=4
+        ),
+        "vector_store": StubVectorStore(),
+        "work_pools": pools,
+    })
+    yield pools
+    for key in ("rag_engine", "vector_store", "work_pools"):
+        app_state.pop(key, None)
+    pools.shutdown()
+
+
+async def _load(n_queries: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+        queries = [
+            asyncio.create_task(client.post("/api/v1/query", json={"question": f"q{i}"}))
+            for i in range(n_queries)
+        ]
+        latencies = []
+        await asyncio.sleep(0.05)
+        while not all(task.done() for task in queries):
+            start = time.perf_counter()
+            response = await client.get("/health")
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+            await asyncio.sleep(0.05)
+        return [task.result() for task in queries], latencies
+
+
+def test_health_stays_responsive_under_llm_load(state, ollama):
+    responses, latencies = asyncio.run(_load(20))
+
+    assert all(r.status_code == 200 for r in responses)
+    assert all(r.json()["answer"] == "回答" for r in responses)
+    assert len(latencies) >= 5
+    # LLM调用耗时0.5秒，若阻塞事件循环健康检查会被拖到秒级
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    assert p99 < LLM_DELAY / 2
+    # 20个查询复用连接池中的连接（最多4个），并传递 keep_alive
+    assert ollama.connections <= 4
+    assert all(p["keep_alive"] == "30m" for p in ollama.payloads)
+
+
+def test_saturated_pool_returns_503(state):
+    pools = BlockingWorkPools({"edinet": 1, "vector": 1}, max_queue=0)
+    app_state["work_pools"] = pools
+    app_state["vector_store"] = StubVectorStore(delay=0.3)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            return await asyncio.gather(*[client.get("/api/v1/status") for _ in range(3)])
+
+    try:
+        responses = asyncio.run(run())
+    finally:
+        pools.shutdown()
+
+    codes = sorted(r.status_code for r in responses)
+    assert codes[0] == 200
+    assert 503 in codes
+
+
+class SlowSearchStore(StubVectorStore):
+    def search(self, query, n_results=5, filter_conditions=None):
+        time.sleep(self.delay)
+        return super().search(query, n_results, filter_conditions)
+
+
+@pytest.mark.parametrize("path", ["/api/v1/query", "/api/v1/query/stream"])
+def test_saturated_retrieval_returns_503(state, ollama, path):
+    pools = BlockingWorkPools({"edinet": 1, "vector": 1}, max_queue=0)
+    app_state["work_pools"] = pools
+    app_state["rag_engine"] = RAGEngine(SlowSearchStore(delay=0.3), "127.0.0.1", ollama.server_address[1], "test")
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            return await asyncio.gather(*[client.post(path, json={"question": f"q{i}"}) for i in range(3)])
+
+    try:
+        responses = asyncio.run(run())
+    finally:
+        pools.shutdown()
+
+    codes = sorted(r.status_code for r in responses)
+    assert codes[0] == 200
+    assert 503 in codes
@@ -0,0 +1,132 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.bm25_index import BM25Index, reciprocal_rank_fusion
+from app.utils.chunking import JapaneseTextChunker
+
+TOKENIZE = JapaneseTextChunker(chunk_size=300, chunk_overlap=50).tokenize
+
+TEXTS = {
+    "a_0": "当連結会計年度の売上高は1,234億円となりました。",
+    "a_1": "のれんの減損損失を計上しました。",
+    "b_0": "自動車セグメントの営業利益は前年比で増加しました。",
+    "b_1": "金融サービス事業の売上高は増加しました。",
+}
+
+
+def build(root_dir=None):
+    index = BM25Index(tokenizer=TOKENIZE, root_dir=root_dir)
+    ids = list(TEXTS)
+    index.add(ids, [TEXTS[i] for i in ids], [{"doc_id": i.split("_")[0]} for i in ids])
+    return index
+
+
+def test_tokenize_keeps_numbers_and_normalizes_width():
+    tokens = TOKENIZE("売上高は１，２３４億円")
+    assert "1,234" in tokens
+    assert "売上" in tokens
+
+
+def test_exact_terms_and_numbers_rank_first():
+    index = build()
+    assert index.search("減損損失", n_results=1)[0][0] == "a_1"
+    assert index.search("1,234", n_results=1)[0][0] == "a_0"
+    assert index.search("自動車セグメント")[0][0] == "b_0"
+    assert [cid for cid, _ in index.search("売上高", where={"doc_id": "b"})] == ["b_1"]
+    assert index.search("存在しない語彙xyz") == []
+
+
+def test_update_delete_and_compact():
+    index = build()
+    index.add(["a_1"], ["研究開発費の内訳"], [{"doc_id": "a"}])
+    assert index.count() == 4
+    assert index.search("減損") == []
+    assert index.search("研究開発費")[0][0] == "a_1"
+
+    index.delete_document("a")
+    assert index.count() == 2
+    # 删除过半后已压缩
+    assert index.get_stats()["rows"] == 2
+    assert {cid for cid, _ in index.search("売上高")} == {"b_1"}
+
+
+def test_save_and_reload(tmp_path):
+    index = build(str(tmp_path))
+    index.delete(["b_0"])
+    index.save()
+
+    reopened = BM25Index(tokenizer=TOKENIZE, root_dir=str(tmp_path))
+    assert reopened.count() == 3
+    assert reopened.search("減損損失")[0][0] == "a_1"
+    assert reopened.search("自動車セグメント") == []
+
+
+def test_save_appends_log_and_checkpoints_when_large(tmp_path, monkeypatch):
+    import app.services.bm25_index as bm25_index
+
+    index = build(str(tmp_path))
+    index.save()
+    # 变更较少时只写日志，不写快照
+    assert not (tmp_path / "meta.json").exists()
+    assert (tmp_path / "wal.0.jsonl").read_text(encoding="utf-8").count("\n") == 1
+
+    monkeypatch.setattr(bm25_index, "CHECKPOINT_MIN_ROWS", 2)
+    index.delete(["a_0"])
+    index.add(["c_0"], ["のれんの償却費"], [{"doc_id": "c"}])
+    index.save()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["meta.json", "postings.1.npz"]
+
+    index.delete(["b_1"])
+    index.save()
+    # 模拟日志最后一行写入中断
+    with open(tmp_path / "wal.1.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"op": "delete", "ids": ["c_0"')
+
+    reopened = BM25Index(tokenizer=TOKENIZE, root_dir=str(tmp_path))
+    assert reopened.count() == 3
+    assert reopened.search("償却費")[0][0] == "c_0"
+    assert reopened.search("金融サービス") == []
+    assert (tmp_path / "wal.1.jsonl").read_text(encoding="utf-8").endswith("\n")
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["x", "y"], ["y", "z"]], k=60)
+    assert [item for item, _ in fused] == ["y", "x", "z"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+
+def test_hybrid_search_recovers_exact_term_missed_by_dense(make_vector_store):
+    store = make_vector_store()
+    # 稠密模型只看“売上”，对“減損”无区分能力
+    store.embedding_model = type("Model", (), {
+        "encode": lambda self, texts, **kw: np.array(
+            [[1.0, 0.0] if "売上" in t else [0.0, 1.0] for t in texts], dtype=np.float32
+        )
+    })()
+    store.keyword_index = BM25Index(tokenizer=TOKENIZE)
+    store.hybrid_candidates = 1
+    store.add_documents([
+        {"chunk_id": cid, "doc_id": cid.split("_")[0], "text": text, "company_name": "A社"}
+        for cid, text in TEXTS.items()
+    ])
+
+    dense = store.search("のれんの減損損失", n_results=2, hybrid=False)
+    hybrid = store.search("のれんの減損損失", n_results=2)
+    assert "a_1" in [r["id"] for r in hybrid]
+    assert hybrid[0]["id"] == "a_1" or "a_1" not in [r["id"] for r in dense]
+    top = next(r for r in hybrid if r["id"] == "a_1")
+    assert top["text"] == TEXTS["a_1"]
+    assert top["bm25_score"] > 0
+    assert top["score"] is not None
+
+    assert store.delete_document("a")
+    assert store.keyword_index.count() == 2
+    store.keyword_index.clear()
+    store.sync_keyword_index()
+    assert store.keyword_index.count() == 2
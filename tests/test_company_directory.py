@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.company_directory import CompanyDirectory, normalize_name
+
+FILINGS = [
+    {"docID": "S100T001", "edinetCode": "E02144", "secCode": "72030", "filerName": "トヨタ自動車株式会社"},
+    {"docID": "S100T002", "edinetCode": "E00540", "secCode": "31160", "filerName": "トヨタ紡織株式会社"},
+    {"docID": "S100S001", "edinetCode": "E01777", "secCode": "67580", "filerName": "ソニーグループ株式会社"},
+    {"docID": "S100X001", "edinetCode": None, "filerName": "ファンド"},
+]
+
+
+@pytest.fixture
+def directory(tmp_path):
+    directory = CompanyDirectory(str(tmp_path / "companies.sqlite3"))
+    directory.add_filings(FILINGS)
+    return directory
+
+
+def test_normalize_name():
+    assert normalize_name("トヨタ自動車株式会社") == "トヨタ自動車"
+    assert normalize_name("㈱ソニー　グループ") == "ソニーグループ"
+    assert normalize_name("TOYOTA MOTOR CORPORATION") == "toyotamotor"
+
+
+def test_resolve_codes_names_and_partial(directory):
+    assert directory.resolve("E02144") == ["E02144"]
+    assert directory.resolve("7203") == ["E02144"]
+    assert directory.resolve("７２０３０") == ["E02144"]
+    assert directory.resolve("トヨタ自動車") == ["E02144"]
+    assert directory.resolve("ソニーグループ(株)") == ["E01777"]
+    assert set(directory.resolve("トヨタ")) == {"E02144", "E00540"}
+    assert directory.resolve("自動車") == ["E02144"]
+    assert directory.resolve("存在しない会社") == []
+    assert directory.lookup_filing("S100T001") == "E02144"
+    assert directory.lookup_filing("S100X001") is None
+
+
+def test_persists_and_imports_code_list(tmp_path, directory):
+    csv_path = tmp_path / "EdinetcodeDlInfo.csv"
+    csv_path.write_bytes((
+        "ダウンロード実行日,2024年04月01日現在,件数,1件\n"
+        "ＥＤＩＮＥＴコード,提出者種別,上場区分,提出者名,提出者名（英字）,提出者名（ヨミ）,証券コード\n"
+        "E02144,内国法人・組合,上場,トヨタ自動車株式会社,TOYOTA MOTOR CORPORATION,トヨタジドウシャカブシキガイシャ,72030\n"
+    ).encode("cp932"))
+    assert directory.import_code_list(str(csv_path)) == 1
+    assert directory.resolve("Toyota Motor Corp.") == ["E02144"]
+
+    reopened = CompanyDirectory(str(directory.db_path))
+    assert reopened.resolve("toyota motor") == ["E02144"]
+    assert reopened.get_company("E02144")["name_en"] == "TOYOTA MOTOR CORPORATION"
+    assert reopened.get_stats()["companies"] == 3
+
+
+def test_company_filter_uses_exact_code_predicate(make_vector_store, directory):
+    from app.core.rag_engine import RAGEngine
+
+    store = make_vector_store()
+    store.embedding_model = type("Model", (), {
+        "encode": lambda self, texts, **kw: np.ones((len(texts), 2), dtype=np.float32)
+    })()
+    store.add_documents([
+        {"chunk_id": "t_0", "doc_id": "S100T001", "text": "売上収益", "company_name": "トヨタ自動車株式会社", "edinet_code": "E02144"},
+        {"chunk_id": "b_0", "doc_id": "S100T002", "text": "売上収益", "company_name": "トヨタ紡織株式会社", "edinet_code": "E00540"},
+        # edinet_code 标注之前入库的块
+        {"chunk_id": "s_0", "doc_id": "S100S001", "text": "売上収益", "company_name": "ソニーグループ株式会社"},
+    ])
+    rag = RAGEngine(store, "127.0.0.1", 1, "test", company_directory=directory)
+
+    assert [d["chunk_id"] for d in rag.retrieve("売上", top_k=5, company_filter="7203")] == ["t_0"]
+    assert {d["chunk_id"] for d in rag.retrieve("売上", top_k=5, company_filter="トヨタ")} == {"t_0", "b_0"}
+    assert [d["chunk_id"] for d in rag.retrieve("売上", top_k=5, company_filter="ソニーグループ")] == ["s_0"]
+    assert rag.retrieve("売上", top_k=5, company_filter="存在しない会社") == []
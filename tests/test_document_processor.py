@@ -0,0 +1,224 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.xbrl_parser import XBRLParser
+from app.services.document_processor import DocumentProcessor, FactCollector, extract_members_content
+from app.services.fact_store import FactStore
+
+RISK_TEXT = "当社グループの事業は為替変動、原材料価格の高騰、自然災害などのリスクにさらされております。" * 8
+
+
+def _instance(doc_id: str) -> str:
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance"
+    xmlns:iso4217="http://www.xbrl.org/2003/iso4217"
+    xmlns:jppfs_cor="http://disclosure.edinet-fsa.go.jp/taxonomy/jppfs/2023-12-01/jppfs_cor"
+    xmlns:jpcrp_cor="http://disclosure.edinet-fsa.go.jp/taxonomy/jpcrp/2023-12-01/jpcrp_cor">
+  <xbrli:context id="CurrentYearDuration">
+    <xbrli:entity><xbrli:identifier scheme="http://disclosure.edinet-fsa.go.jp">E00001-000</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:startDate>2023-04-01</xbrli:startDate><xbrli:endDate>2024-03-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:unit id="JPY"><xbrli:measure>iso4217:JPY</xbrli:measure></xbrli:unit>
+  <jppfs_cor:NetSales contextRef="CurrentYearDuration" unitRef="JPY" decimals="-6">1000000</jppfs_cor:NetSales>
+  <jpcrp_cor:BusinessRisksTextBlock contextRef="CurrentYearDuration">{doc_id} {RISK_TEXT}</jpcrp_cor:BusinessRisksTextBlock>
+</xbrli:xbrl>
+"""
+
+
+class FakeEdinetClient:
+    def __init__(self, missing=()):
+        self.missing = set(missing)
+
+    def download_document(self, doc_id, save_dir=None, file_type="1"):
+        if doc_id in self.missing:
+            return None
+        path = Path(save_dir) / f"{doc_id}.xbrl"
+        path.write_text(_instance(doc_id), encoding="utf-8")
+        return path
+
+    def iter_document_members(self, doc_id, save_dir=None, file_type="1"):
+        path = self.download_document(doc_id, save_dir=save_dir, file_type=file_type)
+        if path is not None:
+            yield {"name": f"XBRL/PublicDoc/{doc_id}.xbrl", "role": "instance", "path": path}
+
+
+class RecordingVectorStore:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def add_documents(self, documents):
+        with self.lock:
+            self.calls.append(list(documents))
+        return True
+
+
+@pytest.mark.parametrize("parse_workers", [0, 2])
+def test_process_batch_pipeline(parse_workers, tmp_path):
+    vector_store = RecordingVectorStore()
+    fact_store = FactStore(str(tmp_path / "facts"))
+    xbrl_parser = XBRLParser(fact_store=fact_store)
+    processor = DocumentProcessor(
+        edinet_client=FakeEdinetClient(missing={"S100MISS"}),
+        xbrl_parser=xbrl_parser,
+        text_chunker=None,
+        vector_store=vector_store,
+        config={"parse_workers": parse_workers, "embed_batch_size": 1000, "max_in_flight": 3},
+    )
+    doc_ids = [f"S100{i:04d}" for i in range(8)] + ["S100MISS"]
+
+    try:
+        results = processor.process_batch(doc_ids)
+    finally:
+        processor.shutdown()
+
+    assert [r["doc_id"] for r in results] == doc_ids
+    assert [r["status"] for r in results] == ["success"] * 8 + ["failed"]
+    # 块来自多个文档并合批写入
+    assert len(vector_store.calls) < 8
+    stored_docs = {c["doc_id"] for call in vector_store.calls for c in call}
+    assert stored_docs == set(doc_ids[:8])
+    # 没有公司目录时提出者取自实例的实体标识
+    assert {c["edinet_code"] for call in vector_store.calls for c in call} == {"E00001"}
+    # 数值事实由解析方暂存后写入事实存储
+    assert fact_store.get_stats()["documents"] == 8
+    assert fact_store.aggregate("NetSales", agg="count", latest_only=False) == {"E00001": 8.0}
+    assert processor.get_processing_stats()["processed_count"] == 8
+
+
+def test_extract_members_content_prefers_ixbrl_pages(tmp_path):
+    instance = tmp_path / "S100TEST.xbrl"
+    instance.write_text(_instance("S100TEST"), encoding="utf-8")
+    pages = []
+    for i, body in enumerate(["<p>第1ページ</p>", f"<p>{RISK_TEXT}</p>"]):
+        page = tmp_path / f"010{i}010_honbun_ixbrl.htm"
+        page.write_text(
+            '<html xmlns:ix="http://www.xbrl.org/2013/inlineXBRL"><body>'
+            f'<ix:nonNumeric name="jpcrp_cor:BusinessRisksTextBlock">{body}</ix:nonNumeric></body></html>',
+            encoding="utf-8"
+        )
+        pages.append({"role": "ixbrl", "path": page})
+
+    members = iter([{"role": "instance", "path": instance}] + pages)
+    facts = FactCollector(str(tmp_path / "facts"))
+    sections = extract_members_content(XBRLParser(), members, max_workers=3, facts=facts)
+
+    # 数值事实来自实例，正文按页面顺序取自内联XBRL（不重复实例中的textBlock）
+    assert (facts.count, facts.entity_code()) == (1, "E00001")
+    store = FactStore(str(tmp_path / "store"))
+    assert store.add_staged("S100TEST", str(tmp_path / "facts")) == 1
+    assert [r["text"] for r in sections] == ["第1ページ", RISK_TEXT]
+    assert {r["section"] for r in sections} == {"事業等のリスク"}
+
+    sections = extract_members_content(XBRLParser(), [{"role": "instance", "path": instance}])
+    assert sections[0]["section"] == "事業等のリスク"
+
+
+def _processor(vector_store, **config):
+    return DocumentProcessor(
+        edinet_client=FakeEdinetClient(),
+        xbrl_parser=XBRLParser(),
+        text_chunker=None,
+        vector_store=vector_store,
+        config={"parse_workers": 0, "embed_batch_size": 1, "max_in_flight": 2, **config},
+    )
+
+
+def test_pipeline_fails_remaining_docs_when_submit_fails():
+    processor = _processor(RecordingVectorStore())
+    processor.executor.shutdown()  # submit 抛出 RuntimeError
+    doc_ids = [f"S100{i:04d}" for i in range(5)] + ["S1000000"]
+
+    results = processor.process_batch(doc_ids)
+
+    # 重复的ID只处理一次，但每个输入ID都有结果
+    assert [r["doc_id"] for r in results] == doc_ids
+    assert {r["status"] for r in results} == {"failed"}
+
+
+def test_pipeline_stops_producer_when_store_fails():
+    class FailingVectorStore(RecordingVectorStore):
+        def add_documents(self, documents):
+            raise RuntimeError("store down")
+
+    processor = _processor(FailingVectorStore())
+    try:
+        with pytest.raises(RuntimeError, match="store down"):
+            processor.process_batch([f"S100{i:04d}" for i in range(10)])
+    finally:
+        processor.shutdown()
+
+
+def test_single_document_tagged_from_entity_identifier():
+    class EmptyDirectory:
+        def lookup_filing(self, doc_id):
+            return None
+
+        def get_name(self, edinet_code):
+            return "テスト株式会社" if edinet_code == "E00001" else None
+
+    vector_store = RecordingVectorStore()
+    processor = _processor(vector_store)
+    processor.company_directory = EmptyDirectory()
+    try:
+        assert processor.process_document("S100TEST")["status"] == "success"
+    finally:
+        processor.shutdown()
+
+    chunks = vector_store.calls[0]
+    assert {(c["edinet_code"], c["company_name"]) for c in chunks} == {("E00001", "テスト株式会社")}
+
+
+def test_pipeline_parses_members_while_extracting(tmp_path):
+    parsing = {doc_id: threading.Event() for doc_id in ("S1000001", "S1000002")}
+
+    class SignallingParser(XBRLParser):
+        def iter_facts(self, file_path):
+            parsing[Path(file_path).stem].set()
+            return super().iter_facts(file_path)
+
+    class StreamingClient(FakeEdinetClient):
+        overlapped = {}
+
+        def iter_document_members(self, doc_id, save_dir=None, file_type="1"):
+            yield from super().iter_document_members(doc_id, save_dir, file_type)
+            # 实例在后续成员解压完成之前就开始解析
+            self.overlapped[doc_id] = parsing[doc_id].wait(timeout=5)
+
+    client = StreamingClient()
+    processor = _processor(RecordingVectorStore())
+    processor.edinet_client = client
+    processor.xbrl_parser = SignallingParser()
+    try:
+        results = processor.process_batch(list(parsing))
+    finally:
+        processor.shutdown()
+
+    assert [r["status"] for r in results] == ["success", "success"]
+    assert client.overlapped == {doc_id: True for doc_id in parsing}
+
+
+def test_parse_executor_is_created_once_under_concurrency():
+    processor = _processor(RecordingVectorStore(), parse_workers=1)
+    barrier = threading.Barrier(8)
+    executors = []
+
+    def get():
+        barrier.wait()
+        executors.append(processor._get_parse_executor())
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert len({id(e) for e in executors}) == 1
+    finally:
+        processor.shutdown()
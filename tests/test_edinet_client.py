@@ -0,0 +1,263 @@
+import io
+import json
+import sys
+import tempfile
+import zipfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.edinet_client import EdinetClient, classify_member
+from app.core.edinet_cache import DailyListCache
+from app.services.raw_store import RawDocumentStore
+
+STUB_DELAY = 0.1
+
+
+class StubEdinetHandler(BaseHTTPRequestHandler):
+    """模拟EDINET书类一览API：每次请求延迟固定时间，指定日期返回500"""
+
+    failing_dates = {"2024-06-05"}
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        time.sleep(STUB_DELAY)
+        self.server.request_count += 1
+
+        if parsed.path == "/api/v2/documents.json":
+            date = query["date"][0]
+            if date in self.failing_dates:
+                self.send_response(500)
+                self.end_headers()
+                return
+            body = json.dumps({"results": [
+                {"docID": f"S{date.replace('-', '')}", "docTypeCode": "120", "filerName": "テスト株式会社"},
+                {"docID": f"X{date.replace('-', '')}", "docTypeCode": "140", "filerName": "テスト株式会社"},
+            ]}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if parsed.path.startswith("/api/v2/documents/"):
+            body = self.server.archive
+            self.send_response(200)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(404)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubEdinetHandler)
+    server.request_count = 0
+    server.archive = b""
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _client(server, **kwargs) -> EdinetClient:
+    host, port = server.server_address
+    return EdinetClient(api_url=f"http://{host}:{port}/api", **kwargs)
+
+
+def test_concurrent_search_is_faster_and_ordered(stub_server):
+    client = _client(stub_server, max_workers=8, rate_limit=0)
+
+    start = time.perf_counter()
+    sequential = client.search_documents_detailed("2024-06-01", "2024-06-10", concurrent=False)
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    concurrent = client.search_documents_detailed("2024-06-01", "2024-06-10", concurrent=True)
+    concurrent_time = time.perf_counter() - start
+
+    assert concurrent == sequential
+    assert concurrent_time < sequential_time / 2
+
+    doc_ids = [d["doc_id"] for d in concurrent["documents"]]
+    assert doc_ids == sorted(doc_ids)
+    assert len(doc_ids) == 9
+    assert list(concurrent["failed_dates"]) == ["2024-06-05"]
+
+
+def test_rate_limit_spaces_requests(stub_server):
+    client = _client(stub_server, max_workers=8, rate_limit=20)
+
+    start = time.perf_counter()
+    client.search_documents("2024-06-01", "2024-06-10")
+    elapsed = time.perf_counter() - start
+
+    # 10个请求、每秒最多20个 → 至少约0.45秒
+    assert elapsed >= 0.45
+    assert stub_server.request_count == 10
+
+
+def test_download_document_streams_zip_to_disk(stub_server, tmp_path, monkeypatch):
+    import app.core.edinet_client as edinet_client_module
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("XBRL/PublicDoc/jpcrp-000.xbrl", "<xbrl>" + "売上高" * 50000 + "</xbrl>")
+        zf.writestr("XBRL/AuditDoc/attachment.bin", b"\0" * 100000)
+    stub_server.archive = buffer.getvalue()
+
+    # 缩小块大小与内存阈值，确保走分块写入与落盘路径
+    monkeypatch.setattr(edinet_client_module, "DOWNLOAD_CHUNK_SIZE", 4096)
+    monkeypatch.setattr(edinet_client_module, "SPOOL_MAX_SIZE", 8192)
+
+    spools = []
+
+    class RecordingSpool(tempfile.SpooledTemporaryFile):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.writes = []
+            spools.append(self)
+
+        def write(self, data):
+            self.writes.append(len(data))
+            return super().write(data)
+
+    monkeypatch.setattr(edinet_client_module.tempfile, "SpooledTemporaryFile", RecordingSpool)
+
+    client = _client(stub_server, rate_limit=0)
+    path = client.download_document("S100TEST", save_dir=tmp_path)
+
+    assert path == tmp_path / "S100TEST.xbrl"
+    assert path.read_text(encoding="utf-8").startswith("<xbrl>売上高")
+    # 响应按块写入，超过内存阈值后转存到磁盘
+    (spool,) = spools
+    assert sum(spool.writes) == len(stub_server.archive)
+    assert len(spool.writes) > 1 and max(spool.writes) <= 4096
+    assert spool._rolled
+
+
+def test_download_document_reuses_raw_store(stub_server, tmp_path):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("XBRL/PublicDoc/jpcrp-000.xbrl", "<xbrl>売上高</xbrl>")
+    stub_server.archive = buffer.getvalue()
+
+    raw_store = RawDocumentStore(str(tmp_path / "raw"))
+    client = _client(stub_server, rate_limit=0, raw_store=raw_store)
+    for _ in range(3):
+        path = client.download_document("S100TEST", save_dir=tmp_path)
+        assert path.read_text(encoding="utf-8") == "<xbrl>売上高</xbrl>"
+
+    assert stub_server.request_count == 1
+
+
+def _filing_archive() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("XBRL/PublicDoc/jpcrp030000-asr-001_E00001-000.xsd", "<schema/>")
+        zf.writestr("XBRL/PublicDoc/jpcrp030000-asr-001_E00001-000_lab.xml", "<linkbase/>")
+        zf.writestr("XBRL/PublicDoc/manifest_PublicDoc.xml", "<manifest/>")
+        zf.writestr("XBRL/PublicDoc/0102010_honbun_ixbrl.htm", "<html>page2</html>")
+        zf.writestr("XBRL/PublicDoc/0101010_honbun_ixbrl.htm", "<html>page1</html>")
+        zf.writestr("XBRL/PublicDoc/jpcrp030000-asr-001_E00001-000.xbrl", "<xbrl>instance</xbrl>")
+        zf.writestr("XBRL/AuditDoc/jpaud-aar-cn-001_E00001-000.xbrl", "<xbrl>audit</xbrl>")
+        zf.writestr("XBRL/PublicDoc/images/logo.gif", b"GIF89a")
+    return buffer.getvalue()
+
+
+def test_classify_member_roles():
+    assert classify_member("XBRL/PublicDoc/jpcrp-000.xbrl") == "instance"
+    assert classify_member("XBRL/PublicDoc/0101010_honbun_ixbrl.htm") == "ixbrl"
+    assert classify_member("XBRL/PublicDoc/jpcrp-000_pre.xml") == "linkbase"
+    assert classify_member("XBRL/PublicDoc/jpcrp-000_lab-en.xml") == "linkbase"
+    assert classify_member("XBRL/PublicDoc/jpcrp-000.xsd") == "schema"
+    assert classify_member("XBRL/PublicDoc/manifest_PublicDoc.xml") == "manifest"
+    assert classify_member("XBRL/AuditDoc/jpaud-000.xbrl") == "audit"
+    assert classify_member("XBRL/AttachDoc/attach.pdf") == "attachment"
+
+
+def test_download_document_picks_instance_over_schema_and_linkbases(stub_server, tmp_path):
+    stub_server.archive = _filing_archive()
+    client = _client(stub_server, rate_limit=0)
+
+    path = client.download_document("S100TEST", save_dir=tmp_path)
+    assert path.read_text(encoding="utf-8") == "<xbrl>instance</xbrl>"
+
+
+def test_iter_document_members_extracts_ingest_members_in_order(stub_server, tmp_path):
+    stub_server.archive = _filing_archive()
+    raw_store = RawDocumentStore(str(tmp_path / "raw"))
+    client = _client(stub_server, rate_limit=0, raw_store=raw_store)
+
+    members = list(client.iter_document_members("S100TEST", save_dir=tmp_path))
+
+    assert [(m["role"], Path(m["name"]).name) for m in members] == [
+        ("instance", "jpcrp030000-asr-001_E00001-000.xbrl"),
+        ("ixbrl", "0101010_honbun_ixbrl.htm"),
+        ("ixbrl", "0102010_honbun_ixbrl.htm"),
+    ]
+    assert [m["path"].read_text(encoding="utf-8") for m in members] == [
+        "<xbrl>instance</xbrl>", "<html>page1</html>", "<html>page2</html>"
+    ]
+    assert stub_server.request_count == 1
+
+    # 只取实例时不解压页面
+    instances = list(client.iter_document_members("S100TEST", save_dir=tmp_path / "only", roles=("instance",)))
+    assert [m["role"] for m in instances] == ["instance"]
+    assert stub_server.request_count == 1
+
+
+def test_daily_list_cache_serves_closed_dates_without_network(stub_server, tmp_path):
+    cache = DailyListCache(str(tmp_path / "lists.sqlite3"), ttl_seconds=3600)
+    client = _client(stub_server, rate_limit=0, daily_list_cache=cache)
+
+    first = client.search_documents_detailed("2024-06-01", "2024-06-10")
+    assert stub_server.request_count == 10
+
+    # 新实例从磁盘读取，已结束日期不再请求；失败的日期会重试
+    cache = DailyListCache(str(tmp_path / "lists.sqlite3"), ttl_seconds=3600)
+    client = _client(stub_server, rate_limit=0, daily_list_cache=cache)
+    second = client.search_documents_detailed("2024-06-01", "2024-06-10")
+
+    assert second == first
+    assert stub_server.request_count == 11
+    assert cache.get_stats()["hits"] == 9
+
+
+def test_daily_list_cache_refreshes_recent_dates_on_ttl(tmp_path):
+    from datetime import date
+
+    today = date.today().strftime("%Y-%m-%d")
+    cache = DailyListCache(str(tmp_path / "lists.sqlite3"), ttl_seconds=3600)
+    cache.put(today, [{"docID": "S1"}])
+    assert cache.get(today) == [{"docID": "S1"}]
+
+    cache.ttl_seconds = 0
+    assert cache.get(today) is None
+
+
+def test_daily_list_cache_closes_dates_in_jst(tmp_path):
+    from datetime import datetime, timezone
+
+    cache = DailyListCache(str(tmp_path / "lists.sqlite3"))
+    # UTC 2024-01-02 16:00 = JST 2024-01-03 01:00，2024-01-01 在JST下已结束
+    fetched_at = datetime(2024, 1, 2, 16, tzinfo=timezone.utc).timestamp()
+    assert cache._is_permanent("2024-01-01", fetched_at)
+    assert not cache._is_permanent("2024-01-02", fetched_at)
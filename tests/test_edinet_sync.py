@@ -0,0 +1,115 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.edinet_cache import DailyListCache
+from app.core.edinet_client import EdinetClient
+from app.services.edinet_sync import EdinetSyncDaemon
+from app.services.job_queue import IngestJobQueue
+
+
+def _item(date, seq, doc_type="120", xbrl="1"):
+    return {
+        "docID": f"S{date.replace('-', '')}{seq:03d}",
+        "seqNumber": seq,
+        "docTypeCode": doc_type,
+        "filerName": "テスト株式会社",
+        "submitDateTime": f"{date} 09:{seq % 60:02d}",
+        "xbrlFlag": xbrl,
+    }
+
+
+class FakeEdinet(EdinetClient):
+    """书类一览来自内存，记录每次请求的日期"""
+
+    def __init__(self, lists, **kwargs):
+        super().__init__(rate_limit=0, **kwargs)
+        self.lists = lists
+        self.requests = []
+        self.failing = set()
+
+    def _fetch_daily_list(self, search_date):
+        self.requests.append(search_date)
+        if search_date in self.failing:
+            raise RuntimeError("503")
+        return list(self.lists.get(search_date, []))
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    today = {"value": "2024-06-25"}
+    monkeypatch.setattr(EdinetSyncDaemon, "_today", staticmethod(lambda: today["value"]))
+    lists = {
+        "2024-06-24": [_item("2024-06-24", 1), _item("2024-06-24", 2, doc_type="140")],
+        "2024-06-25": [_item("2024-06-25", 1), _item("2024-06-25", 2, xbrl="0")],
+    }
+    cache = DailyListCache(str(tmp_path / "lists.sqlite3"), ttl_seconds=3600)
+    client = FakeEdinet(lists, daily_list_cache=cache)
+    queue = IngestJobQueue(str(tmp_path / "jobs.sqlite3"))
+
+    def daemon():
+        return EdinetSyncDaemon(client, str(tmp_path / "sync.json"), doc_types=["120"], initial_days=1,
+                                job_queue=queue)
+
+    return today, lists, client, queue, daemon
+
+
+def _job_doc_ids(queue, job_id):
+    return [item["doc_id"] for item in queue.get_job(job_id)["items"]]
+
+
+def test_sync_submits_only_unseen_filings(env):
+    today, lists, client, queue, daemon = env
+    sync = daemon()
+
+    first = sync.run_once()
+    assert sorted(client.requests) == ["2024-06-24", "2024-06-25"]
+    # 文档类型与XBRL有无均被筛选
+    assert _job_doc_ids(queue, first["job_id"]) == ["S20240624001", "S20240625001"]
+    assert queue.get_job(first["job_id"])["source"] == "sync"
+    assert first["watermark"] == ("2024-06-25", 1)
+
+    # 稳定状态：每次轮询只请求当天一次（不使用缓存），没有新文档时不创建任务
+    client.requests.clear()
+    assert sync.run_once()["job_id"] is None
+    assert client.requests == ["2024-06-25"]
+
+    lists["2024-06-25"].append(_item("2024-06-25", 3))
+    second = sync.run_once()
+    assert _job_doc_ids(queue, second["job_id"]) == ["S20240625003"]
+
+    # 重启后从持久化的高水位继续
+    restarted = daemon()
+    assert restarted.watermark == ("2024-06-25", 3)
+    assert restarted.run_once()["new"] == 0
+
+
+def test_sync_day_rollover_and_failed_dates(env):
+    today, lists, client, queue, daemon = env
+    sync = daemon()
+    sync.run_once()
+
+    # 跨日：前一天的剩余提交与新一天一起拉取，一次后高水位移到新的一天
+    lists["2024-06-25"].append(_item("2024-06-25", 4))
+    lists["2024-06-26"] = [_item("2024-06-26", 1)]
+    today["value"] = "2024-06-26"
+    client.failing = {"2024-06-26"}
+    client.requests.clear()
+    result = sync.run_once()
+    assert sorted(client.requests) == ["2024-06-25", "2024-06-26"]
+    assert _job_doc_ids(queue, result["job_id"]) == ["S20240625004"]
+    assert result["watermark"] == ("2024-06-25", 4)
+    assert sync.get_stats()["last_error"]
+
+    client.failing = set()
+    result = sync.run_once()
+    assert _job_doc_ids(queue, result["job_id"]) == ["S20240626001"]
+    assert result["watermark"] == ("2024-06-26", 1)
+
+    client.requests.clear()
+    sync.run_once()
+    assert client.requests == ["2024-06-26"]
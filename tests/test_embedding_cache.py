@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.embedding_cache import EmbeddingDiskCache
+
+
+def _vectors(n, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def test_roundtrip_across_shards_and_reopen(tmp_path):
+    texts = [f"テキスト{i}" for i in range(25)]
+    vectors = _vectors(25)
+
+    cache = EmbeddingDiskCache(str(tmp_path), shard_rows=10)
+    cache.put_many("model-a", texts[:12], vectors[:12])
+    cache.put_many("model-a", texts, vectors)  # 已存在的前12条跳过
+
+    reopened = EmbeddingDiskCache(str(tmp_path), shard_rows=10)
+    hit_mask, hits = reopened.get_many("model-a", texts + ["未登録"])
+
+    assert hit_mask.tolist() == [True] * 25 + [False]
+    np.testing.assert_allclose(hits, vectors, atol=1e-2)
+    assert reopened.get_stats()["models"] == {"model-a": 25}
+    assert sorted(p.name for p in (tmp_path / "model-a").glob("*.keys")) == [
+        "shard_00000.keys", "shard_00001.keys", "shard_00002.keys"
+    ]
+
+
+def test_entries_are_per_model(tmp_path):
+    cache = EmbeddingDiskCache(str(tmp_path))
+    cache.put_many("intfloat/multilingual-e5-large-instruct", ["売上高"], _vectors(1))
+
+    hit_mask, _ = cache.get_many("other-model", ["売上高"])
+    assert not hit_mask.any()
+
+
+def test_uncommitted_tail_is_discarded(tmp_path):
+    cache = EmbeddingDiskCache(str(tmp_path))
+    cache.put_many("m", ["a", "b"], _vectors(2))
+    # 模拟写入中断：文件尾部多出未提交的数据
+    with open(tmp_path / "m" / "shard_00000.keys", "ab") as f:
+        f.write(b"\0" * 8)
+
+    reopened = EmbeddingDiskCache(str(tmp_path))
+    reopened.put_many("m", ["c"], _vectors(1, seed=1))
+    hit_mask, hits = reopened.get_many("m", ["a", "b", "c"])
+    assert hit_mask.all()
+    np.testing.assert_allclose(hits[2], _vectors(1, seed=1)[0], atol=1e-2)
+
+
+def test_unlisted_shard_is_removed(tmp_path):
+    cache = EmbeddingDiskCache(str(tmp_path), shard_rows=2)
+    cache.put_many("m", ["a", "b"], _vectors(2))
+    # 模拟新分片写入后、manifest更新前中断
+    for kind, size in (("keys", 8), ("vecs", 2 * 8)):
+        (tmp_path / "m" / f"shard_00001.{kind}").write_bytes(b"\1" * size * 3)
+
+    reopened = EmbeddingDiskCache(str(tmp_path), shard_rows=2)
+    reopened.put_many("m", ["c"], _vectors(1, seed=1))
+    assert (tmp_path / "m" / "shard_00001.keys").stat().st_size == 8
+    hit_mask, hits = reopened.get_many("m", ["a", "b", "c"])
+    assert hit_mask.all()
+    np.testing.assert_allclose(hits[2], _vectors(1, seed=1)[0], atol=1e-2)
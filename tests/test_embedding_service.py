@@ -0,0 +1,70 @@
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.embedding_service import EmbeddingService
+
+
+class RecordingEncoder:
+    """以文本长度作为嵌入值，并记录每次调用的批内容"""
+
+    def __init__(self, gate: threading.Event = None):
+        self.calls = []
+        self.gate = gate
+
+    def __call__(self, texts):
+        if self.gate is not None:
+            self.gate.wait()
+        self.calls.append(list(texts))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_concurrent_submissions_are_coalesced():
+    encoder = RecordingEncoder()
+    service = EmbeddingService(encoder, max_batch_size=64, max_wait_ms=50)
+    try:
+        futures = [service.submit(["あ" * (i + 1)], priority="bulk") for i in range(20)]
+        results = [f.result(timeout=5) for f in futures]
+    finally:
+        service.shutdown()
+
+    assert [r[0, 0] for r in results] == list(range(1, 21))
+    assert len(encoder.calls) < 20
+    assert service.get_stats()["texts"] == 20
+
+
+def test_large_request_is_split_and_reassembled():
+    encoder = RecordingEncoder()
+    service = EmbeddingService(encoder, max_batch_size=8, max_wait_ms=1)
+    try:
+        texts = ["x" * (i + 1) for i in range(30)]
+        result = service.embed(texts)
+    finally:
+        service.shutdown()
+
+    assert result[:, 0].tolist() == list(range(1, 31))
+    assert max(len(c) for c in encoder.calls) <= 8
+
+
+def test_query_requests_take_priority_over_bulk():
+    gate = threading.Event()
+    encoder = RecordingEncoder(gate)
+    service = EmbeddingService(encoder, max_batch_size=4, max_wait_ms=1)
+    try:
+        # 第一批占用工作线程，随后同时积压批量与查询请求
+        first = service.submit(["warmup"], priority="bulk")
+        bulk = service.submit([f"bulk{i}" for i in range(8)], priority="bulk")
+        query = service.submit(["query"], priority="query")
+        gate.set()
+        for f in (first, bulk, query):
+            f.result(timeout=5)
+    finally:
+        service.shutdown()
+
+    order = [t for call in encoder.calls for t in call]
+    assert order.index("query") < order.index("bulk0")
@@ -0,0 +1,140 @@
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.xbrl_parser import XBRLParser
+from app.services.fact_store import FactBatchWriter, FactStore
+
+
+def _fact(element, company, value, end="2024-03-31", context="CurrentYearDuration", dimensions=None, start="2023-04-01"):
+    return {
+        "element": element,
+        "namespace": "jppfs_cor",
+        "context_ref": context,
+        "unit_ref": "JPY",
+        "unit": "JPY",
+        "decimals": "-6",
+        "value": str(value),
+        "is_nil": False,
+        "entity": f"{company}-000",
+        "period": {"type": "duration", "start": start, "end": end},
+        "dimensions": dimensions or {},
+    }
+
+
+def _populate(store):
+    store.add_facts("S1", [
+        _fact("NetSales", "E00001", 100),
+        _fact("NetSales", "E00001", 80, end="2023-03-31", context="Prior1YearDuration"),
+        _fact("NetSales", "E00001", 40, dimensions={"OperatingSegmentsAxis": "SegA"}),
+        _fact("Assets", "E00001", 500),
+    ])
+    store.add_facts("S2", [_fact("NetSales", "E00002", 300)])
+
+
+def test_query_and_aggregate(tmp_path):
+    store = FactStore(str(tmp_path))
+    _populate(store)
+
+    result = store.query(elements=["NetSales"], period_from="2024-01-01")
+    assert sorted(zip(result["company"], result["value"])) == [("E00001", 100.0), ("E00002", 300.0)]
+
+    assert store.aggregate("NetSales", by="company", agg="max") == {"E00001": 100.0, "E00002": 300.0}
+    assert store.aggregate("NetSales", by="period_end", agg="sum") == {"2023-03-31": 80.0, "2024-03-31": 400.0}
+    assert store.aggregate("NetSales", companies=["E00002"], agg="count") == {"E00002": 1.0}
+    assert len(store.query(elements=["NetSales"], include_dimensional=True)["value"]) == 4
+
+
+def test_aggregate_counts_restated_periods_once(tmp_path):
+    store = FactStore(str(tmp_path))
+    # FY2023 年度报告
+    store.add_facts("S100A001", [
+        _fact("NetSales", "E00001", 100),
+        _fact("NetSales", "E00001", 90, start="2022-04-01", end="2023-03-31", context="Prior1YearDuration"),
+    ])
+    # FY2024 年度报告：前期比较数据（FY2023）被修正为 105
+    store.add_facts("S100B002", [
+        _fact("NetSales", "E00001", 120, start="2024-04-01", end="2025-03-31"),
+        _fact("NetSales", "E00001", 105, context="Prior1YearDuration"),
+    ])
+
+    assert store.aggregate("NetSales", agg="sum") == {"E00001": 315.0}
+    assert store.aggregate("NetSales", by="period_end", agg="sum") == {
+        "2023-03-31": 90.0, "2024-03-31": 105.0, "2025-03-31": 120.0,
+    }
+    assert store.aggregate("NetSales", agg="sum", period_from="2024-01-01") == {"E00001": 225.0}
+    assert store.aggregate("NetSales", agg="count", latest_only=False) == {"E00001": 4.0}
+
+
+def test_persistence_and_replace_on_reingest(tmp_path):
+    store = FactStore(str(tmp_path))
+    _populate(store)
+    store.add_facts("S1", [_fact("NetSales", "E00001", 120)])
+
+    reopened = FactStore(str(tmp_path))
+    assert reopened.aggregate("NetSales", agg="sum") == {"E00001": 120.0, "E00002": 300.0}
+    assert reopened.get_stats()["documents"] == 2
+
+
+def test_staged_batches_are_committed_as_one_document(tmp_path):
+    writer = FactBatchWriter(str(tmp_path / "staging"), batch_size=2)
+    for value in (100, 200, 300):
+        writer.add(_fact("NetSales", "E00001", value))
+    writer.add({**_fact("NetSales", "E00001", 0), "is_nil": True})
+    writer.flush()
+
+    # 每批最多 batch_size 条，不在内存中累积整个文档
+    assert writer.count == 3
+    assert len(list((tmp_path / "staging").glob("batch-*.npz"))) == 2
+
+    store = FactStore(str(tmp_path / "facts"))
+    store.add_facts("S1", [_fact("Assets", "E00001", 500)])
+    assert store.add_staged("S1", str(tmp_path / "staging")) == 3
+    assert store.aggregate("NetSales", agg="sum", latest_only=False) == {"E00001": 600.0}
+    assert store.get_stats()["facts"] == 3
+
+
+def test_extract_financial_data_writes_fact_store(tmp_path):
+    store = FactStore(str(tmp_path))
+    parser = XBRLParser(fact_store=store)
+
+    financial = parser.extract_financial_data({
+        "doc_id": "S1",
+        "facts": [_fact("NetSales", "E00001", 100), _fact("Assets", "E00001", 500)],
+    })
+
+    assert financial == {"revenue": 100.0, "profit": None, "assets": 500.0}
+    assert store.get_stats()["facts"] == 2
+
+
+def test_reingest_does_not_load_columns_and_compacts(tmp_path, monkeypatch):
+    import app.services.fact_store as fact_store
+
+    monkeypatch.setattr(fact_store, "MAX_SEGMENTS", 4)
+    store = FactStore(str(tmp_path))
+    _populate(store)
+    store._load_columns = None  # 写入路径不应读取全部段
+    for i in range(10):
+        store.add_facts(f"D{i}", [_fact("NetSales", f"E1{i:04d}", i)])
+        store.add_facts("S1", [_fact("NetSales", "E00001", 100 + i)])
+    del store._load_columns
+
+    assert store.get_stats()["segments"] <= 4
+    reopened = FactStore(str(tmp_path))
+    assert reopened.aggregate("NetSales", companies=["E00001"], agg="sum") == {"E00001": 109.0}
+    assert reopened.get_stats()["documents"] == 12
+    assert len(list((tmp_path / "segments").iterdir())) == reopened.get_stats()["segments"]
+
+
+def test_unlisted_segment_is_ignored_after_crash(tmp_path):
+    store = FactStore(str(tmp_path))
+    _populate(store)
+    # 模拟写入新段后、更新清单前崩溃
+    store._write_segment({name: array.copy() for name, array in store._load_columns().items()})
+
+    reopened = FactStore(str(tmp_path))
+    assert reopened.aggregate("NetSales", agg="sum") == {"E00001": 180.0, "E00002": 300.0}
+    assert reopened.delete_document("S2") is True
+    assert FactStore(str(tmp_path)).aggregate("NetSales", agg="sum") == {"E00001": 180.0}
@@ -0,0 +1,100 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.bm25_index import BM25Index
+from app.services.document_processor import create_chunks
+from app.utils.chunking import JapaneseTextChunker
+
+PARAGRAPHS = [f"第{i}項 当社グループの事業の状況について説明します。" * 8 for i in range(6)]
+
+
+class CountingModel:
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts, **kwargs):
+        self.encoded += len(texts)
+        return np.array([[1.0, len(t) % 7, t.count("第")] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture(params=["chroma", "local"])
+def store(request, make_vector_store, tmp_path):
+    store = make_vector_store(request.param, index_dir=str(tmp_path / "index"))
+    store.embedding_model = CountingModel()
+    store.keyword_index = BM25Index(tokenizer=JapaneseTextChunker(chunk_size=300, chunk_overlap=50).tokenize)
+    return store
+
+
+def chunks_of(paragraphs, doc_id="S100AAAA"):
+    return create_chunks(doc_id, "A社", "\n\n".join(paragraphs))
+
+
+def test_chunk_ids_follow_content():
+    original = chunks_of(PARAGRAPHS)
+    amended = chunks_of(PARAGRAPHS[:3] + ["訂正後の記載です。" * 10] + PARAGRAPHS[4:])
+    assert len({c["chunk_id"] for c in original}) == len(original)
+    shared = {c["chunk_id"] for c in original} & {c["chunk_id"] for c in amended}
+    assert 0 < len(shared) < len(original)
+
+
+def test_reingest_only_touches_changed_chunks(store):
+    original = chunks_of(PARAGRAPHS)
+    first = store.upsert_documents(original)
+    assert first == {"added": len(original), "updated": 0, "metadata_updated": 0, "unchanged": 0, "deleted": 0}
+    assert store.embedding_model.encoded == len(original)
+
+    # 相同内容再次入库：不编码、不写入
+    assert store.upsert_documents(chunks_of(PARAGRAPHS))["unchanged"] == len(original)
+    assert store.embedding_model.encoded == len(original)
+
+    # 订正：替换一段并删去最后一段
+    amended = chunks_of(PARAGRAPHS[:3] + ["訂正後の記載です。" * 10] + PARAGRAPHS[4:5])
+    before = store.embedding_model.encoded
+    stats = store.upsert_documents(amended)
+    changed = stats["added"] + stats["updated"]
+    assert store.embedding_model.encoded - before == changed < len(amended)
+    assert stats["deleted"] > 0
+
+    stored = store.collection.get(where={"doc_id": "S100AAAA"})
+    assert sorted(stored["ids"]) == sorted(c["chunk_id"] for c in amended)
+    assert store.keyword_index.count() == len(amended)
+    assert store.keyword_index.search("訂正後")[0][0] in stored["ids"]
+
+
+def test_metadata_change_updates_chunk(store):
+    chunks = chunks_of(PARAGRAPHS[:2])
+    store.upsert_documents(chunks)
+    before = store.embedding_model.encoded
+    for c in chunks:
+        c["edinet_code"] = "E02144"
+    stats = store.upsert_documents(chunks)
+    # 只有元数据变化：更新元数据，不重新嵌入
+    assert stats["metadata_updated"] == len(chunks)
+    assert stats["updated"] == 0
+    assert store.embedding_model.encoded == before
+    assert {m["edinet_code"] for m in store.collection.get(where={"doc_id": "S100AAAA"})["metadatas"]} == {"E02144"}
+    assert store.search("事業の状況", n_results=1, filter_conditions={"edinet_code": "E02144"})
+
+
+def test_chunks_from_another_model_are_reembedded(store):
+    chunks = chunks_of(PARAGRAPHS[:2])
+    # 后台模型加载完成前用简单模型写入的块
+    real_model = store.embedding_model
+    store.embedding_model = store._create_simple_embedding_model()
+    store.embedding_model.encode = lambda texts, **kwargs: np.ones((len(texts), 3), dtype=np.float32)
+    store.upsert_documents(chunks)
+
+    store.embedding_model = real_model
+    stats = store.upsert_documents(chunks)
+    assert stats["updated"] == len(chunks)
+    assert real_model.encoded == len(chunks)
+    assert {m["embedding_model_name"] for m in store.collection.get(where={"doc_id": "S100AAAA"})["metadatas"]} == {
+        "CountingModel"
+    }
+    assert store.upsert_documents(chunks)["unchanged"] == len(chunks)
@@ -0,0 +1,157 @@
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.job_queue import IngestJobQueue, IngestWorkers
+
+
+class FakeProcessor:
+    """按顺序回调各阶段；docID 以 BAD 开头的文档处理失败"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.processed = []
+        self.lock = threading.Lock()
+
+    def process_batch(self, doc_ids, company_names=None, on_progress=None):
+        results = []
+        for doc_id in doc_ids:
+            on_progress(doc_id, "downloading")
+            time.sleep(self.delay)
+            on_progress(doc_id, "embedding")
+            with self.lock:
+                self.processed.append(doc_id)
+            if doc_id.startswith("BAD"):
+                results.append({"doc_id": doc_id, "status": "failed", "error": "无法提取文本内容"})
+            else:
+                results.append({"doc_id": doc_id, "status": "success", "chunks_created": 3})
+        return results
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_claim_states_and_progress(tmp_path):
+    queue = IngestJobQueue(str(tmp_path / "jobs.sqlite3"))
+    job_id = queue.create_job(["S1", "S2", "S3", "S2"])
+    assert queue.get_job(job_id)["total"] == 3
+
+    claimed = queue.claim(2)
+    assert [doc_id for _, doc_id, _ in claimed] == ["S1", "S2"]
+    queue.set_state(job_id, "S1", "embedding")
+    queue.set_state(job_id, "S2", "done", chunks=5)
+
+    job = queue.get_job(job_id)
+    assert job["status"] == "running"
+    assert job["counts"]["embedding"] == 1 and job["counts"]["queued"] == 1
+    assert job["progress"] == pytest.approx(1 / 3, abs=1e-3)
+    assert job["items"][1]["chunks"] == 5
+    assert queue.get_job("missing") is None
+
+
+def test_restart_requeues_interrupted_documents(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    queue = IngestJobQueue(db_path, max_attempts=2)
+    job_id = queue.create_job(["S1", "S2"])
+    queue.claim(2)
+    queue.set_state(job_id, "S2", "done")
+    queue.close()
+
+    # 重启：S1 重新入队
+    queue = IngestJobQueue(db_path, max_attempts=2)
+    assert queue.get_job(job_id)["counts"]["queued"] == 1
+    assert [doc_id for _, doc_id, _ in queue.claim(5)] == ["S1"]
+    queue.close()
+
+    # 再次中断，达到最大次数后标记失败
+    queue = IngestJobQueue(db_path, max_attempts=2)
+    job = queue.get_job(job_id)
+    assert job["counts"]["failed"] == 1
+    assert job["status"] == "done"
+
+
+def test_parallel_workers_drain_queue_once(tmp_path):
+    queue = IngestJobQueue(str(tmp_path / "jobs.sqlite3"))
+    doc_ids = [f"S{i:03d}" for i in range(40)] + ["BAD1"]
+    job_id = queue.create_job(doc_ids)
+    processor = FakeProcessor(delay=0.005)
+    workers = IngestWorkers(queue, processor, workers=4, batch_size=3, poll_interval=0.05)
+    workers.start()
+    try:
+        assert wait_for(lambda: queue.get_job(job_id)["progress"] == 1.0)
+    finally:
+        workers.stop()
+
+    assert sorted(processor.processed) == sorted(doc_ids)
+    job = queue.get_job(job_id)
+    assert job["counts"]["done"] == 40
+    bad = next(item for item in job["items"] if item["doc_id"] == "BAD1")
+    assert bad["state"] == "failed" and bad["error"] == "无法提取文本内容"
+
+
+def test_workers_wait_for_ready_event(tmp_path):
+    queue = IngestJobQueue(str(tmp_path / "jobs.sqlite3"))
+    job_id = queue.create_job(["S1", "S2"])
+    processor = FakeProcessor()
+    ready = threading.Event()
+    workers = IngestWorkers(queue, processor, workers=2, poll_interval=0.05, ready=ready)
+    workers.start()
+    try:
+        # 嵌入模型就绪前不认领任务
+        time.sleep(0.3)
+        assert processor.processed == []
+        assert queue.get_job(job_id)["status"] == "queued"
+
+        ready.set()
+        assert wait_for(lambda: queue.get_job(job_id)["progress"] == 1.0)
+    finally:
+        workers.stop()
+    assert sorted(processor.processed) == ["S1", "S2"]
+
+
+def test_process_endpoint_enqueues_and_reports_progress(tmp_path):
+    httpx = pytest.importorskip("httpx")
+    from app.main import app
+    from app.state import app_state
+
+    queue = IngestJobQueue(str(tmp_path / "jobs.sqlite3"))
+    processor = FakeProcessor()
+    workers = IngestWorkers(queue, processor, workers=1, poll_interval=0.05)
+    app_state.update({"job_queue": queue, "ingest_workers": workers, "document_processor": processor})
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/api/v1/documents/process", json={"doc_ids": ["S1", "S2"]})
+            job_id = response.json()["job_id"]
+            assert response.json()["queued"] == 2
+            assert (await client.get(f"/api/v1/jobs/{job_id}")).json()["status"] == "queued"
+
+            workers.start()
+            for _ in range(100):
+                job = (await client.get(f"/api/v1/jobs/{job_id}")).json()
+                if job["status"] == "done":
+                    break
+                await asyncio.sleep(0.05)
+            assert job["counts"]["done"] == 2
+            assert (await client.get("/api/v1/jobs/unknown")).status_code == 404
+
+    try:
+        asyncio.run(run())
+    finally:
+        workers.stop()
+        for key in ("job_queue", "ingest_workers", "document_processor"):
+            app_state.pop(key, None)
@@ -0,0 +1,169 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.local_index import LocalVectorIndex, match_where
+
+
+def random_vectors(n, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def fill(index, vectors):
+    ids = [f"c{i}" for i in range(len(vectors))]
+    index.add(
+        ids=ids,
+        embeddings=vectors.tolist(),
+        documents=[f"text {i}" for i in range(len(vectors))],
+        metadatas=[{"doc_id": f"d{i % 5}", "company_name": f"会社{i % 3}"} for i in range(len(vectors))],
+    )
+    return ids
+
+
+def test_query_matches_exact_numpy_search(tmp_path):
+    index = LocalVectorIndex(str(tmp_path), dtype="float32")
+    vectors = random_vectors(500)
+    fill(index, vectors)
+
+    query = random_vectors(1, seed=1)[0]
+    result = index.query(query_embeddings=[query.tolist()], n_results=10)
+
+    expected = np.argsort(-(vectors @ query))[:10]
+    assert result["ids"][0] == [f"c{i}" for i in expected]
+    assert result["documents"][0][0] == f"text {expected[0]}"
+    assert result["distances"][0][0] == pytest.approx(1 - float(vectors[expected[0]] @ query), abs=1e-5)
+
+
+def test_where_filter_and_delete(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    fill(index, random_vectors(50))
+
+    result = index.query(query_embeddings=random_vectors(1, seed=2).tolist(), n_results=50, where={"doc_id": "d1"})
+    assert len(result["ids"][0]) == 10
+    assert all(m["doc_id"] == "d1" for m in result["metadatas"][0])
+
+    ids = index.get(where={"doc_id": "d1"}, include=[])["ids"]
+    index.delete(ids=ids)
+    assert index.count() == 40
+    assert index.get(where={"doc_id": "d1"})["ids"] == []
+
+
+def test_persists_and_loads_lazily(tmp_path):
+    vectors = random_vectors(100)
+    index = LocalVectorIndex(str(tmp_path))
+    fill(index, vectors)
+    # 删除过半触发压缩
+    index.delete(where={"doc_id": {"$in": ["d0", "d1", "d2"]}})
+    assert index.rows == 40
+
+    reopened = LocalVectorIndex(str(tmp_path))
+    assert reopened.get_stats() == {"loaded": False}
+    assert reopened.count() == 40
+    query = vectors[7]  # d2，已删除
+    top = reopened.query(query_embeddings=[query.tolist()], n_results=1)
+    assert top["ids"][0][0] != "c7"
+    assert reopened.get(ids=["c8"])["documents"] == ["text 8"]
+
+    # 已存在的ID不重复写入
+    reopened.add(ids=["c8"], embeddings=[vectors[8].tolist()], documents=["dup"], metadatas=[{}])
+    assert reopened.count() == 40
+
+
+def test_discards_uncommitted_tail(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    fill(index, random_vectors(10))
+    # 模拟写入向量后、更新manifest前中断
+    with open(index.vectors_path, "ab") as f:
+        random_vectors(3).astype(np.float16).tofile(f)
+
+    reopened = LocalVectorIndex(str(tmp_path))
+    assert reopened.count() == 10
+    reopened.add(ids=["new"], embeddings=random_vectors(1, seed=3).tolist(), documents=["new"], metadatas=[{}])
+    assert reopened.get(ids=["new"])["documents"] == ["new"]
+    assert reopened.query(query_embeddings=random_vectors(1, seed=3).tolist(), n_results=1)["ids"][0] == ["new"]
+
+
+def test_interrupted_compaction_keeps_previous_generation(tmp_path, monkeypatch):
+    index = LocalVectorIndex(str(tmp_path))
+    fill(index, random_vectors(20))
+    index.delete(where={"doc_id": "d0"})
+
+    # 模拟新一代写入后、切换manifest前中断
+    monkeypatch.setattr(index, "_save_manifest", lambda: (_ for _ in ()).throw(OSError("disk full")))
+    with pytest.raises(OSError):
+        index.compact()
+    assert (tmp_path / "vectors.1.bin").exists()
+    assert index.generation == 0 and index.count() == 16
+
+    reopened = LocalVectorIndex(str(tmp_path))
+    assert reopened.count() == 16
+    assert not (tmp_path / "vectors.1.bin").exists()
+    reopened.compact()
+    assert reopened.generation == 1 and reopened.rows == 16
+    assert sorted(p.name for p in tmp_path.glob("vectors*.bin")) == ["vectors.1.bin"]
+    assert LocalVectorIndex(str(tmp_path)).get(ids=["c1"])["documents"] == ["text 1"]
+
+
+def test_indexed_where_matches_full_scan(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    fill(index, random_vectors(30))
+    index.update(ids=["c1"], metadatas=[{"doc_id": "d9", "company_name": "会社1"}])
+    index.delete(ids=["c6"])
+
+    wheres = [
+        {"doc_id": "d1"},
+        {"doc_id": {"$in": ["d1", "d9"]}},
+        {"$and": [{"doc_id": "d1"}, {"company_name": "会社2"}]},
+        {"$or": [{"doc_id": "d9"}, {"doc_id": "d2"}]},
+        {"$or": [{"doc_id": "d9"}, {"company_name": "会社0"}]},
+    ]
+    for where in wheres:
+        expected = [i for i in index._row_of.values() if match_where(index._metadatas[i], where)]
+        assert index._select_rows(where=where) == sorted(expected)
+    assert "c1" not in index.get(where={"doc_id": "d1"})["ids"]
+    assert index.get(where={"doc_id": "d9"})["ids"] == ["c1"]
+
+
+def test_match_where_operators():
+    metadata = {"doc_id": "S100A", "company_name": "トヨタ自動車株式会社", "chunk_size": 300}
+    assert match_where(metadata, {"company_name": {"$contains": "トヨタ"}})
+    assert match_where(metadata, {"$and": [{"doc_id": "S100A"}, {"chunk_size": {"$gte": 300}}]})
+    assert not match_where(metadata, {"$or": [{"doc_id": "S100B"}, {"chunk_size": {"$lt": 100}}]})
+    assert match_where(metadata, {"doc_id": {"$nin": ["S100B"]}})
+
+
+def test_vector_store_manager_with_local_backend(tmp_path):
+    pytest.importorskip("chromadb")
+    pytest.importorskip("sentence_transformers")
+    from app.services.vector_store import VectorStoreManager
+
+    VectorStoreManager._load_embedding_model_background, original = (
+        lambda self: None, VectorStoreManager._load_embedding_model_background
+    )
+    try:
+        store = VectorStoreManager(backend="local", index_dir=str(tmp_path))
+    finally:
+        VectorStoreManager._load_embedding_model_background = original
+
+    store.embedding_model = type("Model", (), {
+        "encode": lambda self, texts, **kw: np.array(
+            [[1.0, 0.0] if "売上" in t else [0.0, 1.0] for t in texts], dtype=np.float32
+        )
+    })()
+    assert store.add_documents([
+        {"chunk_id": "a_0", "doc_id": "a", "text": "売上高は100億円", "company_name": "A社"},
+        {"chunk_id": "b_0", "doc_id": "b", "text": "従業員数は500人", "company_name": "B社"},
+    ])
+
+    results = store.search("売上は？", n_results=1)
+    assert results[0]["id"] == "a_0"
+    assert results[0]["score"] == pytest.approx(1.0, abs=1e-3)
+    assert store.delete_document("a")
+    assert store.get_collection_stats()["total_chunks"] == 1
@@ -0,0 +1,81 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.onnx_embedding import SAMPLE_TEXTS, OnnxInt8Runtime, evaluate_embedding_model
+
+
+class HashModel:
+    """确定性嵌入：字符哈希向量，可加入噪声模拟量化误差"""
+
+    def __init__(self, noise=0.0, seed=0):
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+
+    def encode(self, texts, **kwargs):
+        emb = np.zeros((len(texts), 64), dtype=np.float32)
+        for i, t in enumerate(texts):
+            for ch in t:
+                emb[i, hash(ch) % 64] += 1.0
+        emb += self.noise * self.rng.standard_normal(emb.shape).astype(np.float32) * emb.std()
+        return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+def test_evaluate_reports_recall_cosine_and_throughput():
+    close = evaluate_embedding_model(HashModel(), HashModel(noise=0.01), SAMPLE_TEXTS, k=5)
+    assert close["recall_at_k"] >= 0.9
+    assert close["cosine_min"] > 0.99
+    assert close["reference_texts_per_sec"] > 0 and close["candidate_texts_per_sec"] > 0
+
+    far = evaluate_embedding_model(HashModel(), HashModel(noise=5.0), SAMPLE_TEXTS, k=5)
+    assert far["recall_at_k"] < close["recall_at_k"]
+    assert far["cosine_min"] < 0.9
+
+
+@pytest.fixture
+def store_factory(make_vector_store, tmp_path):
+    def make(candidate):
+        store = make_vector_store(embedding_runtime="onnx-int8", onnx_model_dir=str(tmp_path))
+        runtime = store.onnx_runtime
+        runtime.model_dir.mkdir(parents=True, exist_ok=True)
+        runtime.model_path.write_bytes(b"onnx")
+        runtime.load = lambda reference=None: candidate
+        return store
+
+    return make
+
+
+def test_switches_only_when_accuracy_check_passes(store_factory):
+    reference = HashModel()
+    good = HashModel(noise=0.01)
+    store = store_factory(good)
+    store.embedding_model = reference
+    store._switch_to_onnx(reference)
+    assert store.embedding_model is good
+    assert store.embedding_model_name.endswith("@onnx-int8")
+    assert store.get_collection_stats()["embedding_runtime"]["accuracy_report"]["passed"] is True
+
+    # 已通过检查的模型文件在下次启动时直接加载
+    assert store.onnx_runtime.verified_report() is not None
+    assert store._load_verified_onnx()
+
+    bad = HashModel(noise=5.0)
+    store = store_factory(bad)
+    store.embedding_model = reference
+    store._switch_to_onnx(reference)
+    assert store.embedding_model is reference
+    assert store.embedding_runtime_report["passed"] is False
+    assert store.onnx_runtime.verified_report() is None
+
+
+def test_onnx_runtime_requires_exported_model(tmp_path):
+    runtime = OnnxInt8Runtime("org/model", str(tmp_path))
+    assert runtime.model_dir.name == "org__model"
+    assert runtime.verified_report() is None
+    with pytest.raises(FileNotFoundError):
+        runtime.load()
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.rag_engine import RAGEngine
+from app.state import app_state
+
+TOKENS = ["売上高は", "100", "億円", "です。"]
+TOKEN_DELAY = 0.2
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    """按行逐个返回token的Ollama /api/generate 模拟（与Ollama相同使用分块传输）"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        self.server.requests.append(payload)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in TOKENS:
+            self._write_chunk(json.dumps({"response": token, "done": False}).encode() + b"\n")
+            time.sleep(TOKEN_DELAY)
+        self._write_chunk(json.dumps({"response": "", "done": True}).encode() + b"\n")
+        self._write_chunk(b"")
+
+    def log_message(self, *args):
+        pass
+
+
+class TruncatingOllamaHandler(OllamaStubHandler):
+    """返回第一个token后断开连接（不发送done）"""
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.requests.append(json.loads(self.rfile.read(length)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk(json.dumps({"response": TOKENS[0], "done": False}).encode() + b"\n")
+        self.close_connection = True
+
+
+def _serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+@pytest.fixture
+def ollama():
+    server = _serve(OllamaStubHandler)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def truncating_ollama():
+    server = _serve(TruncatingOllamaHandler)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class StubVectorStore:
+    def search(self, query, n_results=5, filter_conditions=None):
+        return [{"text": "売上高 100億円", "metadata": {"company_name": "テスト株式会社", "doc_id": "S100TEST"}, "score": 0.9}]
+
+
+def make_engine(port):
+    return RAGEngine(StubVectorStore(), ollama_host="127.0.0.1", ollama_port=port, ollama_model="test")
+
+
+async def collect(stream):
+    return [item async for item in stream]
+
+
+def test_generate_stream_yields_tokens_incrementally(ollama):
+    engine = make_engine(ollama.server_address[1])
+    start = time.monotonic()
+    arrivals = []
+    tokens = []
+
+    async def consume():
+        async for token in engine.agenerate_stream("売上高は？", [{"company": "テスト", "text": "売上高 100億円"}]):
+            arrivals.append(time.monotonic() - start)
+            tokens.append(token)
+        await engine.aclose()
+
+    asyncio.run(consume())
+
+    assert tokens == TOKENS
+    assert ollama.requests[0]["stream"] is True
+    # 第一个token在整个回答完成之前就已到达
+    assert arrivals[0] < TOKEN_DELAY * len(TOKENS) / 2
+    assert arrivals[-1] >= TOKEN_DELAY * (len(TOKENS) - 1)
+
+
+def test_generate_stream_falls_back_when_ollama_unavailable():
+    engine = make_engine(1)  # 无服务监听的端口
+    tokens = asyncio.run(collect(engine.agenerate_stream("売上高は？", [{"company": "テスト", "text": "売上高 100億円"}])))
+    assert len(tokens) == 1
+    assert "テスト" in tokens[0]
+
+
+def test_query_stream_endpoint_sends_sources_then_tokens(ollama):
+    httpx = pytest.importorskip("httpx")
+    from app.main import app
+
+    app_state["rag_engine"] = make_engine(ollama.server_address[1])
+
+    async def consume():
+        events = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            async with client.stream("POST", "/api/v1/query/stream", json={"question": "売上高は？"}) as response:
+                assert response.status_code == 200
+                assert response.headers["content-type"].startswith("text/event-stream")
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                    elif line.startswith("data:"):
+                        events.append((event, json.loads(line[len("data:"):])))
+        return events
+
+    try:
+        events = asyncio.run(consume())
+    finally:
+        app_state.pop("rag_engine", None)
+
+    names = [name for name, _ in events]
+    assert names[0] == "sources"
+    assert names[-1] == "done"
+    assert events[0][1]["sources"][0]["doc_id"] == "S100TEST"
+    assert "".join(data["text"] for name, data in events if name == "token") == "".join(TOKENS)
+    assert events[-1][1]["time_to_first_token"] < events[-1][1]["processing_time"]
+
+
+class StubEmbeddingStore(StubVectorStore):
+    embedding_model_name = "stub"
+
+    def get_query_embedding(self, query):
+        return [1.0, 0.0]
+
+
+def test_truncated_stream_is_not_cached(truncating_ollama, ollama):
+    from app.services.answer_cache import AnswerCache
+
+    cache = AnswerCache()
+    engine = RAGEngine(
+        StubEmbeddingStore(), "127.0.0.1", truncating_ollama.server_address[1], "test", answer_cache=cache
+    )
+    status = {}
+
+    async def truncated():
+        tokens = await collect(engine.agenerate_stream("売上高は？", [{"text": "売上高"}], status=status))
+        await collect(engine.aquery_stream("売上高は？"))
+        await engine.aclose()
+        return tokens
+
+    assert asyncio.run(truncated()) == TOKENS[:1]
+    assert status["complete"] is False
+    assert len(cache._groups) == 0
+
+    # 完整的回答才写入缓存
+    engine = RAGEngine(StubEmbeddingStore(), "127.0.0.1", ollama.server_address[1], "test", answer_cache=cache)
+    asyncio.run(collect(engine.aquery_stream("売上高は？")))
+    assert engine.query("売上高は？")["cached"] is True
+    assert cache._in_flight == {}
+
+
+def test_query_stream_reports_truncated_answer(truncating_ollama):
+    engine = make_engine(truncating_ollama.server_address[1])
+    events = asyncio.run(collect(engine.aquery_stream("売上高は？")))
+
+    assert [e["event"] for e in events] == ["sources", "token", "error"]
+    assert events[1]["data"]["text"] == TOKENS[0]
+    assert events[-1]["data"]["truncated"] is True
@@ -0,0 +1,69 @@
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.raw_store import RawDocumentStore
+
+
+def _writer(content: bytes, content_type: str = "application/zip"):
+    def write(fileobj):
+        fileobj.write(content)
+        return content_type
+    return write
+
+
+def test_get_or_fetch_downloads_once(tmp_path):
+    store = RawDocumentStore(str(tmp_path))
+    calls = []
+
+    def writer(fileobj):
+        calls.append(1)
+        fileobj.write(b"PK-zip-bytes")
+        return "application/zip"
+
+    first = store.get_or_fetch("S100A", "1", writer)
+    second = store.get_or_fetch("S100A", "1", writer)
+
+    assert first == second
+    assert first[0].read_bytes() == b"PK-zip-bytes"
+    assert len(calls) == 1
+    assert store.get_stats()["hits"] == 1
+
+    # 文档锁为固定数量的分段锁，不随文档数增长
+    for i in range(200):
+        store.get_or_fetch(f"S100B{i:03d}", "1", _writer(b"%d" % i))
+    assert len(store._key_locks) == 64
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = RawDocumentStore(str(tmp_path))
+    path_a, _ = store.put("S100A", "1", _writer(b"same"))
+    path_b, _ = store.put("S100B", "1", _writer(b"same"))
+
+    assert path_a == path_b
+    assert store.get_stats() == {"entries": 2, "total_bytes": 4, "max_bytes": store.max_bytes, "hits": 0, "misses": 0}
+
+
+def test_error_responses_are_not_stored(tmp_path):
+    store = RawDocumentStore(str(tmp_path))
+    assert store.put("S100A", "1", _writer(b'{"error": 1}', "application/json")) is None
+    assert store.get("S100A", "1") is None
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    store = RawDocumentStore(str(tmp_path), max_bytes=25)
+    store.put("S100A", "1", _writer(b"a" * 10))
+    time.sleep(0.01)
+    store.put("S100B", "1", _writer(b"b" * 10))
+    time.sleep(0.01)
+    store.get("S100A", "1")  # A 变为最近访问
+    time.sleep(0.01)
+    store.put("S100C", "1", _writer(b"c" * 10))
+
+    assert store.get("S100A", "1") is not None
+    assert store.get("S100B", "1") is None
+    assert store.get("S100C", "1") is not None
+    assert store.get_stats()["total_bytes"] == 20
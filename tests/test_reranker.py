@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.rag_engine import RAGEngine
+from app.services.reranker import CrossEncoderReranker
+
+
+class OverlapModel:
+    """按问题与块的共同字符数打分的假Cross-Encoder"""
+
+    def __init__(self):
+        self.pairs = 0
+
+    def predict(self, pairs, batch_size=16, show_progress_bar=False):
+        self.pairs += len(pairs)
+        return [len(set(q) & set(t)) for q, t in pairs]
+
+
+class FakeVectorStore:
+    def __init__(self, texts):
+        self.texts = texts
+        self.requested = None
+
+    def search(self, query, n_results=5, filter_conditions=None):
+        self.requested = n_results
+        return [
+            {"id": f"c{i}", "text": t, "metadata": {"doc_id": "d", "company_name": "A社"}, "score": 1 - i * 0.1}
+            for i, t in enumerate(self.texts[:n_results])
+        ]
+
+
+def make_reranker():
+    reranker = CrossEncoderReranker(preload=False)
+    reranker.model = OverlapModel()
+    return reranker
+
+
+def test_rerank_orders_by_cross_encoder_and_caches_scores():
+    reranker = make_reranker()
+    docs = [
+        {"chunk_id": "c0", "text": "従業員数"},
+        {"chunk_id": "c1", "text": "営業利益の推移"},
+        {"chunk_id": "c2", "text": "売上高と営業利益"},
+    ]
+    top = reranker.rerank("売上高と営業利益は", docs, top_k=2)
+    assert [d["chunk_id"] for d in top] == ["c2", "c1"]
+    assert top[0]["rerank_score"] > top[1]["rerank_score"]
+    assert reranker.model.pairs == 3
+
+    # 同一问题跳过推理；块文本变化时重新打分
+    reranker.rerank("売上高と営業利益は", docs, top_k=2)
+    assert reranker.model.pairs == 3
+    docs[0] = {"chunk_id": "c0", "text": "売上高"}
+    reranker.rerank("売上高と営業利益は", docs, top_k=2)
+    assert reranker.model.pairs == 4
+    assert reranker.get_stats()["score_cache_hits"] == 5
+
+
+def test_unavailable_model_keeps_vector_order():
+    reranker = CrossEncoderReranker(preload=False)
+    reranker.load_error = "no model"
+    docs = [{"chunk_id": "a", "text": "x"}, {"chunk_id": "b", "text": "y"}]
+    assert reranker.rerank("q", docs, top_k=1) == docs[:1]
+
+
+def test_retrieve_over_fetches_and_reports_stage_latency():
+    store = FakeVectorStore(["株主総会", "配当方針", "研究開発費", "配当性向と配当方針"])
+    rag = RAGEngine(store, "127.0.0.1", 1, "test", reranker=make_reranker(), rerank_candidates=4)
+    timings = {}
+    docs = rag.retrieve("配当性向と配当方針は", top_k=2, timings=timings)
+
+    assert store.requested == 4
+    assert [d["chunk_id"] for d in docs] == ["c3", "c1"]
+    assert set(timings) == {"retrieval", "rerank"}
+    stats = rag.get_stats()["stage_latency"]
+    assert stats["rerank"]["count"] == 1
+    assert stats["retrieval"]["p95_ms"] >= 0
@@ -0,0 +1,88 @@
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.rag_engine import RAGEngine
+from app.core.section_extractor import extract_fragment_sections, extract_html_sections, section_title
+from app.services.document_processor import create_chunks
+
+RISK_PARA = "当社グループの事業は為替変動、原材料価格の高騰、自然災害などのリスクにさらされております。" * 4
+RND_PARA = "当社は新素材の研究開発に注力しており、当連結会計年度の研究開発費は前年より増加しました。" * 4
+
+IXBRL_PAGE = f"""<?xml version="1.0" encoding="UTF-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:ix="http://www.xbrl.org/2013/inlineXBRL">
+<head><title>有価証券報告書</title></head>
+<body>
+  <div style="display:none"><ix:header><ix:hidden>隠し事実</ix:hidden></ix:header></div>
+  <h2>第2 事業の状況</h2>
+  <ix:nonNumeric name="jpcrp_cor:BusinessRisksTextBlock" contextRef="FilingDateInstant">
+    <h3>3 事業等のリスク</h3>
+    <h4>(1) 為替変動</h4>
+    <p>{RISK_PARA}</p>
+    <p>{RISK_PARA}</p>
+    <h4>(2) 自然災害</h4>
+    <p>{RISK_PARA}</p>
+  </ix:nonNumeric>
+  <ix:nonNumeric name="jpcrp_cor:ResearchAndDevelopmentActivitiesTextBlock" contextRef="FilingDateInstant">
+    <p>{RND_PARA}</p>
+  </ix:nonNumeric>
+</body>
+</html>
+"""
+
+
+def _write_page(tmp_path: Path) -> Path:
+    path = tmp_path / "0102010_honbun.htm"
+    path.write_text(IXBRL_PAGE, encoding="utf-8")
+    return path
+
+
+def test_section_title_maps_known_and_unknown_text_blocks():
+    assert section_title("jpcrp_cor:BusinessRisksTextBlock") == "事業等のリスク"
+    assert section_title("{http://example.com}BusinessRisksTextBlock") == "事業等のリスク"
+    assert section_title("jpcrp_cor:SomethingNewTextBlock") == "SomethingNew"
+
+
+def test_html_sections_follow_text_blocks_and_headings(tmp_path):
+    records = extract_html_sections(_write_page(tmp_path))
+
+    risks = [r for r in records if r["section"] == "事業等のリスク"]
+    assert [r["heading_path"] for r in risks] == [
+        ["3 事業等のリスク", "(1) 為替変動"],
+        ["3 事業等のリスク", "(2) 自然災害"],
+    ]
+    # 同一标题下的段落以空行分隔
+    assert risks[0]["text"].count("\n\n") == 1
+
+    rnd = [r for r in records if r["section"] == "研究開発活動"]
+    assert len(rnd) == 1 and rnd[0]["heading_path"] == []
+    assert all("隠し事実" not in r["text"] for r in records)
+
+
+def test_fragment_sections_use_given_section():
+    records = extract_fragment_sections(f"<h3>概要</h3><p>{RND_PARA}</p>", "研究開発活動")
+    assert records == [{"section": "研究開発活動", "heading_path": ["概要"], "text": RND_PARA}]
+    assert extract_fragment_sections("  ", "研究開発活動") == []
+
+
+def test_section_chunks_do_not_cross_sections(tmp_path):
+    chunks = create_chunks("S100TEST", "テスト社", extract_html_sections(_write_page(tmp_path)))
+
+    assert {c["section"] for c in chunks} == {"事業等のリスク", "研究開発活動"}
+    for chunk in chunks:
+        if chunk["section"] == "研究開発活動":
+            assert "リスク" not in chunk["text"]
+            assert chunk["heading"] == ""
+        else:
+            assert chunk["heading"].startswith("3 事業等のリスク > ")
+    assert len({c["chunk_id"] for c in chunks}) == len(chunks)
+
+
+def test_section_filter_matches_known_section_names():
+    assert RAGEngine._section_conditions("事業等のリスク") == {"section": "事業等のリスク"}
+    assert RAGEngine._section_conditions("リスク") == {"section": "事業等のリスク"}
+    assert RAGEngine._section_conditions("独自章節") == {"section": "独自章節"}
+    condition = RAGEngine._section_conditions("状況")
+    assert "従業員の状況" in condition["section"]["$in"]
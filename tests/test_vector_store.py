@@ -0,0 +1,96 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+pytest.importorskip("chromadb")
+pytest.importorskip("sentence_transformers")
+
+
+class RecordingModel:
+    """记录每次encode调用的确定性嵌入模型"""
+
+    def __init__(self, dim: int = 8):
+        self.dim = dim
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        emb = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            emb[i, len(t) % self.dim] = 1.0
+            emb[i, -1] = len(t)
+        return emb
+
+
+@pytest.fixture
+def store(make_vector_store):
+    """不连接远程ChromaDB、不下载模型的向量存储"""
+    vs = make_vector_store(batch_size=4)
+    vs.embedding_model = RecordingModel()
+    return vs
+
+
+def test_create_embeddings_batches_by_length_and_keeps_order(store):
+    texts = ["あ" * n for n in (9, 1, 5, 3, 7, 2, 8, 4, 6, 10)]
+    emb = store.create_embeddings(texts)
+
+    assert emb.shape == (10, 8)
+    assert [len(c) for c in store.embedding_model.calls] == [4, 4, 2]
+    # 同一批内文本长度单调递增
+    lengths = [len(t) for call in store.embedding_model.calls for t in call]
+    assert lengths == sorted(lengths)
+    # 结果按输入顺序还原
+    assert emb[:, -1].tolist() == [len(f"query: {t}") for t in texts]
+
+
+def test_add_documents_uses_bulk_encode(store):
+    chunks = [
+        {"chunk_id": f"doc1_{i}", "doc_id": "doc1", "text": f"テキスト{i}" * (i + 1)}
+        for i in range(10)
+    ]
+    assert store.add_documents(chunks)
+    assert len(store.embedding_model.calls) == 3
+    assert store.collection.count() == 10
+
+
+def test_search_caches_query_embeddings(store):
+    store.add_documents([{"chunk_id": "doc1_0", "doc_id": "doc1", "text": "売上高は増加しました"}])
+    model = store.embedding_model
+    model.calls.clear()
+
+    first = store.search("売上高は？")
+    second = store.search(" 売上高は? ")  # 全角/半角与空白规范化后相同
+
+    assert first and [r["id"] for r in first] == [r["id"] for r in second]
+    assert len(model.calls) == 1
+    assert store.get_collection_stats()["query_cache"]["hits"] == 1
+
+
+def test_swapping_model_invalidates_query_cache(store):
+    store.search("リスク要因")
+    assert len(store.query_cache) == 1
+
+    store.embedding_model = RecordingModel()
+    assert len(store.query_cache) == 0
+    store.search("リスク要因")
+    assert len(store.embedding_model.calls) == 1
+
+
+def test_disk_cache_skips_model_for_known_texts(store, tmp_path):
+    from app.services.embedding_cache import EmbeddingDiskCache
+
+    store.embedding_cache = EmbeddingDiskCache(str(tmp_path))
+    texts = [f"テキスト{i}" * (i + 1) for i in range(6)]
+    first = store.embed(texts)
+    model = store.embedding_model
+    model.calls.clear()
+
+    second = store.embed(texts + ["新しいテキスト"])
+
+    assert [len(c) for c in model.calls] == [1]
+    np.testing.assert_allclose(second[:6], first, atol=1e-1)
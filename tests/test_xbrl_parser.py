@@ -0,0 +1,96 @@
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.xbrl_parser import XBRLParser
+
+INSTANCE = """<?xml version="1.0" encoding="UTF-8"?>
+<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance"
+    xmlns:xbrldi="http://xbrl.org/2006/xbrldi"
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+    xmlns:iso4217="http://www.xbrl.org/2003/iso4217"
+    xmlns:jpdei_cor="http://disclosure.edinet-fsa.go.jp/taxonomy/jpdei/2013-08-31/jpdei_cor"
+    xmlns:jppfs_cor="http://disclosure.edinet-fsa.go.jp/taxonomy/jppfs/2023-12-01/jppfs_cor"
+    xmlns:jpcrp_cor="http://disclosure.edinet-fsa.go.jp/taxonomy/jpcrp/2023-12-01/jpcrp_cor">
+  <xbrli:context id="FilingDateInstant">
+    <xbrli:entity><xbrli:identifier scheme="http://disclosure.edinet-fsa.go.jp">E00001-000</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:instant>2024-06-25</xbrli:instant></xbrli:period>
+  </xbrli:context>
+  <xbrli:context id="CurrentYearDuration">
+    <xbrli:entity><xbrli:identifier scheme="http://disclosure.edinet-fsa.go.jp">E00001-000</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:startDate>2023-04-01</xbrli:startDate><xbrli:endDate>2024-03-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:unit id="JPY"><xbrli:measure>iso4217:JPY</xbrli:measure></xbrli:unit>
+  <xbrli:unit id="JPYPerShares">
+    <xbrli:divide>
+      <xbrli:unitNumerator><xbrli:measure>iso4217:JPY</xbrli:measure></xbrli:unitNumerator>
+      <xbrli:unitDenominator><xbrli:measure>xbrli:shares</xbrli:measure></xbrli:unitDenominator>
+    </xbrli:divide>
+  </xbrli:unit>
+  <jpdei_cor:FilerNameInJapaneseDEI contextRef="FilingDateInstant">テスト株式会社</jpdei_cor:FilerNameInJapaneseDEI>
+  <jppfs_cor:NetSales contextRef="CurrentYearDuration" unitRef="JPY" decimals="-6">1000000000</jppfs_cor:NetSales>
+  <jppfs_cor:NetSales contextRef="CurrentYearDuration_SegA" unitRef="JPY" decimals="-6">400000000</jppfs_cor:NetSales>
+  <jppfs_cor:BasicEarningsLossPerShare contextRef="CurrentYearDuration" unitRef="JPYPerShares" decimals="2">123.45</jppfs_cor:BasicEarningsLossPerShare>
+  <jppfs_cor:OrdinaryIncome contextRef="CurrentYearDuration" unitRef="JPY" xsi:nil="true"/>
+  <jpcrp_cor:BusinessRisksTextBlock contextRef="FilingDateInstant">&lt;p&gt;為替変動リスク&lt;/p&gt;</jpcrp_cor:BusinessRisksTextBlock>
+  <xbrli:context id="CurrentYearDuration_SegA">
+    <xbrli:entity>
+      <xbrli:identifier scheme="http://disclosure.edinet-fsa.go.jp">E00001-000</xbrli:identifier>
+      <xbrli:segment><xbrldi:explicitMember dimension="jpcrp_cor:OperatingSegmentsAxis">jpcrp_cor:SegmentAMember</xbrldi:explicitMember></xbrli:segment>
+    </xbrli:entity>
+    <xbrli:period><xbrli:startDate>2023-04-01</xbrli:startDate><xbrli:endDate>2024-03-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+</xbrli:xbrl>
+"""
+
+
+def _write_instance(tmp_path) -> Path:
+    path = tmp_path / "instance.xbrl"
+    path.write_text(INSTANCE, encoding="utf-8")
+    return path
+
+
+def test_iter_facts_resolves_contexts_and_units(tmp_path):
+    facts = list(XBRLParser().iter_facts(_write_instance(tmp_path)))
+    by_key = {(f["element"], f["context_ref"]): f for f in facts}
+
+    sales = by_key[("NetSales", "CurrentYearDuration")]
+    assert sales["value"] == "1000000000"
+    assert sales["unit"] == "JPY"
+    assert sales["decimals"] == "-6"
+    assert sales["period"] == {"type": "duration", "start": "2023-04-01", "end": "2024-03-31"}
+    assert sales["entity"] == "E00001-000"
+
+    # 上下文出现在事实之后，也能解析维度
+    segment = by_key[("NetSales", "CurrentYearDuration_SegA")]
+    assert segment["dimensions"] == {"OperatingSegmentsAxis": "SegmentAMember"}
+
+    assert by_key[("BasicEarningsLossPerShare", "CurrentYearDuration")]["unit"] == "JPY/shares"
+    nil_fact = by_key[("OrdinaryIncome", "CurrentYearDuration")]
+    assert nil_fact["is_nil"] and nil_fact["value"] is None
+    assert by_key[("BusinessRisksTextBlock", "FilingDateInstant")]["value"] == "<p>為替変動リスク</p>"
+
+
+def test_parse_document_summary(tmp_path):
+    result = XBRLParser().parse_document(str(_write_instance(tmp_path)))
+
+    assert result["company"] == "テスト株式会社"
+    assert result["data"]["NetSales"] == "1000000000"
+    assert result["period"]["end"] == "2024-03-31"
+    # 内存中只保留主要财务指标的事实
+    assert {f["element"] for f in result["facts"]} == {"NetSales"}
+
+
+def test_parse_document_streams_facts_into_fact_store(tmp_path):
+    from app.services.fact_store import FactStore
+
+    store = FactStore(str(tmp_path / "facts"))
+    parser = XBRLParser(fact_store=store)
+    result = parser.parse_document(str(_write_instance(tmp_path)), doc_id="S100TEST")
+
+    assert parser.extract_financial_data(result)["revenue"] == 1000000000.0
+    # 全部数值事实（含每股收益，不含nil与文本）写入存储
+    assert store.get_stats()["facts"] == 3
+    assert set(store.query(include_dimensional=True)["element"]) == {"NetSales", "BasicEarningsLossPerShare"}